@@ -0,0 +1,5 @@
+"""
+Benchmarks for the Product service
+
+These scripts are run by hand (or in CI) and are not part of the unit tests.
+"""
@@ -0,0 +1,85 @@
+"""
+Benchmark of response compression
+
+Requests a full-category listing and the NDJSON export through the app and
+reports, for each installed content coding and a few levels, the bytes on
+the wire, the compression ratio and the CPU time spent compressing.
+
+Usage:
+    python -m benchmarks.compression [rows] [repeat]
+
+DATABASE_URI defaults to an in-memory SQLite database. The benchmark
+deletes every Product, so only point it at a scratch database.
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault("DATABASE_URI", "sqlite://")
+
+# pylint: disable=wrong-import-position
+from service import app  # noqa: E402
+from service.models import Product, Category, db  # noqa: E402
+from service.common import compression  # noqa: E402
+from tests.factories import ProductFactory  # noqa: E402
+
+# The levels measured for each coding, the configured default first
+LEVELS = {"br": (4, 1, 6, 11), "zstd": (3, 1, 9, 19), "gzip": (6, 1, 9)}
+
+
+def cpu_seconds(function, repeat: int) -> float:
+    """Returns the smallest CPU time of a function over a number of runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        function()
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def measure(name: str, body: bytes, repeat: int):
+    """Prints the size and CPU cost of every coding and level for a body"""
+    print(f"\n{name}: {len(body)} bytes")
+    print(f"{'coding':<6} {'level':>5} {'bytes':>10} {'ratio':>7} {'cpu ms':>8} {'MB/s':>8}")
+    for coding in compression.available_codings():
+        for level in LEVELS[coding]:
+            size = len(compression.compress(coding, body, level))
+            seconds = cpu_seconds(lambda c=coding, n=level: compression.compress(c, body, n), repeat)
+            print(
+                f"{coding:<6} {level:>5} {size:>10} {len(body) / size:>6.1f}x "
+                f"{seconds * 1000:>8.2f} {len(body) / seconds / 1e6 if seconds else 0:>8.1f}"
+            )
+
+
+def on_the_wire(path: str, repeat: int):
+    """Prints the bytes and CPU time of a request with each coding the app negotiates"""
+    client = app.test_client()
+    print(f"\nGET {path}")
+    print(f"{'coding':<8} {'bytes':>10} {'cpu ms':>8}")
+    for coding in ["identity"] + compression.available_codings():
+        headers = {"Accept-Encoding": coding}
+        size = len(client.get(path, headers=headers).data)
+        seconds = cpu_seconds(lambda h=headers: client.get(path, headers=h).data, repeat)
+        print(f"{coding:<8} {size:>10} {seconds * 1000:>8.2f}")
+
+
+def main(rows: int = 1000, repeat: int = 10):
+    """Seeds the database and prints the cost of compressing the responses"""
+    app.logger.setLevel("ERROR")
+    db.session.query(Product).delete()
+    db.session.commit()
+    Product.bulk_create(
+        [ProductFactory(category=Category.TOYS).to_dict() for _ in range(rows)]
+    )
+    listing = f"/api/products?category=TOYS&limit={min(rows, app.config['PAGE_SIZE_MAX'])}"
+    client = app.test_client()
+    measure("listing", client.get(listing).data, repeat)
+    measure("export", client.get("/api/products/export").data, repeat)
+    on_the_wire(listing, repeat)
+    on_the_wire("/api/products/export", repeat)
+    db.session.query(Product).delete()
+    db.session.commit()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,217 @@
+"""
+HTTP load generator for the Product service
+
+Sends requests to a URL from many threads for a fixed time, each thread
+keeping its connection alive, and reports requests per second plus the
+p50/p95/p99 latency.
+
+Usage:
+    python -m benchmarks.load URL [--concurrency 16] [--duration 10]
+
+    # compare gunicorn worker classes against the same database
+    python -m benchmarks.load --compare sync gthread [--path /api/products?limit=50]
+
+--compare runs `flask db-upgrade` on DATABASE_URI and then starts `gunicorn
+--config gunicorn.conf.py service:app` once for each worker class (with
+GUNICORN_WORKERS=1 unless set) and runs the same load against each of them. Add --db-latency MS to route the PostgreSQL
+connections of the servers through a local proxy that delays every reply,
+which shows how each worker class copes with a slow database.
+"""
+import os
+import sys
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+from sqlalchemy.engine import make_url
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Returns the value at a fraction (0..1) of the sorted values"""
+    if not values:
+        return 0.0
+    index = min(int(round(fraction * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def _worker(url, next_request, deadline, stats, lock):
+    parts = urlsplit(url)
+    rng = random.Random()
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    local_latencies, local_errors = [], 0
+    while time.perf_counter() < deadline:
+        method, path, body = next_request(rng)
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=JSON_HEADERS if body is not None else {})
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                local_errors += 1
+        except (OSError, http.client.HTTPException):
+            local_errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            continue
+        local_latencies.append(time.perf_counter() - start)
+    connection.close()
+    with lock:
+        stats["latencies"].extend(local_latencies)
+        stats["errors"] += local_errors
+
+
+def run(url: str, concurrency: int = 16, duration: float = 10.0, next_request=None) -> dict:
+    """Runs the load against the url and returns the statistics
+
+    next_request(rng) returns the (method, path, body) of each request a
+    thread sends, by default a GET of the url itself.
+    """
+    if next_request is None:
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+
+        def next_request(rng):  # pylint: disable=unused-argument,function-redefined
+            return "GET", path, None
+
+    stats, lock = {"latencies": [], "errors": 0}, threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=_worker, args=(url, next_request, deadline, stats, lock))
+        for _ in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies = sorted(stats["latencies"])
+    return {
+        "requests": len(latencies),
+        "errors": stats["errors"],
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p95": percentile(latencies, 0.95) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def report(name: str, stats: dict):
+    """Prints one line of statistics"""
+    print(
+        f"{name:<10} {stats['requests']:>8} {stats['errors']:>6} {stats['rps']:>9.1f} "
+        f"{stats['p50']:>8.1f} {stats['p95']:>8.1f} {stats['p99']:>8.1f}"
+    )
+
+
+class LatencyProxy:  # pylint: disable=too-few-public-methods
+    """A TCP proxy in front of PostgreSQL that delays every reply"""
+
+    def __init__(self, database_uri: str, latency: float):
+        url = make_url(database_uri)
+        socket_dir = url.query.get("host")
+        if socket_dir:
+            self.target = (socket.AF_UNIX, f"{socket_dir}/.s.PGSQL.{url.port or 5432}")
+        else:
+            self.target = (socket.AF_INET, (url.host or "localhost", url.port or 5432))
+        self.latency = latency
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        self.database_uri = url.set(
+            host="127.0.0.1", port=self.port, query={}
+        ).render_as_string(hide_password=False)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            client, _ = self.listener.accept()
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            family, address = self.target
+            server = socket.socket(family, socket.SOCK_STREAM)
+            server.connect(address)
+            threading.Thread(target=self._pipe, args=(client, server, 0), daemon=True).start()
+            threading.Thread(target=self._pipe, args=(server, client, self.latency), daemon=True).start()
+
+    @staticmethod
+    def _pipe(source, destination, latency):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                if latency:
+                    time.sleep(latency)
+                destination.sendall(data)
+        except OSError:
+            pass
+        finally:
+            source.close()
+            destination.close()
+
+
+def start_server(worker_class: str, port: int, database_uri: str = None) -> subprocess.Popen:
+    """Migrates the database, starts gunicorn with a worker class and waits until it is healthy"""
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=worker_class, PORT=str(port))
+    if database_uri:
+        env["DATABASE_URI"] = database_uri
+    # the service no longer creates its tables when it starts
+    subprocess.run(
+        [sys.executable, "-m", "flask", "--app", "service:app", "db-upgrade"],
+        env=env, check=True, stdout=subprocess.DEVNULL,
+    )
+    env.setdefault("GUNICORN_WORKERS", "1")
+    env.setdefault("GUNICORN_LOG_LEVEL", "warning")
+    server = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "service:app"],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError(f"gunicorn ({worker_class}) did not start")
+
+
+def main(argv=None):
+    """Parses the command line and runs the load"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("url", nargs="?", help="URL to load (not used with --compare)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--compare", nargs="+", metavar="WORKER_CLASS")
+    parser.add_argument("--path", default="/api/products?limit=50")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--db-latency", type=float, default=0, metavar="MS")
+    args = parser.parse_args(argv)
+
+    print(f"{'':<10} {'requests':>8} {'errors':>6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    if not args.compare:
+        report("load", run(args.url, args.concurrency, args.duration))
+        return
+    database_uri = None
+    if args.db_latency:
+        proxy = LatencyProxy(os.environ["DATABASE_URI"], args.db_latency / 1000)
+        database_uri = proxy.database_uri
+    for worker_class in args.compare:
+        server = start_server(worker_class, args.port, database_uri)
+        try:
+            url = f"http://127.0.0.1:{args.port}{args.path}"
+            report(worker_class, run(url, args.concurrency, args.duration))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
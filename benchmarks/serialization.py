@@ -0,0 +1,65 @@
+"""
+Micro-benchmark of the Product list serialization paths
+
+Compares the per-row cost of the original path (load ORM Products,
+Product.serialize() and then marshal(product_model) + json) with the
+compiled path used by the routes (select plain rows, serialize_row(),
+the compiled ModelSerializer and orjson).
+
+Usage:
+    python -m benchmarks.serialization [rows] [repeat]
+
+DATABASE_URI defaults to an in-memory SQLite database. The benchmark
+deletes every Product, so only point it at a scratch database.
+"""
+import os
+import sys
+import json
+import timeit
+
+os.environ.setdefault("DATABASE_URI", "sqlite://")
+
+# pylint: disable=wrong-import-position
+from flask_restx import marshal  # noqa: E402
+from service import app  # noqa: E402
+from service.models import Product, db  # noqa: E402
+from service.routes import product_model, serialize_product  # noqa: E402
+from service.common.serialization import dumps  # noqa: E402
+from tests.factories import ProductFactory  # noqa: E402
+
+
+def before(limit: int) -> bytes:
+    """The original path: ORM objects, serialize() and marshal()"""
+    products = Product.query.order_by(Product.id).limit(limit).all()
+    results = marshal([product.serialize() for product in products], product_model)
+    return json.dumps(results).encode("utf-8")
+
+
+def after(limit: int) -> bytes:
+    """The compiled path: plain rows and a single pass serializer"""
+    rows = Product.find_page(limit=limit, rows=True)
+    return dumps([serialize_product(Product.serialize_row(row)) for row in rows])
+
+
+def main(rows: int = 1000, repeat: int = 20):
+    """Seeds the database and prints the per-row cost of both paths"""
+    app.logger.setLevel("ERROR")
+    db.session.query(Product).delete()
+    db.session.commit()
+    Product.bulk_create([ProductFactory().to_dict() for _ in range(rows)])
+    assert json.loads(before(rows)) == json.loads(after(rows))
+
+    print(f"{'path':<8} {'total ms':>10} {'us/row':>8}")
+    results = {}
+    for name, function in (("before", before), ("after", after)):
+        db.session.expire_all()
+        seconds = min(timeit.repeat(lambda f=function: f(rows), number=1, repeat=repeat))
+        results[name] = seconds
+        print(f"{name:<8} {seconds * 1000:>10.2f} {seconds / rows * 1e6:>8.2f}")
+    print(f"speedup  {results['before'] / results['after']:>10.1f}x")
+    db.session.query(Product).delete()
+    db.session.commit()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,139 @@
+"""
+Startup time of the Product service
+
+Measures, each in fresh processes:
+
+    import          python -c "import service", with and without DB_CREATE_SCHEMA
+    first request   GET /health right after the import, then the first and
+                    the cached GET /api/swagger.json
+    boot            gunicorn started until /health answers, with and without
+                    --preload
+    respawn         a worker killed until /health answers again (Linux only)
+
+Usage:
+    python -m benchmarks.startup [--runs 5] [--workers 2] [--port 8092]
+
+It uses the database of DATABASE_URI (default: an in-memory SQLite one), so
+point it at PostgreSQL to include the cost of the schema DDL.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import statistics
+import subprocess
+import http.client
+
+os.environ.setdefault("DATABASE_URI", "sqlite://")
+
+# Runs in a fresh interpreter and prints its timings as JSON
+PROBE = """
+import json, time
+start = time.perf_counter()
+import service
+imported = time.perf_counter()
+client = service.app.test_client()
+client.get("/health")
+first = time.perf_counter()
+client.get("/api/swagger.json")
+spec = time.perf_counter()
+client.get("/api/swagger.json")
+cached = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "first request": first - imported,
+    "first swagger.json": spec - first,
+    "cached swagger.json": cached - spec,
+}))
+"""
+
+
+def probe(runs: int, create_schema: bool) -> dict:
+    """Returns the median timings in ms of the import and first requests"""
+    env = dict(os.environ, DB_CREATE_SCHEMA=str(create_schema).lower(), METRICS_ENABLED="false")
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE], env=env, check=True, capture_output=True, text=True
+        ).stdout
+        samples.append(json.loads(output.splitlines()[-1]))
+    return {key: statistics.median(sample[key] for sample in samples) * 1000 for key in samples[0]}
+
+
+def wait_healthy(port: int, timeout: float = 30) -> float:
+    """Polls /health until it answers and returns when it did"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return time.perf_counter()
+        except OSError:
+            time.sleep(0.005)
+    raise RuntimeError("gunicorn did not become healthy")
+
+
+def workers_of(server: subprocess.Popen) -> list:
+    """Returns the pids of the workers of a gunicorn master"""
+    with open(f"/proc/{server.pid}/task/{server.pid}/children", encoding="utf-8") as children:
+        return [int(pid) for pid in children.read().split()]
+
+
+def boot(runs: int, workers: int, port: int, preload: bool) -> dict:
+    """Returns the median ms gunicorn takes to boot and to respawn a worker"""
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        GUNICORN_WORKERS=str(workers),
+        GUNICORN_PRELOAD=str(preload).lower(),
+        GUNICORN_LOG_LEVEL="warning",
+    )
+    boots, respawns = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        server = subprocess.Popen(  # pylint: disable=consider-using-with
+            [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "service:app"], env=env
+        )
+        try:
+            boots.append(wait_healthy(port) - start)
+            if workers == 1 and os.path.exists(f"/proc/{server.pid}"):
+                start = time.perf_counter()
+                os.kill(workers_of(server)[0], signal.SIGKILL)
+                time.sleep(0.01)
+                respawns.append(wait_healthy(port) - start)
+        finally:
+            server.terminate()
+            server.wait()
+    result = {"boot": statistics.median(boots) * 1000}
+    if respawns:
+        result["respawn"] = statistics.median(respawns) * 1000
+    return result
+
+
+def main(argv=None):
+    """Parses the command line and reports every measure"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8092)
+    args = parser.parse_args(argv)
+
+    for create_schema in (False, True):
+        timings = probe(args.runs, create_schema)
+        print(f"DB_CREATE_SCHEMA={str(create_schema).lower()}")
+        for name, milliseconds in timings.items():
+            print(f"  {name:<20} {milliseconds:>8.1f} ms")
+    # the respawn is only measured with a single worker, which must be gone
+    # for /health to stop answering
+    for workers in sorted({1, args.workers}):
+        for preload in (False, True):
+            print(f"gunicorn {workers} worker(s){' --preload' if preload else ''}")
+            for name, milliseconds in boot(args.runs, workers, args.port, preload).items():
+                print(f"  {name:<20} {milliseconds:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Benchmark suite of the Product service
+
+Runs scripted workloads against the service and reports the requests per
+second and the p50/p95/p99 latency of each one:
+
+    read-heavy        90% reads of a product by id, 10% sorted listing pages
+    filtered-listing  listings filtered by category, availability and price
+    write-heavy       70% creates, 30% partial updates of existing products
+    bulk-ingest       bulk creates of 1000 products per request
+
+Usage:
+    # seed 100k products, start gunicorn on DATABASE_URI and save the results
+    python -m benchmarks.suite --seed 100000 --start --output baseline.json
+
+    # later, fail (exit status 1) if a workload got slower than the baseline
+    python -m benchmarks.suite --start --baseline baseline.json
+
+--url points it at a service that is already running instead of --start.
+Without DATABASE_URI it uses the SQLite file products-bench.db in the system
+temp dir.
+Writes add rows, so run it on a scratch database and re-seed it (--seed
+truncates first) before comparing against a baseline.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import http.client
+from urllib.parse import urlsplit
+
+# the seeder and the gunicorn it starts must share the database, so not an in-memory one
+os.environ.setdefault(
+    "DATABASE_URI", "sqlite:///" + os.path.join(tempfile.gettempdir(), "products-bench.db")
+)
+
+# pylint: disable=wrong-import-position
+from benchmarks import load, seed  # noqa: E402
+
+API = "/api/products"
+CATEGORIES = ("ELECTRONICS", "PERSONAL_CARE", "TOYS", "SPORTS", "FOOD", "HEALTH")
+
+
+def read_heavy(low: int, high: int):
+    """90% reads of a product by id, 10% sorted listing pages"""
+
+    def next_request(rng):
+        if rng.random() < 0.9:
+            return "GET", f"{API}/{rng.randint(low, high)}", None
+        return "GET", f"{API}?sort={rng.choice(('id', 'name', 'price'))}&limit=50", None
+
+    return next_request
+
+
+def filtered_listing(low: int, high: int):  # pylint: disable=unused-argument
+    """Listings filtered by category, availability and price"""
+
+    def next_request(rng):
+        category = rng.choice(CATEGORIES)
+        choice = rng.random()
+        if choice < 0.5:
+            return "GET", f"{API}?category={category}&available=true&sort=price&limit=20", None
+        if choice < 0.8:
+            low_price = rng.randint(10, 900)
+            return "GET", f"{API}?min_price={low_price}&max_price={low_price + 100}&limit=50", None
+        return "GET", f"{API}?category={category}&limit=100", None
+
+    return next_request
+
+
+def write_heavy(low: int, high: int):
+    """70% creates, 30% partial updates of existing products"""
+    bodies = [json.dumps(seed.fake_product()) for _ in range(1000)]
+
+    def next_request(rng):
+        if rng.random() < 0.7:
+            return "POST", API, rng.choice(bodies)
+        price = json.dumps({"price": rng.randint(10, 999) + 0.99})
+        return "PATCH", f"{API}/{rng.randint(low, high)}", price
+
+    return next_request
+
+
+def bulk_ingest(low: int, high: int):  # pylint: disable=unused-argument
+    """Bulk creates of 1000 products per request"""
+    batches = [json.dumps([seed.fake_product() for _ in range(1000)]) for _ in range(10)]
+
+    def next_request(rng):
+        return "POST", f"{API}/bulk", rng.choice(batches)
+
+    return next_request
+
+
+WORKLOADS = {
+    "read-heavy": read_heavy,
+    "filtered-listing": filtered_listing,
+    "write-heavy": write_heavy,
+    "bulk-ingest": bulk_ingest,
+}
+
+
+def id_range(url: str) -> tuple:
+    """Returns the lowest and highest ids of the Products of the service"""
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    ids = {}
+    for order in ("asc", "desc"):
+        connection.request("GET", f"{API}?limit=1&fields=id&order={order}")
+        products = json.loads(connection.getresponse().read())
+        if not products:
+            raise RuntimeError("There are no Products to benchmark, seed some with --seed")
+        ids[order] = int(products[0]["id"])
+    connection.close()
+    return ids["asc"], ids["desc"]
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Returns the regressions of the results against a baseline
+
+    A workload regresses when its req/s dropped, or its p95 or p99 latency
+    grew, by more than the tolerance (a fraction), or when its error rate
+    grew by more than a percent.
+    """
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if stats["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {stats['rps']:.1f} req/s, baseline {base['rps']:.1f}")
+        for key in ("p95", "p99"):
+            if stats[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {stats[key]:.1f} ms, baseline {base[key]:.1f}")
+        rate, base_rate = (
+            data["errors"] / max(data["requests"], 1) for data in (stats, base)
+        )
+        if rate > base_rate + 0.01:
+            regressions.append(f"{name}: {rate:.1%} errors, baseline {base_rate:.1%}")
+    return regressions
+
+
+def run_workloads(url: str, names: list, concurrency: int, duration: float) -> dict:
+    """Runs each workload in turn and returns their statistics"""
+    low, high = id_range(url)
+    results = {}
+    print(f"{'':<17} {'requests':>8} {'errors':>6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name in names:
+        results[name] = load.run(url, concurrency, duration, WORKLOADS[name](low, high))
+        load.report(f"{name:<17}", results[name])
+    return results
+
+
+def main(argv=None):
+    """Parses the command line, runs the workloads and checks the baseline"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8089")
+    parser.add_argument("--start", action="store_true", help="start gunicorn on DATABASE_URI")
+    parser.add_argument("--worker-class", default="gthread")
+    parser.add_argument("--seed", type=int, metavar="ROWS", help="re-seed the database first")
+    parser.add_argument("--workloads", nargs="+", choices=list(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    if args.seed:
+        seed.main([str(args.seed), "--truncate"])
+    server = load.start_server(args.worker_class, urlsplit(args.url).port) if args.start else None
+    try:
+        results = run_workloads(args.url, args.workloads, args.concurrency, args.duration)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Gunicorn configuration for the Product service
+
+By default every worker is a threaded (gthread) worker, so a request that is
+waiting on PostgreSQL only blocks its own thread instead of the whole worker.
+Everything can be overridden with environment variables:
+
+    GUNICORN_WORKER_CLASS  - gthread (default), sync or gevent
+    GUNICORN_WORKERS       - worker processes (default: 2 x CPUs + 1, at most 4,
+                             counting the CPUs of the container's CPU quota)
+    GUNICORN_THREADS       - threads per gthread worker (default: 4)
+    GUNICORN_CONNECTIONS   - concurrent connections per gevent worker (default: 100)
+    GUNICORN_PRELOAD       - import the app once in the master before forking
+                             the workers (default: false)
+    PORT                   - port to listen on (default: 8000)
+
+The gevent worker needs the gevent and psycogreen packages; psycopg2 is made
+cooperative in post_fork() so queries yield to other greenlets.
+
+With GUNICORN_PRELOAD the workers share the imported code copy-on-write and
+boot almost instantly, but a code change needs a full restart instead of a
+HUP. post_fork() drops the database connections inherited from the master so
+no two processes share a socket. Preloading is not meant for gevent workers,
+which must patch the standard library before the app is imported.
+
+Prometheus metrics of every worker are shared through files in
+PROMETHEUS_MULTIPROC_DIR (default: a directory in the system temp dir), which
+is emptied when gunicorn starts.
+"""
+# pylint: disable=invalid-name
+import os
+import math
+import shutil
+import tempfile
+import multiprocessing
+
+
+def _read_words(path: str):
+    try:
+        with open(path, encoding="utf-8") as file:
+            return file.read().split()
+    except OSError:
+        return None
+
+
+def available_cpus() -> int:
+    """Returns the CPUs this process may use, capped by the CPU quota of its cgroup
+
+    cpu_count() reports every CPU of the node, not the limit of the pod.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = multiprocessing.cpu_count()
+    # cgroup v2 holds "<quota> <period>" or "max <period>", v1 two files with -1 for no quota
+    quota = _read_words("/sys/fs/cgroup/cpu.max") or (
+        (_read_words("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") or ["-1"])
+        + (_read_words("/sys/fs/cgroup/cpu/cpu.cfs_period_us") or ["100000"])
+    )
+    if quota[0] not in ("max", "-1"):
+        cpus = min(cpus, max(1, math.ceil(int(quota[0]) / int(quota[1]))))
+    return cpus
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.getenv("GUNICORN_WORKERS", str(min(2 * available_cpus() + 1, 4))))
+# gunicorn silently turns sync workers into gthread ones when threads > 1
+threads = int(os.getenv("GUNICORN_THREADS", "4")) if worker_class == "gthread" else 1
+worker_connections = int(os.getenv("GUNICORN_CONNECTIONS", "100"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+keepalive = 5
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+accesslog = os.getenv("GUNICORN_ACCESS_LOG")
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() in ("true", "yes", "1")
+
+# Every thread (or greenlet) of a worker may hold a database connection,
+# so size the pool to match unless it was configured explicitly
+if worker_class == "gthread":
+    os.environ.setdefault("DB_POOL_SIZE", str(threads))
+elif worker_class == "gevent":
+    os.environ.setdefault("DB_POOL_SIZE", "10")
+    os.environ.setdefault("DB_MAX_OVERFLOW", "20")
+
+# Must be set before the workers import prometheus_client
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "products-metrics")
+)
+# A preloaded app imports prometheus_client before on_starting() runs
+if preload_app:
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    """Removes the metrics left behind by a previous run"""
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Drops the live gauges of a worker that exited"""
+    try:
+        from prometheus_client import multiprocess  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Drops the connections of a preloaded app and makes psycopg2 cooperative for gevent"""
+    if preload_app:
+        from service import app  # pylint: disable=import-outside-toplevel
+        from service.models import db  # pylint: disable=import-outside-toplevel
+        from service.common import replicas  # pylint: disable=import-outside-toplevel
+
+        with app.app_context():
+            # close=False leaves the master's connections open for the master
+            db.engine.dispose(close=False)
+        replicas.dispose(close=False)
+    if worker_class == "gevent":
+        from psycogreen.gevent import patch_psycopg  # pylint: disable=import-outside-toplevel,import-error
+
+        patch_psycopg()
+        server.log.info("psycopg2 patched for gevent in worker %s", worker.pid)
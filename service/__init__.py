@@ -8,13 +8,15 @@ import sys
 from flask import Flask
 from flask_restx import Api
 from service import config
-from service.common import log_handlers
+from service.common import log_handlers, cache, compression, metrics, profiling, replicas
 
 # Create Flask application
 app = Flask(__name__)
 app.config.from_object(config)
 app.config["ERROR_404_HELP"] = False
 
+# The Swagger spec is generated on the first request of /swagger.json and
+# cached, so it costs nothing at startup. API_DOCS="" turns the UI off.
 api = Api(
     app,
     version="1.0.0",
@@ -22,7 +24,7 @@ api = Api(
     description="This is a sample Product server.",
     default="products",
     default_label="Product operations",
-    doc="/apidocs",  # default also could use doc='/apidocs/'
+    doc=config.API_DOCS or False,
     prefix="/api",
 )
 
@@ -33,18 +35,43 @@ from service import routes, models  # noqa: E402, E261
 # pylint: disable=wrong-import-position
 from service.common import error_handlers, cli_commands  # noqa: F401, E402
 
-# Set up logging for production
-log_handlers.init_logging(app, "gunicorn.error")
 
-app.logger.info(70 * "*")
-app.logger.info("  S E R V I C E   R U N N I N G  ".center(70, "*"))
-app.logger.info(70 * "*")
+def create_app() -> Flask:
+    """Initializes the app and returns it, e.g. gunicorn "service:create_app()"
 
-try:
-    models.init_db(app)  # make our SQLAlchemy tables
-except Exception as error:  # pylint: disable=broad-except
-    app.logger.critical("%s: Cannot continue", error)
-    # gunicorn requires exit code 4 to stop spawning workers when they die
-    sys.exit(4)
+    The routes are registered on the module's app when the package is
+    imported, so this sets up the logging, caching, compression, profiling,
+    metrics, replica routing and database of that app once and returns it on later calls.
+    Nothing here connects to the database unless DB_CREATE_SCHEMA is set;
+    the tables are created by `flask db-upgrade` instead.
+    """
+    if "service" in app.extensions:
+        return app
 
-app.logger.info("Service initialized!")
+    # Set up logging for production
+    log_handlers.init_logging(app, "gunicorn.error")
+
+    app.logger.info(70 * "*")
+    app.logger.info("  S E R V I C E   R U N N I N G  ".center(70, "*"))
+    app.logger.info(70 * "*")
+
+    cache.init_cache(app)
+    compression.init_compression(app)
+    profiling.init_profiling(app)
+    metrics.init_metrics(app, models.db)
+    replicas.init_replicas(app)
+
+    try:
+        models.init_db(app, create_schema=app.config["DB_CREATE_SCHEMA"])
+    except Exception as error:  # pylint: disable=broad-except
+        app.logger.critical("%s: Cannot continue", error)
+        # gunicorn requires exit code 4 to stop spawning workers when they die
+        sys.exit(4)
+
+    app.extensions["service"] = True
+    app.logger.info("Service initialized!")
+    return app
+
+
+# service:app stays usable by gunicorn, the flask CLI and the tests
+create_app()
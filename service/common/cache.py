@@ -0,0 +1,188 @@
+"""
+Cache
+
+This module contains the read-through cache that sits in front of
+Product lookups. The backend is chosen by configuration:
+
+    lru   - an in-process LRU with a time to live (the default)
+    redis - a shared Redis server so every worker sees the same entries
+    none  - caching disabled
+"""
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+class Cache:
+    """Base class that keeps the hit and miss counters of a cache backend"""
+
+    backend = "none"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the cached value for the key or None on a miss"""
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def _get(self, key):  # pylint: disable=unused-argument
+        return None
+
+    def get_many(self, keys) -> dict:
+        """Returns the cached values of the keys that are in the cache"""
+        values = {key: value for key, value in zip(keys, self._get_many(keys)) if value is not None}
+        self.hits += len(values)
+        self.misses += len(keys) - len(values)
+        return values
+
+    def _get_many(self, keys) -> list:
+        return [self._get(key) for key in keys]
+
+    def set(self, key, value):
+        """Stores a value under the key"""
+
+    def set_many(self, mapping: dict):
+        """Stores every value of the mapping under its key"""
+        for key, value in mapping.items():
+            self.set(key, value)
+
+    def delete(self, *keys):
+        """Removes the keys from the cache"""
+
+    def clear(self):
+        """Removes everything from the cache"""
+
+    def size(self) -> int:
+        """Returns the number of entries in the cache"""
+        return 0
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters of the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "size": self.size(),
+        }
+
+
+class LRUCache(Cache):
+    """An in-process least recently used cache whose entries expire after ttl seconds"""
+
+    backend = "lru"
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60):
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisCache(Cache):
+    """A cache shared by every worker, kept in Redis as JSON"""
+
+    backend = "redis"
+
+    def __init__(self, client, ttl: float = 60, prefix: str = "products:"):
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, ttl: float = 60):
+        """Connects to the Redis server at the url"""
+        import redis  # pylint: disable=import-outside-toplevel,import-error
+
+        return cls(redis.Redis.from_url(url), ttl)
+
+    def _get(self, key):
+        value = self.client.get(self.prefix + str(key))
+        return None if value is None else json.loads(value)
+
+    def _get_many(self, keys) -> list:
+        if not keys:
+            return []
+        values = self.client.mget([self.prefix + str(key) for key in keys])
+        return [None if value is None else json.loads(value) for value in values]
+
+    def set(self, key, value):
+        self.client.set(self.prefix + str(key), json.dumps(value), ex=int(self.ttl))
+
+    def set_many(self, mapping: dict):
+        pipeline = self.client.pipeline()
+        for key, value in mapping.items():
+            pipeline.set(self.prefix + str(key), json.dumps(value), ex=int(self.ttl))
+        pipeline.execute()
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + str(key) for key in keys])
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def size(self) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+
+
+# The cache used for Products, replaced by init_cache() from the app config
+product_cache = LRUCache()
+
+
+def init_cache(app):
+    """Creates the Product cache from the app configuration"""
+    global product_cache  # pylint: disable=global-statement
+    backend = app.config.get("CACHE_BACKEND", "lru").lower()
+    ttl = app.config.get("CACHE_TTL", 60)
+    if backend == "redis":
+        product_cache = RedisCache.from_url(app.config["CACHE_REDIS_URL"], ttl)
+    elif backend == "none":
+        product_cache = Cache()
+    else:
+        product_cache = LRUCache(app.config.get("CACHE_MAX_SIZE", 10000), ttl)
+    app.logger.info("Product cache backend: %s", product_cache.backend)
+    return product_cache
@@ -1,8 +1,19 @@
 """
 Flask CLI Command Extensions
 """
+import click
 from service import app
 from service.models import db
+from service.common import migrations
+
+
+def migration_options() -> dict:
+    """Returns the Migrator settings of the app configuration"""
+    return {
+        "lock_timeout": app.config["MIGRATION_LOCK_TIMEOUT"],
+        "batch_size": app.config["MIGRATION_BATCH_SIZE"],
+        "batch_pause": app.config["MIGRATION_BATCH_PAUSE"],
+    }
 
 
 ######################################################################
@@ -17,5 +28,47 @@ def db_create():
     production. ;-)
     """
     db.drop_all()
+    migrations.versions.drop(db.engine, checkfirst=True)
     db.create_all()
     db.session.commit()
+    # create_all() made the latest schema, so there is nothing to migrate
+    migrations.stamp(db.engine)
+
+
+######################################################################
+# Commands to apply and revert the schema migrations
+# Usage:
+#   flask db-upgrade [--to VERSION]
+#   flask db-downgrade --to VERSION
+#   flask db-status
+######################################################################
+@app.cli.command("db-upgrade")
+@click.option("--to", "target", help="Last version to apply (default: all of them)")
+def db_upgrade(target):
+    """
+    Applies the pending schema migrations without taking the service down
+    """
+    applied = migrations.upgrade(db.engine, target, **migration_options())
+    for migration in applied:
+        click.echo(f"Applied {migration.version} {migration.description}")
+    if not applied:
+        click.echo("The database is up to date")
+
+
+@app.cli.command("db-downgrade")
+@click.option("--to", "target", required=True, help="Version to go back to (0000 reverts everything)")
+def db_downgrade(target):
+    """
+    Reverts the schema migrations newer than a version
+    """
+    for migration in migrations.downgrade(db.engine, target, **migration_options()):
+        click.echo(f"Reverted {migration.version} {migration.description}")
+
+
+@app.cli.command("db-status")
+def db_status():
+    """
+    Lists the schema migrations and whether they have been applied
+    """
+    for migration, applied in migrations.status(db.engine):
+        click.echo(f"{migration.version} {'applied' if applied else 'pending':<8} {migration.description}")
@@ -0,0 +1,211 @@
+"""
+Compression
+
+This module compresses responses with the best content coding the client
+accepts in Accept-Encoding. The codings are tried in the order of the
+COMPRESS_ALGORITHMS setting:
+
+    br   - brotli, needs the brotli package
+    zstd - Zstandard, needs the zstandard package
+    gzip - always available
+
+Responses smaller than COMPRESS_MIN_SIZE are sent as they are since
+compressing them costs more CPU than it saves on the wire. Streamed
+responses (the export) are compressed chunk by chunk as they are generated
+and flushed every COMPRESS_STREAM_FLUSH_SIZE bytes of input, so the client
+keeps receiving data while the rows are read.
+
+A compressed response is a representation of its own, so its strong ETag
+gets the coding as a suffix ("<etag>-gzip"); strip_coding() takes it off
+again to compare a conditional request with the current ETag.
+"""
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+class GzipCompressor:
+    """Incremental gzip compression"""
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compresses a chunk, returning whatever output is ready"""
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """Returns all the output of the chunks compressed so far"""
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        """Returns the end of the compressed stream"""
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor(GzipCompressor):
+    """Incremental brotli compression"""
+
+    def __init__(self, level: int):  # pylint: disable=super-init-not-called
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor(GzipCompressor):
+    """Incremental Zstandard compression"""
+
+    def __init__(self, level: int):  # pylint: disable=super-init-not-called
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# The compressor and the setting holding the level of each content coding
+CODINGS = {
+    "br": (BrotliCompressor, "COMPRESS_BROTLI_LEVEL"),
+    "zstd": (ZstdCompressor, "COMPRESS_ZSTD_LEVEL"),
+    "gzip": (GzipCompressor, "COMPRESS_GZIP_LEVEL"),
+}
+
+
+def available_codings() -> list:
+    """Returns the content codings whose package is installed"""
+    installed = {"br": brotli is not None, "zstd": zstandard is not None, "gzip": True}
+    return [coding for coding in CODINGS if installed[coding]]
+
+
+def compress(coding: str, data: bytes, level: int) -> bytes:
+    """Compresses data with a content coding in one go"""
+    compressor = CODINGS[coding][0](level)
+    return compressor.compress(data) + compressor.finish()
+
+
+def strip_coding(etag: str) -> str:
+    """Returns the ETag of the uncompressed representation of an ETag"""
+    base, _, coding = etag.rpartition("-")
+    return base if base and coding in CODINGS else etag
+
+
+def negotiate(accept_encodings, codings) -> str:
+    """Returns the coding the client prefers among ours, or None for identity
+
+    Codings with the same quality are picked in our order of preference.
+    """
+    best, best_quality = None, 0
+    for coding in codings:
+        quality = accept_encodings.quality(coding)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress_stream(chunks, compressor, flush_size: int):
+    """Compresses the chunks of a streamed response as they are generated"""
+    pending = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            output = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= flush_size:
+                output += compressor.flush()
+                pending = 0
+            if output:
+                yield output
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def tag_coding(response, coding: str):
+    """Adds the coding to the ETag of a compressed response
+
+    A 304 only gets it when the client holds the compressed copy.
+    """
+    etag, weak = response.get_etag()
+    if not etag:
+        return
+    coded = f"{etag}-{coding}"
+    if response.status_code == 304:
+        if not request.if_none_match.contains_weak(coded):
+            return
+    elif response.headers.get("Content-Encoding") != coding:
+        return
+    response.set_etag(coded, weak=weak)
+
+
+def has_body(response) -> bool:
+    """Tells if a response has a body that can still be compressed"""
+    return not (
+        request.method == "HEAD"
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+    )
+
+
+def init_compression(app):
+    """Compresses the responses of the app as configured"""
+    if not app.config.get("COMPRESS_ENABLED", True):
+        return
+    codings = [
+        coding for coding in app.config.get("COMPRESS_ALGORITHMS", ["gzip"]) if coding in available_codings()
+    ]
+    unavailable = set(app.config.get("COMPRESS_ALGORITHMS", [])) - set(codings)
+    if unavailable:
+        app.logger.warning("Compression not available for: %s", ", ".join(sorted(unavailable)))
+    mimetypes = set(app.config.get("COMPRESS_MIMETYPES", ()))
+
+    @app.after_request
+    def compress_response(response):  # pylint: disable=unused-variable
+        if response.mimetype not in mimetypes:
+            return response
+        response.vary.add("Accept-Encoding")
+        coding = negotiate(request.accept_encodings, codings)
+        if coding is None:
+            return response
+        if not has_body(response):
+            tag_coding(response, coding)
+            return response
+        level = app.config[CODINGS[coding][1]]
+        if response.is_streamed:
+            response.response = compress_stream(
+                response.response, CODINGS[coding][0](level), app.config["COMPRESS_STREAM_FLUSH_SIZE"]
+            )
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < app.config["COMPRESS_MIN_SIZE"]:
+                return response
+            compressed = compress(coding, data, level)
+            if len(compressed) >= len(data):
+                return response
+            response.set_data(compressed)
+        response.headers["Content-Encoding"] = coding
+        tag_coding(response, coding)
+        return response
@@ -19,7 +19,7 @@ Module: error_handlers
 """
 from flask import jsonify
 from service.models import DataValidationError
-from service import app
+from service import app, api
 from . import status
 
 
@@ -32,6 +32,19 @@ def request_validation_error(error):
     return bad_request(error)
 
 
+# flask-restx only lets errors raised in a Resource reach the app's handlers
+# when exceptions propagate (under TESTING), so they are handled here as well
+@api.errorhandler(DataValidationError)
+def resource_validation_error(error):
+    """Handles Value Errors from bad data raised by the REST API"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        {"status": status.HTTP_400_BAD_REQUEST, "error": "Bad Request", "message": message},
+        status.HTTP_400_BAD_REQUEST,
+    )
+
+
 @app.errorhandler(status.HTTP_400_BAD_REQUEST)
 def bad_request(error):
     """Handles bad requests with 400_BAD_REQUEST"""
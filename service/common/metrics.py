@@ -0,0 +1,163 @@
+"""
+Metrics
+
+This module records Prometheus metrics for every request: the number of
+requests and their latency per route and status, the number and duration of
+the database queries each request made, the time spent serializing the
+response, and the state of the connection pool.
+
+Under gunicorn every worker is a separate process, so when the
+PROMETHEUS_MULTIPROC_DIR environment variable is set (gunicorn.conf.py does
+it) the metrics are written to files in that directory and /metrics adds up
+the values of every worker instead of reporting the one that got scraped.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from service.common.pool import pool_stats
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram, multiprocess
+except ImportError:  # pragma: no cover
+    prometheus_client = None
+
+# Queries made by a single request
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+if prometheus_client is not None:
+    REQUESTS = Counter(
+        "http_requests_total", "Requests handled", ["method", "route", "status"]
+    )
+    LATENCY = Histogram(
+        "http_request_duration_seconds", "Time to handle a request", ["method", "route", "status"]
+    )
+    DB_QUERIES = Histogram(
+        "http_request_db_queries", "Database queries made by a request", ["route"], buckets=QUERY_BUCKETS
+    )
+    DB_TIME = Histogram(
+        "http_request_db_seconds", "Time a request spent in database queries", ["route"]
+    )
+    SERIALIZATION_TIME = Histogram(
+        "http_request_serialization_seconds", "Time a request spent serializing its response", ["route"]
+    )
+    POOL_CONNECTIONS = Gauge(
+        "db_pool_connections", "Connections of the pool", ["state"], multiprocess_mode="livesum"
+    )
+    POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Connections checked out of the pool")
+    POOL_WAIT = Counter("db_pool_wait_seconds_total", "Time spent waiting for a connection of the pool")
+
+# Set by init_metrics() when the app records metrics
+_enabled = {"metrics": False}
+
+# Pool counters of this process already added to the metrics
+_pool_seen = {"checkouts": 0, "wait_time_total": 0.0}
+_pool_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    """Tells if metrics are being recorded"""
+    return _enabled["metrics"]
+
+
+@contextmanager
+def timed(name: str):
+    """Adds the time spent in the block to a per-request total, e.g. serialization"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context():
+            setattr(g, name, getattr(g, name, 0.0) + time.perf_counter() - start)
+
+
+def render() -> tuple:
+    """Returns the metrics in the Prometheus text format and its content type"""
+    registry = prometheus_client.REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def _before_cursor_execute(conn, *args):  # pylint: disable=unused-argument
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _handle_error(context):
+    # there is no connection when connecting failed, and no started query
+    # when a commit, rollback or begin failed
+    started = context.connection.info.get("query_start_time") if context.connection else None
+    if started:
+        started.pop()
+
+
+def _after_cursor_execute(conn, *args):  # pylint: disable=unused-argument
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    if has_request_context() and "request_start" in g:
+        g.db_queries += 1
+        g.db_seconds += elapsed
+
+
+def observe_pool(engine):
+    """Copies the state of the connection pool of this process into the metrics"""
+    stats = pool_stats(engine)
+    if "checked_out" not in stats:
+        return
+    POOL_CONNECTIONS.labels("checked_out").set(stats["checked_out"])
+    POOL_CONNECTIONS.labels("checked_in").set(stats["checked_in"])
+    POOL_CONNECTIONS.labels("overflow").set(stats["overflow"])
+    if "checkouts" in stats:
+        with _pool_lock:
+            if stats["checkouts"] < _pool_seen["checkouts"]:
+                # a new pool (the engine was recreated or disposed) counts from zero
+                _pool_seen.update(checkouts=0, wait_time_total=0.0)
+            POOL_CHECKOUTS.inc(stats["checkouts"] - _pool_seen["checkouts"])
+            POOL_WAIT.inc(max(stats["wait_time_total"] - _pool_seen["wait_time_total"], 0.0))
+            _pool_seen.update(checkouts=stats["checkouts"], wait_time_total=stats["wait_time_total"])
+
+
+def init_metrics(app, database):
+    """Records the metrics of every request of the app"""
+    if prometheus_client is None:
+        app.logger.warning("prometheus_client is not installed: metrics are disabled")
+        return
+    if not app.config.get("METRICS_ENABLED", True):
+        return
+    _enabled["metrics"] = True
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+
+    @app.before_request
+    def start_request():  # pylint: disable=unused-variable
+        g.request_start = time.perf_counter()
+        g.db_queries, g.db_seconds, g.serialization_seconds = 0, 0.0, 0.0
+        g.pop("response_status", None)
+
+    @app.after_request
+    def record_status(response):  # pylint: disable=unused-variable
+        g.response_status = response.status_code
+        return response
+
+    # Teardown runs after a streamed response has been sent, so the export
+    # is measured until its last row
+    @app.teardown_request
+    def record_request(error=None):  # pylint: disable=unused-variable
+        start = g.pop("request_start", None)
+        if start is None or request.path == "/metrics":
+            return
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        code = str(g.get("response_status", 500 if error else 200))
+        elapsed = time.perf_counter() - start
+        REQUESTS.labels(request.method, route, code).inc()
+        LATENCY.labels(request.method, route, code).observe(elapsed)
+        DB_QUERIES.labels(route).observe(g.db_queries)
+        DB_TIME.labels(route).observe(g.db_seconds)
+        SERIALIZATION_TIME.labels(route).observe(g.serialization_seconds)
+        observe_pool(database.engine)
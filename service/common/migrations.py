@@ -0,0 +1,266 @@
+"""
+Schema Migrations
+
+This module applies the versioned migrations of service/migrations/ in
+order and records them in the schema_migrations table. Every migration is a
+module named vNNNN_<slug>.py with an upgrade(migrator) function and, when it
+can be reverted, a downgrade(migrator) function.
+
+Migrations are written for a live table, so they use the Migrator helpers:
+
+    create_index     - CREATE INDEX CONCURRENTLY on PostgreSQL, so writes go
+                       on while the index is built; an invalid index left by
+                       an interrupted build is dropped and built again
+    execute          - a statement in its own transaction, which gives up
+                       after MIGRATION_LOCK_TIMEOUT ms instead of queueing
+                       every query behind it while it waits for a lock
+    backfill         - an UPDATE split into id ranges of MIGRATION_BATCH_SIZE
+                       rows, each committed on its own
+    create_extension - a PostgreSQL extension, or False where the server
+                       does not have it
+
+A migration may be interrupted between two steps, so each step must be safe
+to run again (IF NOT EXISTS, a backfill that skips the rows already done).
+"""
+import re
+import time
+import logging
+import pkgutil
+import importlib
+from contextlib import contextmanager
+import sqlalchemy as sa
+
+logger = logging.getLogger("flask.app")
+
+# The table that records which migrations have been applied
+versions = sa.Table(
+    "schema_migrations",
+    sa.MetaData(),
+    sa.Column("version", sa.String(16), primary_key=True),
+    sa.Column("description", sa.String(255)),
+    sa.Column("applied_at", sa.DateTime, server_default=sa.func.now()),
+)
+
+# Held while migrating so that two deployments never migrate at the same time
+ADVISORY_LOCK_KEY = 4816320024
+
+MODULE_NAME = re.compile(r"^v(\d{4})_\w+$")
+
+
+class Migration:  # pylint: disable=too-few-public-methods
+    """A versioned migration module of service/migrations/"""
+
+    def __init__(self, version: str, module):
+        self.version = version
+        self.module = module
+        self.description = (module.__doc__ or module.__name__).strip().splitlines()[0]
+
+    def __repr__(self):
+        return f"<Migration {self.version} {self.description}>"
+
+
+class Migrator:
+    """The operations a migration can run on the database"""
+
+    def __init__(self, engine, lock_timeout: int = 5000, batch_size: int = 10000, batch_pause: float = 0.0):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self.lock_timeout = lock_timeout
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+
+    @contextmanager
+    def transaction(self):
+        """A transaction that gives up waiting for locks after lock_timeout ms"""
+        with self.engine.begin() as connection:
+            if self.dialect == "postgresql":
+                connection.exec_driver_sql(f"SET LOCAL lock_timeout = {int(self.lock_timeout)}")
+            yield connection
+
+    def execute(self, statement: str, **parameters) -> int:
+        """Runs a statement in its own transaction and returns its row count"""
+        with self.transaction() as connection:
+            return connection.execute(sa.text(statement), parameters).rowcount
+
+    def create_table(self, table: sa.Table):
+        """Creates a table (and its types) unless it exists"""
+        with self.transaction() as connection:
+            table.create(connection, checkfirst=True)
+
+    def drop_table(self, table: sa.Table):
+        """Drops a table (and its types) if it exists"""
+        with self.transaction() as connection:
+            table.drop(connection, checkfirst=True)
+
+    def create_extension(self, name: str) -> bool:
+        """Creates a PostgreSQL extension unless it exists, and tells if it is there
+
+        The extension must be installed on the server, so a migration can go
+        on without it where it is not.
+        """
+        try:
+            self.execute(f"CREATE EXTENSION IF NOT EXISTS {name}")
+        except sa.exc.DBAPIError as error:
+            logger.warning("Extension %s is not available: %s", name, error.orig)
+            return False
+        return True
+
+    def index_is_valid(self, connection, name: str):
+        """Tells if a PostgreSQL index is valid, or returns None when there is none"""
+        return connection.execute(
+            sa.text(
+                "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND pg_catalog.pg_table_is_visible(c.oid)"
+            ),
+            {"name": name},
+        ).scalar()
+
+    def create_index(self, name: str, table: str, columns: str, unique: bool = False, using: str = None):
+        """Creates an index without locking the table against writes
+
+        columns is the SQL list of columns or expressions, e.g. "category, id".
+        using (e.g. "gin") is only honoured by PostgreSQL.
+        """
+        unique_sql = "UNIQUE " if unique else ""
+        if self.dialect != "postgresql":
+            self.execute(f"CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+            return
+        using_sql = f" USING {using}" if using else ""
+        # CONCURRENTLY cannot run inside a transaction
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.exec_driver_sql("SET statement_timeout = 0")
+            valid = self.index_is_valid(connection, name)
+            if valid:
+                return
+            if valid is False:
+                logger.warning("Rebuilding index %s left invalid by an interrupted build", name)
+                connection.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            started = time.perf_counter()
+            connection.exec_driver_sql(
+                f"CREATE {unique_sql}INDEX CONCURRENTLY {name} ON {table}{using_sql} ({columns})"
+            )
+            logger.info("Created index %s in %.1f s", name, time.perf_counter() - started)
+
+    def drop_index(self, name: str):
+        """Drops an index without locking the table against writes"""
+        if self.dialect != "postgresql":
+            self.execute(f"DROP INDEX IF EXISTS {name}")
+            return
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.exec_driver_sql("SET statement_timeout = 0")
+            connection.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+    def backfill(self, table: str, assignments: str, where: str = None, **parameters) -> int:
+        """Updates the rows of a table in batches of ids and returns how many changed
+
+        assignments is the SET clause and where an optional condition, which
+        should skip the rows already done so the backfill can be resumed, e.g.
+        backfill("product", "name_lower = lower(name)", "name_lower IS NULL").
+        Rows inserted after it started are not visited, so the code must
+        already write the new values before the backfill runs.
+        """
+        with self.engine.connect() as connection:
+            low, high = connection.execute(sa.text(f"SELECT min(id), max(id) FROM {table}")).one()
+        if low is None:
+            return 0
+        condition = f" AND ({where})" if where else ""
+        statement = f"UPDATE {table} SET {assignments} WHERE id >= :start AND id < :stop{condition}"
+        updated = 0
+        for start in range(low, high + 1, self.batch_size):
+            updated += self.execute(statement, start=start, stop=start + self.batch_size, **parameters)
+            logger.info("Backfilled %s up to id %d (%d rows)", table, min(start + self.batch_size - 1, high), updated)
+            if self.batch_pause:
+                time.sleep(self.batch_pause)
+        return updated
+
+
+def load_migrations() -> list:
+    """Returns every migration of service/migrations/, oldest first"""
+    package = importlib.import_module("service.migrations")
+    migrations = []
+    for module_info in pkgutil.iter_modules(package.__path__):
+        match = MODULE_NAME.match(module_info.name)
+        if match:
+            module = importlib.import_module(f"{package.__name__}.{module_info.name}")
+            migrations.append(Migration(match.group(1), module))
+    return sorted(migrations, key=lambda migration: migration.version)
+
+
+@contextmanager
+def _migration_lock(engine):
+    """Serializes the migrations of concurrent deployments on PostgreSQL"""
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(sa.text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+        try:
+            yield
+        finally:
+            connection.execute(sa.text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+
+
+def applied_versions(engine) -> set:
+    """Returns the versions of the migrations applied to the database"""
+    with engine.begin() as connection:
+        versions.create(connection, checkfirst=True)
+        return {row.version for row in connection.execute(sa.select(versions.c.version))}
+
+
+def status(engine) -> list:
+    """Returns every migration with whether it has been applied"""
+    applied = applied_versions(engine)
+    return [(migration, migration.version in applied) for migration in load_migrations()]
+
+
+def upgrade(engine, target: str = None, **options) -> list:
+    """Applies the pending migrations up to target (default: all) and returns them
+
+    The options (lock_timeout, batch_size, batch_pause) go to the Migrator.
+    """
+    migrator = Migrator(engine, **options)
+    done = []
+    with _migration_lock(engine):
+        applied = applied_versions(engine)
+        for migration in load_migrations():
+            if migration.version in applied or (target and migration.version > target):
+                continue
+            logger.info("Applying migration %s: %s", migration.version, migration.description)
+            migration.module.upgrade(migrator)
+            with engine.begin() as connection:
+                connection.execute(
+                    versions.insert().values(version=migration.version, description=migration.description)
+                )
+            done.append(migration)
+    return done
+
+
+def downgrade(engine, target: str, **options) -> list:
+    """Reverts the applied migrations newer than target, newest first, and returns them"""
+    migrator = Migrator(engine, **options)
+    done = []
+    with _migration_lock(engine):
+        applied = applied_versions(engine)
+        for migration in reversed(load_migrations()):
+            if migration.version not in applied or migration.version <= target:
+                continue
+            if not hasattr(migration.module, "downgrade"):
+                raise RuntimeError(f"Migration {migration.version} cannot be reverted")
+            logger.info("Reverting migration %s: %s", migration.version, migration.description)
+            migration.module.downgrade(migrator)
+            with engine.begin() as connection:
+                connection.execute(versions.delete().where(versions.c.version == migration.version))
+            done.append(migration)
+    return done
+
+
+def stamp(engine) -> list:
+    """Records every migration as applied without running it, e.g. after create_all()"""
+    applied = applied_versions(engine)
+    pending = [migration for migration in load_migrations() if migration.version not in applied]
+    with engine.begin() as connection:
+        for migration in pending:
+            connection.execute(
+                versions.insert().values(version=migration.version, description=migration.description)
+            )
+    return pending
@@ -0,0 +1,90 @@
+"""
+Module: pagination
+
+Helpers for the opaque cursors used by keyset (cursor) pagination, and by
+offset pagination where results are not ordered by id (search)
+"""
+import json
+import base64
+import binascii
+from service.models import DataValidationError
+
+
+def _encode(position: dict) -> str:
+    raw = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError, UnicodeError, binascii.Error) as error:
+        raise DataValidationError(f"Invalid cursor: {cursor}") from error
+    if not isinstance(data, dict):
+        raise DataValidationError(f"Invalid cursor: {cursor}")
+    return data
+
+
+def _integer(data: dict, key: str, cursor: str) -> int:
+    value = data.get(key)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise DataValidationError(f"Invalid cursor: {cursor}")
+    return value
+
+
+def encode_cursor(last_id: int, sort: str = None, key=None) -> str:
+    """Encodes the last row on a page into an opaque cursor
+
+    When the page is sorted by another column than the id, the name of that
+    column and its value in the last row are kept as well.
+    """
+    position = {"id": last_id}
+    if sort:
+        position.update(sort=sort, key=key)
+    return _encode(position)
+
+
+def decode_sort_cursor(cursor: str, sort: str = None) -> tuple:
+    """Decodes a cursor of a page sorted by a column
+
+    :param cursor: the opaque cursor taken from a previous page
+    :type cursor: str
+    :param sort: the column the page is sorted by (None for the id)
+    :type sort: str
+
+    :return: the id and the sort column value of the last row seen, or
+             (None, None) if there is no cursor
+    :rtype: tuple
+
+    """
+    if not cursor:
+        return None, None
+    data = _decode(cursor)
+    # a cursor only makes sense for the sort order it was made for
+    if data.get("sort") != sort:
+        raise DataValidationError(f"Invalid cursor: {cursor} does not match the sort order")
+    return _integer(data, "id", cursor), data.get("key")
+
+
+def encode_offset_cursor(offset: int) -> str:
+    """Encodes the number of rows already returned into an opaque cursor"""
+    return _encode({"offset": offset})
+
+
+def decode_offset_cursor(cursor: str) -> int:
+    """Decodes an offset cursor back into the number of rows to skip
+
+    :param cursor: the opaque cursor taken from a previous page
+    :type cursor: str
+
+    :return: the number of rows to skip, 0 if there is no cursor
+    :rtype: int
+
+    """
+    if not cursor:
+        return 0
+    offset = _integer(_decode(cursor), "offset", cursor)
+    if offset < 0:
+        raise DataValidationError(f"Invalid cursor: {cursor}")
+    return offset
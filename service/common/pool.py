@@ -0,0 +1,85 @@
+"""
+Database Connection Pool
+
+This module configures the SQLAlchemy connection pool from the DB_POOL_*
+settings and keeps statistics about it for the /stats endpoint.
+"""
+import time
+import threading
+from sqlalchemy.pool import QueuePool
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool that records how long callers wait for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+
+
+def engine_options(app, uri: str, options: dict = None) -> dict:
+    """Returns the options of an engine for a database from the DB_POOL_* configuration
+
+    SQLite picks its own pool implementation so it is left alone.
+    """
+    options = dict(options or {})
+    if uri.startswith("sqlite"):
+        return options
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=app.config["DB_POOL_SIZE"],
+        max_overflow=app.config["DB_MAX_OVERFLOW"],
+        pool_timeout=app.config["DB_POOL_TIMEOUT"],
+        pool_recycle=app.config["DB_POOL_RECYCLE"],
+        pool_pre_ping=app.config["DB_POOL_PRE_PING"],
+    )
+    timeout = app.config["DB_STATEMENT_TIMEOUT"]
+    if timeout and uri.startswith("postgresql"):
+        connect_args = dict(options.get("connect_args", {}))
+        connect_args["options"] = f"-c statement_timeout={timeout}"
+        options["connect_args"] = connect_args
+    return options
+
+
+def init_pool(app):
+    """Sets the SQLAlchemy engine options from the DB_POOL_* configuration"""
+    uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    if uri.startswith("sqlite"):
+        return
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        app, uri, app.config.get("SQLALCHEMY_ENGINE_OPTIONS")
+    )
+
+
+def pool_stats(engine) -> dict:
+    """Returns the statistics of the connection pool of an engine"""
+    pool = engine.pool
+    stats = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update(
+            checkouts=pool.checkouts,
+            wait_time_total=round(pool.wait_time, 6),
+            wait_time_max=round(pool.max_wait, 6),
+        )
+    return stats
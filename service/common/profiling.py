@@ -0,0 +1,182 @@
+"""
+SQL Profiling
+
+This module records the SQL statements each request runs when profiling is
+turned on. For every request it keeps the number of queries, their duration
+and their text, and it logs:
+
+    - queries slower than SQL_SLOW_QUERY_MS, with their EXPLAIN plan
+    - requests that ran more than SQL_QUERY_BUDGET queries
+    - statements repeated SQL_REPEAT_THRESHOLD times or more in one request,
+      the usual sign of an N+1 query pattern
+
+Profiling is off by default and can be turned on without a restart: for one
+worker with PUT /profiling, or for every worker by creating the file named
+by SQL_PROFILING_FILE (checked at most once a second).
+"""
+import os
+import time
+from collections import deque, Counter
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# The settings that PUT /profiling can change at runtime
+SETTINGS = {
+    "enabled": "SQL_PROFILING",
+    "slow_query_ms": "SQL_SLOW_QUERY_MS",
+    "query_budget": "SQL_QUERY_BUDGET",
+    "repeat_threshold": "SQL_REPEAT_THRESHOLD",
+}
+
+# Statements that EXPLAIN can describe without running them
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+# The profiles of the last requests of this worker, newest last
+recent_profiles = deque(maxlen=50)
+
+_flag_file = {"checked": 0.0, "exists": False}
+
+
+class QueryRecord:  # pylint: disable=too-few-public-methods
+    """A statement run by a request and how long it took"""
+
+    def __init__(self, engine, statement: str, parameters, seconds: float):
+        self.engine = engine
+        self.statement = statement
+        self.parameters = parameters
+        self.seconds = seconds
+
+
+def is_enabled(app) -> bool:
+    """Tells if SQL profiling is turned on for this worker"""
+    flag_file = app.config.get("SQL_PROFILING_FILE")
+    if flag_file:
+        now = time.monotonic()
+        if now - _flag_file["checked"] >= 1:
+            _flag_file.update(checked=now, exists=os.path.exists(flag_file))
+        if _flag_file["exists"]:
+            return True
+    return bool(app.config.get("SQL_PROFILING"))
+
+
+def settings(app) -> dict:
+    """Returns the current profiling settings of this worker"""
+    result = {name: app.config.get(key) for name, key in SETTINGS.items()}
+    result["enabled"] = is_enabled(app)
+    return result
+
+
+def configure(app, **values) -> dict:
+    """Changes the profiling settings of this worker, e.g. configure(app, enabled=True)"""
+    for name, value in values.items():
+        app.config[SETTINGS[name]] = value
+    return settings(app)
+
+
+def explain(engine, statement: str, parameters) -> str:
+    """Returns the query plan of a statement, read on a connection of its own"""
+    if not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return "(no plan)"
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    try:
+        with engine.connect() as connection:
+            rows = connection.exec_driver_sql(prefix + statement, parameters or ()).fetchall()
+    except Exception as error:  # pylint: disable=broad-except
+        return f"(EXPLAIN failed: {error})"
+    return "\n".join(str(row[-1]) for row in rows)
+
+
+def _profiling() -> bool:
+    return has_request_context() and g.get("sql_profile") is not None
+
+
+def _before_cursor_execute(conn, *args):  # pylint: disable=unused-argument
+    if _profiling():
+        conn.info.setdefault("profile_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=too-many-arguments
+    started = conn.info.get("profile_start_time")
+    if not started or not _profiling():
+        return
+    seconds = time.perf_counter() - started.pop()
+    # the rows of an executemany() are not worth keeping, only their number
+    if executemany:
+        statement = f"{statement} -- x{len(parameters)}"
+        parameters = None
+    g.sql_profile.append(QueryRecord(conn.engine, statement, parameters, seconds))
+
+
+def _handle_error(context):
+    started = context.connection.info.get("profile_start_time") if context.connection else None
+    if started:
+        started.pop()
+
+
+def report(app, queries: list) -> dict:
+    """Logs the slow queries, busted budget and repeated statements of a request"""
+    where = f"{request.method} {request.path}"
+    slow_seconds = app.config["SQL_SLOW_QUERY_MS"] / 1000
+    for query in queries:
+        app.logger.debug("SQL %.2f ms in %s: %s", query.seconds * 1000, where, query.statement)
+        if query.seconds >= slow_seconds:
+            app.logger.warning(
+                "Slow query (%.1f ms) in %s: %s\n%s",
+                query.seconds * 1000,
+                where,
+                query.statement,
+                explain(query.engine, query.statement, query.parameters),
+            )
+    if len(queries) > app.config["SQL_QUERY_BUDGET"]:
+        app.logger.warning(
+            "%s ran %d queries, over the budget of %d", where, len(queries), app.config["SQL_QUERY_BUDGET"]
+        )
+    repeated = [
+        {"statement": statement, "count": count}
+        for statement, count in Counter(query.statement for query in queries).most_common()
+        if count >= app.config["SQL_REPEAT_THRESHOLD"]
+    ]
+    for repeat in repeated:
+        app.logger.warning(
+            "Possible N+1 in %s, ran %d times: %s", where, repeat["count"], repeat["statement"]
+        )
+    return {
+        "request": where,
+        "queries": len(queries),
+        "db_ms": round(sum(query.seconds for query in queries) * 1000, 3),
+        "over_budget": len(queries) > app.config["SQL_QUERY_BUDGET"],
+        "repeated": repeated,
+        "statements": [
+            {"statement": query.statement, "ms": round(query.seconds * 1000, 3)} for query in queries
+        ],
+    }
+
+
+def init_profiling(app):
+    """Hooks the SQL profiler into the database engines and the requests of the app"""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+    recent_profiles.clear()
+
+    @app.before_request
+    def start_profile():  # pylint: disable=unused-variable
+        g.sql_profile = [] if is_enabled(app) else None
+
+    @app.after_request
+    def add_server_timing(response):  # pylint: disable=unused-variable
+        queries = g.get("sql_profile")
+        if queries is not None:
+            milliseconds = sum(query.seconds for query in queries) * 1000
+            response.headers.add("Server-Timing", f'db;desc="{len(queries)} queries";dur={milliseconds:.2f}')
+        return response
+
+    # Teardown runs after a streamed response has been sent, so the queries
+    # of the export are all in its profile
+    @app.teardown_request
+    def finish_profile(error=None):  # pylint: disable=unused-variable,unused-argument
+        queries = g.pop("sql_profile", None)
+        if queries is not None and request.path != "/profiling":
+            recent_profiles.append(report(app, queries))
@@ -0,0 +1,189 @@
+"""
+Read Replicas
+
+This module sends the queries of read-only requests to the read replicas
+listed in DATABASE_REPLICA_URIS, so the heavy listings do not load the
+primary database:
+
+    - the SELECTs of GET and HEAD requests go to a replica, picked in turn
+      for each request; everything else goes to the primary
+    - a request that writes sets a cookie that sends the reads of that client
+      to the primary for DB_REPLICA_STICKY_SECONDS, so it reads its own
+      writes even while the replicas lag behind
+    - a replica that cannot be reached is left out for
+      DB_REPLICA_RETRY_SECONDS and the query is run again on the primary
+
+Without replicas every query goes to the primary, as before.
+"""
+import time
+import logging
+import itertools
+from contextlib import contextmanager
+from flask import current_app, g, request, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine
+from sqlalchemy.exc import DBAPIError
+from service.common.pool import engine_options, pool_stats
+
+logger = logging.getLogger("flask.app")
+
+# Requests whose queries may read from a replica
+READ_METHODS = ("GET", "HEAD")
+
+# Holds the time until which the client reads from the primary
+STICKY_COOKIE = "db-primary-until"
+
+
+class Replica:
+    """A read replica and whether it can be used"""
+
+    def __init__(self, name: str, engine):
+        self.name = name
+        self.engine = engine
+        self.down_until = 0.0
+
+    def available(self) -> bool:
+        """Tells if the replica can take queries"""
+        return time.monotonic() >= self.down_until
+
+    def mark_down(self, seconds: float):
+        """Leaves the replica out for a number of seconds"""
+        self.down_until = time.monotonic() + seconds
+
+    def stats(self) -> dict:
+        """Returns the state and the connection pool statistics of the replica"""
+        return {"name": self.name, "available": self.available(), "pool": pool_stats(self.engine)}
+
+
+# The replicas of this worker, set by configure()
+_replicas = []
+_turn = itertools.count()
+
+
+def configure(app) -> list:
+    """Creates an engine for every replica of DATABASE_REPLICA_URIS
+
+    The engines connect on first use, so this does not touch the replicas.
+    """
+    dispose()
+    _replicas[:] = [
+        Replica(f"replica-{number}", create_engine(uri, **engine_options(app, uri)))
+        for number, uri in enumerate(app.config.get("DATABASE_REPLICA_URIS") or [])
+    ]
+    return list(_replicas)
+
+
+def dispose(close: bool = True):
+    """Drops the connections of the replicas, e.g. in a forked worker with close=False"""
+    for replica in _replicas:
+        replica.engine.dispose(close=close)
+
+
+def stats() -> list:
+    """Returns the state of every replica"""
+    return [replica.stats() for replica in _replicas]
+
+
+def choose():
+    """Returns the next available replica, or None to use the primary"""
+    available = [replica for replica in _replicas if replica.available()]
+    if not available:
+        return None
+    return available[next(_turn) % len(available)]
+
+
+def is_sticky() -> bool:
+    """Tells if the client of the request wrote recently and must read from the primary"""
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def is_unavailable(error: DBAPIError) -> bool:
+    """Tells if an error means the database could not be reached
+
+    Errors while connecting have no statement; errors of a query, a statement
+    timeout included, are not a reason to fail over.
+    """
+    return error.connection_invalidated or error.statement is None
+
+
+@contextmanager
+def use_primary():
+    """Sends the queries of the block to the primary, e.g. to fill a cache"""
+    replica = g.pop("db_replica", None) if has_request_context() else None
+    try:
+        yield
+    finally:
+        if replica is not None:
+            g.db_replica = replica
+
+
+class RoutingSession(Session):
+    """A session that sends the reads of read-only requests to a replica"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replica = None
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        """Returns the engine of the replica of the request for a read, else the primary"""
+        self.replica = None
+        if bind is None and has_request_context():
+            if self._flushing or not getattr(clause, "is_select", False):
+                # every later read of the request must see this write
+                g.db_wrote = True
+                g.pop("db_replica", None)
+            elif g.get("db_replica") is not None:
+                self.replica = g.db_replica
+                return self.replica.engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _with_failover(self, method, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except DBAPIError as error:
+            replica = self.replica
+            if replica is None or not is_unavailable(error):
+                raise
+            logger.warning("Replica %s is unavailable, reading from the primary: %s", replica.name, error.orig)
+            replica.mark_down(current_app.config["DB_REPLICA_RETRY_SECONDS"])
+            self.rollback()
+            g.pop("db_replica", None)
+            return method(*args, **kwargs)
+
+    def execute(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        """Runs a statement, on the primary when its replica is unavailable"""
+        return self._with_failover(super().execute, *args, **kwargs)
+
+    def scalars(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        """Runs a statement and returns its scalars, like execute()"""
+        return self._with_failover(super().scalars, *args, **kwargs)
+
+    def scalar(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        """Runs a statement and returns its first scalar, like execute()"""
+        return self._with_failover(super().scalar, *args, **kwargs)
+
+
+def init_replicas(app):
+    """Routes the queries of every request of the app"""
+
+    @app.before_request
+    def choose_replica():  # pylint: disable=unused-variable
+        g.db_wrote = False
+        g.db_replica = choose() if request.method in READ_METHODS and not is_sticky() else None
+
+    @app.after_request
+    def stick_to_primary(response):  # pylint: disable=unused-variable
+        if _replicas and g.get("db_wrote"):
+            seconds = app.config["DB_REPLICA_STICKY_SECONDS"]
+            response.set_cookie(
+                STICKY_COOKIE, f"{time.time() + seconds:.3f}", max_age=int(seconds) + 1, httponly=True, samesite="Lax"
+            )
+        return response
+
+    @app.teardown_request
+    def forget_replica(error=None):  # pylint: disable=unused-variable,unused-argument
+        g.pop("db_replica", None)
+        g.pop("db_wrote", None)
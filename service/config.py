@@ -12,5 +12,76 @@ DATABASE_URI = os.getenv(
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Connection pool of every worker process (see "Connection pool" in README.md).
+# Each worker holds up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds to wait for a connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds before a connection is replaced
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("true", "yes", "1")
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "0"))  # milliseconds, 0 disables it
+
+# Read replicas (see "Read replicas" in README.md): a comma-separated list of
+# database URIs the reads of GET requests are spread over, how long a client
+# reads from the primary after it wrote, and how long an unreachable replica
+# is left out
+DATABASE_REPLICA_URIS = [uri for uri in os.getenv("DATABASE_REPLICA_URIS", "").split(",") if uri]
+DB_REPLICA_STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))
+DB_REPLICA_RETRY_SECONDS = float(os.getenv("DB_REPLICA_RETRY_SECONDS", "30"))
+
+# Create the missing tables when the service starts. Off by default: every
+# worker would run the DDL on boot, so the schema is made by `flask db-upgrade`
+DB_CREATE_SCHEMA = os.getenv("DB_CREATE_SCHEMA", "false").lower() in ("true", "yes", "1")
+
+# Schema migrations (see "Schema migrations" in README.md): how long a DDL
+# statement may wait for a lock, and the rows and pause of each backfill batch
+MIGRATION_LOCK_TIMEOUT = int(os.getenv("MIGRATION_LOCK_TIMEOUT", "5000"))  # milliseconds
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "10000"))
+MIGRATION_BATCH_PAUSE = float(os.getenv("MIGRATION_BATCH_PAUSE", "0"))  # seconds
+
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "s3cr3t-key-shhhh")
+
+# Path of the Swagger UI, or an empty string to turn it off
+API_DOCS = os.getenv("API_DOCS", "/apidocs")
+
+# Page sizes for listing Products (the maximum is enforced by the server)
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+
+# Number of rows fetched per round trip by the streaming export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Number of rows inserted per statement by the bulk ingest
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+
+# Largest number of ids accepted by one batch read
+BATCH_GET_MAX = int(os.getenv("BATCH_GET_MAX", "1000"))
+
+# Read-through cache for Products: "lru" (in-process), "redis" (shared) or "none"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "lru")
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "10000"))
+CACHE_TTL = int(os.getenv("CACHE_TTL", "60"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# Response compression (see "Compression" in README.md): content codings in order
+# of preference, the smallest body worth compressing and the level of each coding
+COMPRESS_ENABLED = os.getenv("COMPRESS_ENABLED", "true").lower() in ("true", "yes", "1")
+COMPRESS_ALGORITHMS = os.getenv("COMPRESS_ALGORITHMS", "br,zstd,gzip").split(",")
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))  # bytes
+COMPRESS_MIMETYPES = ("application/json", "application/x-ndjson", "text/csv", "text/html")
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_LEVEL = int(os.getenv("COMPRESS_BROTLI_LEVEL", "4"))
+COMPRESS_ZSTD_LEVEL = int(os.getenv("COMPRESS_ZSTD_LEVEL", "3"))
+COMPRESS_STREAM_FLUSH_SIZE = int(os.getenv("COMPRESS_STREAM_FLUSH_SIZE", "65536"))  # bytes of input
+
+# Prometheus metrics served on /metrics (see "Metrics" in README.md)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("true", "yes", "1")
+
+# SQL profiling (see "SQL profiling" in README.md), off by default. It can be
+# turned on at runtime with PUT /profiling or by creating SQL_PROFILING_FILE
+SQL_PROFILING = os.getenv("SQL_PROFILING", "false").lower() in ("true", "yes", "1")
+SQL_PROFILING_FILE = os.getenv("SQL_PROFILING_FILE", "")
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "100"))
+SQL_QUERY_BUDGET = int(os.getenv("SQL_QUERY_BUDGET", "10"))
+SQL_REPEAT_THRESHOLD = int(os.getenv("SQL_REPEAT_THRESHOLD", "5"))
@@ -0,0 +1,8 @@
+"""
+Package: migrations
+The versioned schema migrations applied by `flask db-upgrade`
+
+Add a change to the schema as a new module vNNNN_<slug>.py, numbered after
+the last one, with upgrade(migrator) and downgrade(migrator) functions (see
+service/common/migrations.py), and update the model to match.
+"""
@@ -0,0 +1,33 @@
+"""
+Create the product table
+
+The table as the first release of the service created it. Databases made by
+db.create_all() already have it, so this does nothing on them.
+"""
+import sqlalchemy as sa
+
+product = sa.Table(
+    "product",
+    sa.MetaData(),
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("name", sa.String(63)),
+    sa.Column("description", sa.Text, nullable=True),
+    sa.Column("price", sa.Float, nullable=False),
+    sa.Column("available", sa.Boolean, nullable=False),
+    sa.Column("image_url", sa.Text, nullable=True),
+    sa.Column(
+        "category",
+        sa.Enum("ELECTRONICS", "PERSONAL_CARE", "TOYS", "SPORTS", "FOOD", "HEALTH", "OTHERS", name="category"),
+        nullable=True,
+    ),
+)
+
+
+def upgrade(migrator):
+    """Creates the product table"""
+    migrator.create_table(product)
+
+
+def downgrade(migrator):
+    """Drops the product table and every Product in it"""
+    migrator.drop_table(product)
@@ -0,0 +1,33 @@
+"""
+Add the listing and search indexes
+
+db.create_all() only creates missing tables, so the indexes of the listing
+filters, the sorted listings and the full-text search never reached the
+databases created before them. They are built concurrently, so the table
+takes writes while they are built.
+"""
+
+INDEXES = {
+    "ix_product_category_available_id": "category, available, id",
+    "ix_product_available_id": "available, id",
+    "ix_product_name_id": "name, id",
+    "ix_product_price_id": "price, id",
+    "ix_product_category_id": "category, id",
+    "ix_product_category_available_price_id": "category, available, price, id",
+}
+
+SEARCH_DOCUMENT = "to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, ''))"
+
+
+def upgrade(migrator):
+    """Creates the indexes one at a time"""
+    for name, columns in INDEXES.items():
+        migrator.create_index(name, "product", columns)
+    if migrator.dialect == "postgresql":
+        migrator.create_index("ix_product_search", "product", SEARCH_DOCUMENT, using="gin")
+
+
+def downgrade(migrator):
+    """Drops the indexes"""
+    for name in ("ix_product_search", *INDEXES):
+        migrator.drop_index(name)
@@ -0,0 +1,21 @@
+"""
+Add the trigram index for typo tolerant search
+
+The pg_trgm extension ships with PostgreSQL (the postgres:alpine image has
+it) but must be installed on the server. Where it is not, the migration
+leaves the search without typo tolerance; once the extension is installed,
+run `flask db-downgrade --to 0002` and `flask db-upgrade` to build the index.
+"""
+
+TRIGRAM_INDEX = "ix_product_name_trgm"
+
+
+def upgrade(migrator):
+    """Creates pg_trgm and the trigram index of the names"""
+    if migrator.dialect == "postgresql" and migrator.create_extension("pg_trgm"):
+        migrator.create_index(TRIGRAM_INDEX, "product", "lower(name) gin_trgm_ops", using="gin")
+
+
+def downgrade(migrator):
+    """Drops the trigram index, the extension may be used by others"""
+    migrator.drop_index(TRIGRAM_INDEX)
@@ -3,20 +3,47 @@ Models for Product
 
 All of the models are stored in this module
 """
+# pylint: disable=too-many-lines
+import re
+import math
 import logging
 from enum import Enum
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from sqlalchemy.exc import SQLAlchemyError
+from service.common import cache, replicas
+from service.common.pool import init_pool
+from service.common.serialization import dumps, etag_of
 
 logger = logging.getLogger("flask.app")
 
-# Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+# Create the SQLAlchemy object to be initialized later in init_db(). Its
+# sessions send the reads of GET requests to the read replicas, if any.
+db = SQLAlchemy(session_options={"class_": replicas.RoutingSession})
 
 
 # Function to initialize the database
-def init_db(app):
+def init_db(app, create_schema=True):
     """Initializes the SQLAlchemy app"""
-    Product.init_db(app)
+    Product.init_db(app, create_schema)
+
+
+# The text searched by Product.search(). The GIN index is built on exactly
+# this expression so PostgreSQL can use it for ``document @@ query``.
+SEARCH_DOCUMENT = "to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, ''))"
+
+# The trigram index that makes the search tolerate typos in names. It needs the
+# pg_trgm extension, which not every server has, so it is not part of the
+# model: create_all() and migration 0003 add it where they can.
+TRIGRAM_INDEX = "ix_product_name_trgm"
+TRIGRAM_DOCUMENT = "lower(name)"
+
+# Whether the database has the trigram index, checked once per process
+_trigrams = {}
+
+
+# The longest name the name column holds
+NAME_LENGTH = 63
 
 
 class DataValidationError(Exception):
@@ -35,7 +62,7 @@ class Category(Enum):
     OTHERS = 100
 
 
-class Product(db.Model):
+class Product(db.Model):  # pylint: disable=too-many-public-methods
     """
     Class that represents a Product
     """
@@ -44,27 +71,46 @@ class Product(db.Model):
 
     # Table Schema
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(63))
+    name = db.Column(db.String(NAME_LENGTH))
     description = db.Column(db.Text, nullable=True)
     price = db.Column(db.Float, nullable=False)
     available = db.Column(db.Boolean(), nullable=False, default=True)
     image_url = db.Column(db.Text, nullable=True)
     category = db.Column(db.Enum(Category), nullable=True)
 
+    # Composite indexes for the listing filters. Each one ends with the id so
+    # that a filtered page (``WHERE ... AND id > :cursor ORDER BY id``) is
+    # served by a single index range scan.
+    __table_args__ = (
+        db.Index("ix_product_category_available_id", "category", "available", "id"),
+        db.Index("ix_product_available_id", "available", "id"),
+        db.Index("ix_product_name_id", "name", "id"),
+        db.Index("ix_product_price_id", "price", "id"),
+        # sorted listings: every column in SORT_FIELDS has an index ending
+        # with the id, and "cheapest available toys" is one range scan
+        db.Index("ix_product_category_id", "category", "id"),
+        db.Index("ix_product_category_available_price_id", "category", "available", "price", "id"),
+        # full-text search index, PostgreSQL only (SQLite falls back to LIKE)
+        db.Index(
+            "ix_product_search", db.text(SEARCH_DOCUMENT), postgresql_using="gin"
+        ).ddl_if(dialect="postgresql"),
+    )
+
     def __repr__(self):
         return f"<Product {self.name} id=[{self.id}]>"
 
+    # The columns of a serialized Product, in order
+    SERIALIZED_FIELDS = ("id", "name", "description", "price", "available", "image_url", "category")
+
+    # The columns find_page() can sort by, each one backed by an index
+    SORT_FIELDS = ("id", "name", "price", "category")
+
+    # The columns aggregate() can group by
+    AGGREGATE_DIMENSIONS = ("category", "available")
+
     def to_dict(self):
         """Converts the Product instance to a dictionary."""
-        return {
-            "id": self.id,
-            "name": self.name,
-            "description": self.description,
-            "price": self.price,
-            "available": self.available,
-            "image_url": self.image_url,
-            "category": self.category.name,
-        }
+        return self.serialize()
 
     def create(self):
         """
@@ -74,6 +120,7 @@ class Product(db.Model):
         self.id = None  # pylint: disable=invalid-name
         db.session.add(self)
         db.session.commit()
+        cache.product_cache.delete(self.id)
 
     def update(self):
         """
@@ -83,12 +130,14 @@ class Product(db.Model):
         if not self.id:
             raise DataValidationError("Update called with empty ID field")
         db.session.commit()
+        cache.product_cache.delete(self.id)
 
     def delete(self):
         """Removes a Product from the data store"""
         logger.info("Deleting %s", self.name)
         db.session.delete(self)
         db.session.commit()
+        cache.product_cache.delete(self.id)
 
     def serialize(self):
         """Serializes a Product into a dictionary"""
@@ -102,6 +151,24 @@ class Product(db.Model):
             "category": self.category.name,  # convert enum to string
         }
 
+    @staticmethod
+    def etag(data: dict) -> str:
+        """Returns the strong ETag of a serialized Product"""
+        return etag_of(dumps(data))
+
+    @classmethod
+    def serialize_row(cls, row, fields: tuple = None) -> dict:
+        """Serializes a row of the SERIALIZED_FIELDS columns (or of fields) without creating a Product"""
+        data = dict(zip(fields or cls.SERIALIZED_FIELDS, row))
+        if data.get("category") is not None:
+            data["category"] = data["category"].name  # convert enum to string
+        return data
+
+    @classmethod
+    def serialized_columns(cls, fields: tuple = None) -> list:
+        """Returns the columns to select to be able to call serialize_row() with the same fields"""
+        return [getattr(cls, name) for name in fields or cls.SERIALIZED_FIELDS]
+
     def deserialize(self, data):
         """
         Deserializes a Product from a dictionary
@@ -109,22 +176,39 @@ class Product(db.Model):
         Args:
             data (dict): A dictionary containing the resource data
         """
+        for key, value in self.validate(data).items():
+            setattr(self, key, value)
+        return self
+
+    @classmethod
+    def validate(cls, data, partial: bool = False) -> dict:
+        """
+        Validates a dictionary of Product data without creating a Product
+
+        Args:
+            data (dict): A dictionary containing the resource data
+            partial (bool): True to only validate the fields present in data
+
+        Returns:
+            dict: the column values of the Product, ready to be inserted
+        """
         try:
-            self.name = data["name"]
-            self.description = data["description"]
-            self.price = data["price"]
-            self.description = data["description"]
-            if isinstance(data["available"], bool):
-                self.available = data["available"]
-            else:
-                raise DataValidationError(
-                    "Invalid type for boolean [available]: "
-                    + str(type(data["available"]))
-                )
-            self.image_url = data["image_url"]
-            self.category = getattr(
-                Category, data["category"]
-            )  # create enum from string
+            if not isinstance(data, dict):
+                raise TypeError(f"expected an object, not {type(data).__name__}")
+            names = [name for name in cls.SERIALIZED_FIELDS[1:] if not partial or name in data]
+            if not names:
+                raise DataValidationError("Invalid Product: no fields to update")
+            values = {name: data[name] for name in names}
+            checks = {
+                "name": cls._validate_name,
+                "price": cls._validate_price,
+                "available": cls._validate_available,
+                "category": lambda category: getattr(Category, category),  # create enum from string
+            }
+            for name, check in checks.items():
+                if name in values:
+                    values[name] = check(values[name])
+            return values
         except AttributeError as error:
             raise DataValidationError("Invalid attribute: " + error.args[0]) from error
         except KeyError as error:
@@ -136,61 +220,135 @@ class Product(db.Model):
                 "Invalid Product: body of request contained bad or no data "
                 + str(error)
             ) from error
-        return self
+
+    @staticmethod
+    def _validate_available(available) -> bool:
+        """Checks that the availability is a boolean"""
+        if not isinstance(available, bool):
+            raise DataValidationError("Invalid type for boolean [available]: " + str(type(available)))
+        return available
+
+    @staticmethod
+    def _validate_name(name):
+        """Checks that a name fits the name column"""
+        if name is not None and not isinstance(name, str):
+            raise DataValidationError("Invalid type for string [name]: " + str(type(name)))
+        if name is not None and len(name) > NAME_LENGTH:
+            raise DataValidationError(f"Invalid name: longer than {NAME_LENGTH} characters")
+        return name
+
+    @staticmethod
+    def _validate_price(price) -> float:
+        """Returns a price as a float, which may be posted as a number or a numeric string"""
+        if isinstance(price, bool) or not isinstance(price, (int, float, str)):
+            raise DataValidationError("Invalid type for number [price]: " + str(type(price)))
+        try:
+            price = float(price)
+        except ValueError as error:
+            raise DataValidationError(f"Invalid price: {price}") from error
+        if not math.isfinite(price):
+            raise DataValidationError(f"Invalid price: {price}")
+        return price
 
     def change_availability(self):
         """
         Changes the availability of the Product
         """
-        self.available = not self.available
-        db.session.commit()
+        self.set_availability(self.id)
         logger.info("Availability changed for %s", self.name)
 
-    # # flake8: noqa: C901
-    # def deserialize_update(self, data):
-    #     """
-    #     Deserializes a Product from a dictionary
-
-    #     Args:
-    #         data (dict): A dictionary containing the resource data
-    #         it only contain keys of fields to be updated
-    #     """
-    #     try:
-    #         if "name" in data:
-    #             self.name = data["name"]
-    #         if "description" in data:
-    #             self.description = data["description"]
-    #         if "price" in data:
-    #             self.price = data["price"]
-    #         if "description" in data:
-    #             self.description = data["description"]
-    #         if "available" in data:
-    #             if isinstance(data["available"], bool):
-    #                 self.available = data["available"]
-    #             else:
-    #                 raise DataValidationError(
-    #                     "Invalid type for boolean [available]: "
-    #                     + str(type(data["available"]))
-    #                 )
-    #         if "image_url" in data:
-    #             self.image_url = data["image_url"]
-    #         if "category" in data:
-    #             self.category = getattr(
-    #                 Category, data["category"]
-    #             )  # create enum from string
-    #     except AttributeError as error:
-    #         raise DataValidationError("Invalid attribute: " + error.args[0]) from error
-    #     return self
-
-    @classmethod
-    def init_db(cls, app):
-        """Initializes the database session"""
+    @classmethod
+    def set_availability(cls, by_id, available: bool = None):
+        """
+        Sets the availability of the Product with the id, or flips it
+
+        This is a single atomic ``UPDATE ... SET available = NOT available
+        RETURNING ...`` (or ``SET available = :available``), so concurrent
+        changes cannot overwrite each other.
+
+        :param by_id: the id of the Product to change
+        :type by_id: int
+        :param available: the new availability, None to flip the current one
+        :type available: bool
+
+        :return: the serialized updated Product, or None if not found
+        :rtype: dict
+
+        """
+        logger.info("Processing availability change for id %s ...", by_id)
+        value = db.not_(cls.available) if available is None else available
+        return cls._update_returning(by_id, {"available": value})
+
+    def deserialize_update(self, data):
+        """
+        Deserializes a Product from a dictionary
+
+        Args:
+            data (dict): A dictionary containing the resource data
+            it only contain keys of fields to be updated
+        """
+        for key, value in self.validate(data, partial=True).items():
+            setattr(self, key, value)
+        return self
+
+    @classmethod
+    def patch(cls, by_id, data):
+        """
+        Updates only the fields present in data of the Product with the id
+
+        The Product is not read first: a single
+        ``UPDATE ... SET <fields> WHERE id = :id RETURNING ...`` both writes the
+        change and returns the updated Product.
+
+        :param by_id: the id of the Product to update
+        :type by_id: int
+        :param data: A dictionary with the fields to change
+        :type data: dict
+
+        :return: the serialized updated Product, or None if not found
+        :rtype: dict
+
+        """
+        logger.info("Processing partial update for id %s ...", by_id)
+        return cls._update_returning(by_id, cls.validate(data, partial=True))
+
+    @classmethod
+    def _update_returning(cls, by_id, values: dict):
+        """Updates the Product with the id in one statement and returns it serialized"""
+        try:
+            by_id = int(by_id)
+        except (TypeError, ValueError):
+            return None
+        row = db.session.execute(
+            db.update(cls)
+            .where(cls.id == by_id)
+            .values(**values)
+            .returning(*cls.serialized_columns()),
+            execution_options={"synchronize_session": False},
+        ).first()
+        db.session.commit()
+        if row is None:
+            return None
+        cache.product_cache.delete(by_id)
+        return cls.serialize_row(row)
+
+    @classmethod
+    def init_db(cls, app, create_schema=True):
+        """Initializes the database session
+
+        The engine connects on first use, so without create_schema this does
+        not touch the database at all.
+        """
         logger.info("Initializing database")
         cls.app = app
+        _trigrams.clear()
+        init_pool(app)
+        replicas.configure(app)
         # This is where we initialize SQLAlchemy from the Flask app
         db.init_app(app)
         app.app_context().push()
-        db.create_all()  # make our sqlalchemy tables
+        if create_schema:
+            db.create_all()  # make our sqlalchemy tables
 
     @classmethod
     def all(cls):
@@ -198,12 +356,224 @@ class Product(db.Model):
         logger.info("Processing all Product")
         return cls.query.all()
 
+    @classmethod
+    def find_page(  # pylint: disable=too-many-arguments
+        cls,
+        query=None,
+        after_id: int = None,
+        limit: int = 100,
+        rows: bool = False,
+        *,
+        sort: str = "id",
+        descending: bool = False,
+        after_key=None,
+        fields: tuple = None,
+    ) -> list:
+        """Returns one page of Products using keyset pagination
+
+        The page is read with ``WHERE id > :after_id ORDER BY id LIMIT :limit``
+        so every page costs the same primary key index scan as the first one.
+        Sorted by another column the page is read with
+        ``WHERE (column, id) > (:after_key, :after_id) ORDER BY column, id``
+        instead, which the ``(column, id)`` indexes serve the same way. Missing
+        values come last in ascending order and first in descending order, and
+        are read by a second range scan when a page reaches them.
+        With ``rows`` the SERIALIZED_FIELDS columns (or only the ``fields``
+        ones) are returned as plain rows for serialize_row() and no Product
+        objects are created.
+
+        :param query: an optional filtered query to paginate (defaults to all Products)
+        :type query: Query
+        :param after_id: the id of the last Product on the previous page
+        :type after_id: int
+        :param limit: the maximum number of Products to return
+        :type limit: int
+        :param rows: True to return rows instead of Products
+        :type rows: bool
+        :param sort: the column to sort by, one of SORT_FIELDS
+        :type sort: str
+        :param descending: True to sort from the highest value down
+        :type descending: bool
+        :param after_key: the sort column value of the last Product on the previous page
+        :type after_key: any
+        :param fields: the columns of the rows, a subset of SERIALIZED_FIELDS
+        :type fields: tuple
+
+        :return: a list of Products (or rows) ordered by the sort column then id
+        :rtype: list
+
+        """
+        logger.info(
+            "Processing page query sorted by %s after (%s, %s) (limit %s) ...",
+            sort, after_key, after_id, limit,
+        )
+        if sort not in cls.SORT_FIELDS:
+            raise DataValidationError(f"Invalid sort: {sort}")
+        if query is None:
+            query = cls.query
+        if rows:
+            query = query.with_entities(*cls.serialized_columns(fields))
+        order = [cls.id.desc() if descending else cls.id]
+        if sort != "id":
+            column = getattr(cls, sort)
+            order.insert(0, column.desc().nulls_first() if descending else column.nulls_last())
+        if after_id is None:
+            return query.order_by(*order).limit(limit).all()
+        page = []
+        for condition in cls._keyset_ranges(sort, descending, after_key, after_id):
+            page += query.filter(condition).order_by(*order).limit(limit - len(page)).all()
+            if len(page) >= limit:
+                break
+        return page
+
+    @classmethod
+    def _keyset_ranges(cls, sort: str, descending: bool, after_key, after_id: int) -> list:
+        """Returns the conditions of the index ranges after (after_key, after_id), in order
+
+        Each condition is a single range of the ``(column, id)`` index. A
+        nullable column needs two of them because its missing values are sorted
+        apart from the others.
+        """
+        if sort == "id":
+            return [cls.id < after_id if descending else cls.id > after_id]
+        column = getattr(cls, sort)
+        if after_key is None:
+            # the previous page ended in the missing values
+            if descending:
+                return [db.and_(column.is_(None), cls.id < after_id), column.isnot(None)]
+            return [db.and_(column.is_(None), cls.id > after_id)]
+        expected = (int, float) if sort == "price" else str
+        if not isinstance(after_key, expected) or isinstance(after_key, bool):
+            raise DataValidationError(f"Invalid cursor key: {after_key}")
+        if sort == "category":
+            try:
+                after_key = Category[after_key]
+            except KeyError as error:
+                raise DataValidationError(f"Invalid cursor key: {after_key}") from error
+        if descending:
+            return [db.tuple_(column, cls.id) < (after_key, after_id)]
+        ranges = [db.tuple_(column, cls.id) > (after_key, after_id)]
+        if cls.__table__.c[sort].nullable:
+            ranges.append(column.is_(None))
+        return ranges
+
+    @classmethod
+    def stream_all(cls, batch_size: int = 1000, rows: bool = False, fields: tuple = None):
+        """Yields all of the Products ordered by id without loading them at once
+
+        Rows are read through a server-side cursor (``yield_per``) so only
+        ``batch_size`` Products are held in memory at any time. With ``rows``
+        the SERIALIZED_FIELDS columns (or only the ``fields`` ones) are yielded
+        for serialize_row() instead.
+
+        :param batch_size: the number of rows to fetch per round trip
+        :type batch_size: int
+        :param rows: True to yield rows instead of Products
+        :type rows: bool
+        :param fields: the columns of the rows, a subset of SERIALIZED_FIELDS
+        :type fields: tuple
+
+        :return: a generator of Products (or rows)
+        :rtype: generator
+
+        """
+        logger.info("Processing streamed export of all Products ...")
+        if rows:
+            statement = db.select(*cls.serialized_columns(fields))
+        else:
+            statement = db.select(cls)
+        statement = statement.order_by(cls.id).execution_options(yield_per=batch_size)
+        if rows:
+            yield from db.session.execute(statement)
+        else:
+            yield from db.session.scalars(statement)
+
     @classmethod
     def find(cls, by_id):
         """Finds a Product by it's ID"""
         logger.info("Processing lookup for id %s ...", by_id)
         return cls.query.get(by_id)
 
+    @classmethod
+    def find_for_update(cls, by_id):
+        """Finds a Product by it's ID and locks the row until the next commit"""
+        logger.info("Processing lookup for update for id %s ...", by_id)
+        return db.session.get(cls, by_id, with_for_update=True, populate_existing=True)
+
+    @classmethod
+    def find_cached(cls, by_id):
+        """Returns the serialized Product with the id, reading through the cache
+
+        :param by_id: the id of the Product to find
+        :type by_id: int
+
+        :return: the serialized Product, or None if not found
+        :rtype: dict
+
+        """
+        return cls.find_cached_etag(by_id)[0]
+
+    @classmethod
+    def find_cached_etag(cls, by_id):
+        """Returns the serialized Product with the id and its ETag, reading through the cache
+
+        The ETag is computed once when the Product is cached and stored with it,
+        so a conditional read of a cached Product does not serialize anything.
+
+        :param by_id: the id of the Product to find
+        :type by_id: int
+
+        :return: the serialized Product and its ETag, or (None, None) if not found
+        :rtype: tuple
+
+        """
+        try:
+            by_id = int(by_id)
+        except (TypeError, ValueError):
+            return None, None
+        entry = cache.product_cache.get(by_id)
+        if entry is None:
+            # read the primary, a lagging replica would cache an old Product
+            with replicas.use_primary():
+                product = cls.find(by_id)
+            if product is None:
+                return None, None
+            entry = cls._cache_entry(product.serialize())
+            cache.product_cache.set(by_id, entry)
+        return entry["product"], entry["etag"]
+
+    @classmethod
+    def _cache_entry(cls, data: dict) -> dict:
+        """Returns what the cache keeps for a serialized Product"""
+        return {"product": data, "etag": cls.etag(data)}
+
+    @classmethod
+    def find_many_cached(cls, ids: list) -> dict:
+        """Returns the serialized Products with the ids, reading through the cache
+
+        Products that are not cached are all read with a single
+        ``WHERE id IN (...)`` query and then cached.
+
+        :param ids: the ids of the Products to find
+        :type ids: list
+
+        :return: the serialized Products by id, without the ids that were not found
+        :rtype: dict
+
+        """
+        logger.info("Processing lookup for %s ids ...", len(ids))
+        found = {by_id: entry["product"] for by_id, entry in cache.product_cache.get_many(ids).items()}
+        missing = [by_id for by_id in ids if by_id not in found]
+        if missing:
+            with replicas.use_primary():
+                rows = db.session.execute(
+                    db.select(*cls.serialized_columns()).where(cls.id.in_(missing))
+                ).all()
+            loaded = {row.id: cls.serialize_row(row) for row in rows}
+            cache.product_cache.set_many({by_id: cls._cache_entry(data) for by_id, data in loaded.items()})
+            found.update(loaded)
+        return found
+
     @classmethod
     def find_or_404(cls, product_id: int):
         """Find a Product by it's id
@@ -257,23 +627,407 @@ class Product(db.Model):
         return cls.query.filter(cls.category == category)
 
     @classmethod
-    def create_multiple_products(cls, products_data):
+    def find_by_filters(  # pylint: disable=too-many-arguments
+        cls,
+        *,
+        category=None,
+        name: str = None,
+        available: bool = None,
+        min_price: float = None,
+        max_price: float = None,
+        ids: list = None,
+    ):
+        """Returns all Products matching every one of the given filters
+
+        Filters that are None are ignored and the rest are ANDed together into
+        a single SQL statement.
+
+        :param category: the category of the Products (enum or enum name)
+        :type category: Category or str
+        :param name: the exact name of the Products
+        :type name: str
+        :param available: True for products that are available
+        :type available: bool
+        :param min_price: the lowest price (inclusive)
+        :type min_price: float
+        :param max_price: the highest price (inclusive)
+        :type max_price: float
+        :param ids: only return Products with one of these ids
+        :type ids: list
+
+        :return: a query of the matching Products
+        :rtype: Query
+
         """
-        Adds multiple products to the database.
-        :param products_data: List of dictionaries, where each dictionary contains data for one product.
+        logger.info(
+            "Processing filter query for category=%s name=%s available=%s "
+            "price=[%s, %s] ids=%s ...",
+            category, name, available, min_price, max_price, ids,
+        )
+        query = cls.query
+        if category is not None:
+            if isinstance(category, str):
+                try:
+                    category = Category[category]
+                except KeyError as error:
+                    raise DataValidationError(f"Invalid category: {category}") from error
+            query = query.filter(cls.category == category)
+        if name is not None:
+            query = query.filter(cls.name == name)
+        if available is not None:
+            query = query.filter(cls.available == available)
+        if min_price is not None:
+            query = query.filter(cls.price >= min_price)
+        if max_price is not None:
+            query = query.filter(cls.price <= max_price)
+        if ids is not None:
+            query = query.filter(cls.id.in_(ids))
+        return query
+
+    @classmethod
+    def search(cls, text: str, query=None):
+        """Returns the Products whose name or description match a search, best first
+
+        Every word of the text must match a word of the Product or the start of
+        one, so results show up while the user is still typing. On PostgreSQL
+        the words become a prefix ``tsquery`` that is answered from the GIN
+        index and ranked with ``ts_rank``, with names starting with the text
+        ranked first. Where the pg_trgm index exists, names similar to the
+        text (``%>``, e.g. with a typo) match too and rank after the full-text
+        matches by ``word_similarity``. Other databases fall back to case
+        insensitive ``LIKE``.
+
+        :param text: the words to search for
+        :type text: str
+        :param query: an optional filtered query to search in (defaults to all Products)
+        :type query: Query
+
+        :return: a query of the matching Products ordered by relevance then id
+        :rtype: Query
+
         """
-        products = []
-        for data in products_data:
-            product = cls(
-                name=data["name"],
-                description=data.get("description", None),
-                price=data["price"],
-                available=data["available"],
-                image_url=data.get("image_url", None),
-                category=data.get("category", None),
+        logger.info("Processing search query for %s ...", text)
+        words = re.findall(r"\w+", text.lower())
+        if not words:
+            raise DataValidationError(f"Invalid search: {text}")
+        if query is None:
+            query = cls.query
+        pattern = " ".join(words).replace("_", "\\_")
+        name_first = db.case((db.func.lower(cls.name).like(pattern + "%", escape="\\"), 1), else_=0)
+        if db.engine.dialect.name == "postgresql":
+            document = db.literal_column(SEARCH_DOCUMENT)
+            terms = db.func.to_tsquery("english", " & ".join(word + ":*" for word in words))
+            matches, ranks = document.op("@@")(terms), [db.func.ts_rank(document, terms).desc()]
+            if cls.has_trigrams():
+                # names that are close to the text also match, after the full-text matches
+                name = db.literal_column(TRIGRAM_DOCUMENT)
+                matches = db.or_(matches, name.op("%>")(" ".join(words)))
+                ranks.append(db.func.word_similarity(" ".join(words), name).desc())
+            return query.filter(matches).order_by(name_first.desc(), *ranks, cls.id)
+        for word in words:
+            like = "%" + word.replace("_", "\\_") + "%"
+            query = query.filter(
+                db.or_(
+                    db.func.lower(cls.name).like(like, escape="\\"),
+                    db.func.lower(cls.description).like(like, escape="\\"),
+                )
             )
-            products.append(product)
+        return query.order_by(name_first.desc(), cls.id)
+
+    @classmethod
+    def has_trigrams(cls) -> bool:
+        """Tells if the PostgreSQL database has the trigram index for typo tolerant search"""
+        if "index" not in _trigrams:
+            # a select (not a text clause) so that replicas route it as a read
+            _trigrams["index"] = bool(db.session.scalar(db.select(db.func.to_regclass(TRIGRAM_INDEX).isnot(None))))
+        return _trigrams["index"]
+
+    @classmethod
+    def aggregate(cls, query=None, group_by=()) -> list:
+        """Returns counts and price statistics of Products computed with GROUP BY
 
-        db.session.add_all(products)
+        :param query: an optional filtered query to aggregate (defaults to all Products)
+        :type query: Query
+        :param group_by: the names of the AGGREGATE_DIMENSIONS to group by, none for a single total
+        :type group_by: list
+
+        :return: one dictionary per group with its dimensions, ``count``,
+                 ``available_count``, ``available_ratio`` and the ``min_price``,
+                 ``max_price`` and ``avg_price``
+        :rtype: list
+
+        """
+        logger.info("Processing aggregate query grouped by %s ...", group_by)
+        for name in group_by:
+            if name not in cls.AGGREGATE_DIMENSIONS:
+                raise DataValidationError(f"Invalid dimension: {name}")
+        if query is None:
+            query = cls.query
+        dimensions = [getattr(cls, name) for name in group_by]
+        rows = (
+            query.with_entities(
+                *dimensions,
+                db.func.count(cls.id),
+                db.func.sum(db.case((cls.available, 1), else_=0)),
+                db.func.min(cls.price),
+                db.func.max(cls.price),
+                db.func.avg(cls.price),
+            )
+            .group_by(*dimensions)
+            .order_by(*dimensions)
+            .all()
+        )
+        groups = []
+        for row in rows:
+            group = dict(zip(group_by, row))
+            if "category" in group and group["category"] is not None:
+                group["category"] = group["category"].name  # convert enum to string
+            count, available, min_price, max_price, avg_price = row[len(group_by):]
+            group.update(
+                count=count,
+                available_count=int(available or 0),
+                available_ratio=round((available or 0) / count, 4) if count else 0.0,
+                min_price=min_price,
+                max_price=max_price,
+                avg_price=None if avg_price is None else round(float(avg_price), 2),
+            )
+            groups.append(group)
+        return groups
+
+    @classmethod
+    def create_multiple_products(cls, products_data: list, chunk_size: int = 1000) -> list:
+        """
+        Adds multiple products to the database, all of them or none
+
+        Every row is validated up front, then the rows are inserted with
+        executemany ``INSERT ... RETURNING id`` a chunk at a time in a single
+        transaction and the new Products are read back in the posted order.
+
+        :param products_data: List of dictionaries, where each dictionary contains data for one product.
+        :param chunk_size: the number of rows inserted per statement
+
+        :raises DataValidationError: when any of the rows is not valid
+        """
+        rows, _, errors = cls._validate_rows(products_data)
+        if errors:
+            raise DataValidationError(f"Product at index {errors[0]['index']}: {errors[0]['message']}")
+        new_ids = []
+        for start in range(0, len(rows), chunk_size):
+            # ids from the sequence are handed out in row order
+            new_ids.extend(sorted(db.session.scalars(db.insert(cls).returning(cls.id), rows[start:start + chunk_size])))
         db.session.commit()
+        products = []
+        for start in range(0, len(new_ids), chunk_size):
+            chunk = new_ids[start:start + chunk_size]
+            products.extend(db.session.scalars(db.select(cls).where(cls.id.in_(chunk)).order_by(cls.id)))
         return products
+
+    @classmethod
+    def _validate_rows(cls, products_data: list, partial: bool = False, with_id: bool = False):
+        """Validates many rows, returning the valid ones with their indexes and the errors"""
+        rows, indexes, errors = [], [], []
+        for index, data in enumerate(products_data):
+            try:
+                row = cls.validate(data, partial)
+                if with_id:
+                    # ids are handed out as strings by the API, so take both
+                    product_id = data.get("id")
+                    if isinstance(product_id, str) and product_id.isdigit():
+                        product_id = int(product_id)
+                    if not isinstance(product_id, int) or isinstance(product_id, bool):
+                        raise DataValidationError("Invalid Product: bad or missing id")
+                    row["id"] = product_id
+                rows.append(row)
+                indexes.append(index)
+            except DataValidationError as error:
+                errors.append({"index": index, "message": str(error)})
+        return rows, indexes, errors
+
+    @classmethod
+    def bulk_create(cls, products_data: list, chunk_size: int = 1000):
+        """
+        Inserts many Products without building an ORM object for each one
+
+        Every row is validated up front and the valid ones are inserted with a
+        single executemany ``INSERT ... RETURNING id`` per chunk, each chunk in
+        its own transaction. Bad rows are reported instead of failing the batch.
+
+        :param products_data: List of dictionaries, one for each Product
+        :type products_data: list
+        :param chunk_size: the number of rows inserted per statement
+        :type chunk_size: int
+
+        :return: the new ids aligned with products_data (None for rows that
+                 failed) and a list of {"index", "message"} errors
+        :rtype: tuple
+
+        """
+        logger.info("Processing bulk insert of %s Products ...", len(products_data))
+        ids = [None] * len(products_data)
+        rows, indexes, errors = cls._validate_rows(products_data)
+        new_ids = cls._write_in_chunks(cls._insert_chunk, rows, indexes, chunk_size, errors)
+        for index, new_id in zip(indexes, new_ids):
+            ids[index] = new_id
+
+        errors.sort(key=lambda error: error["index"])
+        return ids, errors
+
+    @classmethod
+    def _insert_chunk(cls, rows: list) -> list:
+        """Inserts rows in one statement and transaction and returns their new ids"""
+        # ids from the sequence are handed out in row order
+        new_ids = sorted(db.session.scalars(db.insert(cls).returning(cls.id), rows))
+        db.session.commit()
+        return new_ids
+
+    @classmethod
+    def bulk_update(cls, products_data: list, chunk_size: int = 1000, partial: bool = False):
+        """
+        Updates many Products, each one with its own values
+
+        Every row needs the id of the Product to update. Valid rows are written
+        with one executemany ``UPDATE ... WHERE id = :id`` per chunk, each chunk
+        in its own transaction, after locking the rows of the chunk that exist.
+
+        :param products_data: List of dictionaries, one for each Product
+        :type products_data: list
+        :param chunk_size: the number of rows updated per transaction
+        :type chunk_size: int
+        :param partial: True to only update the fields present in each row
+        :type partial: bool
+
+        :return: the number of Products updated, the ids that were not found
+                 and a list of {"index", "message"} errors
+        :rtype: tuple
+
+        """
+        logger.info("Processing bulk update of %s Products ...", len(products_data))
+        rows, indexes, errors = cls._validate_rows(products_data, partial=partial, with_id=True)
+        found = cls._write_in_chunks(cls._update_chunk, rows, indexes, chunk_size, errors)
+        updated = sum(1 for was_found in found if was_found)
+        missing = [row["id"] for row, was_found in zip(rows, found) if was_found is False]
+
+        errors.sort(key=lambda error: error["index"])
+        return updated, missing, errors
+
+    @classmethod
+    def _update_chunk(cls, rows: list) -> list:
+        """Updates rows in one transaction and returns whether each one was found"""
+        found = set(
+            db.session.scalars(
+                db.select(cls.id).where(cls.id.in_([row["id"] for row in rows])).with_for_update()
+            )
+        )
+        if found:
+            db.session.execute(db.update(cls), [row for row in rows if row["id"] in found])
+        db.session.commit()
+        cache.product_cache.delete(*found)
+        return [row["id"] in found for row in rows]
+
+    @classmethod
+    def _write_in_chunks(cls, write, rows: list, indexes: list, chunk_size: int, errors: list) -> list:
+        """Writes validated rows a chunk at a time and returns what write() returned for each row
+
+        write() handles one chunk in its own transaction. When the database
+        rejects a chunk its rows are written again one at a time, so that only
+        the bad rows are reported in errors (with their None results).
+        """
+        results = []
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            try:
+                results.extend(write(chunk))
+                continue
+            except SQLAlchemyError as error:
+                db.session.rollback()
+                logger.error("Chunk at row %s was rejected, retrying its rows one at a time: %s", start, error)
+            for index, row in zip(indexes[start:start + chunk_size], chunk):
+                try:
+                    results.extend(write([row]))
+                except SQLAlchemyError as error:
+                    db.session.rollback()
+                    results.append(None)
+                    message = f"Invalid Product: rejected by the database ({type(error).__name__})"
+                    errors.append({"index": index, "message": message})
+        return results
+
+    @classmethod
+    def update_where(cls, query, values: dict, chunk_size: int = 1000) -> int:
+        """
+        Sets the same values on every Product of a query
+
+        :param query: the filtered query of the Products to update
+        :type query: Query
+        :param values: the validated column values to set
+        :type values: dict
+        :param chunk_size: the number of rows updated per transaction
+        :type chunk_size: int
+
+        :return: the number of Products updated
+        :rtype: int
+
+        """
+        logger.info("Processing filtered bulk update of %s ...", values)
+        return cls._change_in_chunks(query, db.update(cls).values(**values), chunk_size)
+
+    @classmethod
+    def delete_where(cls, query, chunk_size: int = 1000) -> int:
+        """
+        Deletes every Product of a query
+
+        :param query: the filtered query of the Products to delete
+        :type query: Query
+        :param chunk_size: the number of rows deleted per transaction
+        :type chunk_size: int
+
+        :return: the number of Products deleted
+        :rtype: int
+
+        """
+        logger.info("Processing filtered bulk delete ...")
+        return cls._change_in_chunks(query, db.delete(cls), chunk_size)
+
+    @classmethod
+    def _change_in_chunks(cls, query, statement, chunk_size: int) -> int:
+        """Runs an UPDATE or DELETE over the Products of a query, a chunk at a time
+
+        Each chunk is a single ``... WHERE id IN (SELECT id ... ORDER BY id
+        LIMIT :chunk_size) RETURNING id`` statement in its own transaction,
+        followed by one cache invalidation for all of the returned ids.
+        """
+        changed, last_id = 0, None
+        while True:
+            chunk_query = query.with_entities(cls.id)
+            if last_id is not None:
+                chunk_query = chunk_query.filter(cls.id > last_id)
+            chunk = chunk_query.order_by(cls.id).limit(chunk_size).subquery()
+            ids = db.session.scalars(
+                statement.where(cls.id.in_(db.select(chunk.c.id))).returning(cls.id),
+                execution_options={"synchronize_session": False},
+            ).all()
+            db.session.commit()
+            if not ids:
+                return changed
+            cache.product_cache.delete(*ids)
+            changed += len(ids)
+            last_id = max(ids)
+
+
+# create_all() adds the trigram index where the server has pg_trgm, and goes
+# on without it elsewhere
+event.listen(
+    Product.__table__,
+    "after_create",
+    DDL(
+        f"""
+        DO $$
+        BEGIN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} ON product USING gin ({TRIGRAM_DOCUMENT} gin_trgm_ops);
+        EXCEPTION WHEN OTHERS THEN
+            RAISE NOTICE 'pg_trgm is not available, the search does not tolerate typos';
+        END
+        $$
+        """
+    ).execute_if(dialect="postgresql"),
+)
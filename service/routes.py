@@ -3,10 +3,22 @@ My Service
 
 Describe what your service does here
 """
-
+# pylint: disable=too-many-lines
+import io
+import csv
+from flask import request, Response, stream_with_context
 from flask_restx import Resource, fields, reqparse, inputs
 from service.common import status  # HTTP Status Codes
-from service.models import Product, Category
+from service.common import cache, compression, metrics, profiling, replicas
+from service.common.pool import pool_stats
+from service.common.pagination import (
+    encode_cursor,
+    decode_sort_cursor,
+    encode_offset_cursor,
+    decode_offset_cursor,
+)
+from service.common.serialization import ModelSerializer, json_response, dumps, etag_of
+from service.models import Product, Category, DataValidationError, db
 
 # Import Flask application
 from . import app, api
@@ -21,6 +33,60 @@ def health():
     return {"status": "OK"}, status.HTTP_200_OK
 
 
+############################################################
+# Statistics Endpoint
+############################################################
+@app.route("/stats")
+def stats():
+    """Operational statistics of this worker"""
+    return {
+        "cache": cache.product_cache.stats(),
+        "pool": pool_stats(db.engine),
+        "replicas": replicas.stats(),
+    }, status.HTTP_200_OK
+
+
+############################################################
+# Metrics Endpoint
+############################################################
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus metrics of every worker"""
+    if not metrics.enabled():
+        abort(status.HTTP_404_NOT_FOUND, "Metrics are not enabled")
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
+############################################################
+# SQL Profiling Endpoint
+############################################################
+@app.route("/profiling", methods=["GET"])
+def get_profiling():
+    """SQL profiling settings and the profiles of the last requests of this worker"""
+    return {
+        "settings": profiling.settings(app),
+        "requests": list(profiling.recent_profiles),
+    }, status.HTTP_200_OK
+
+
+@app.route("/profiling", methods=["PUT"])
+def update_profiling():
+    """Turns SQL profiling on or off and changes its thresholds in this worker"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data:
+        raise DataValidationError("Invalid request: body must be an object of profiling settings")
+    for name, value in data.items():
+        if name == "enabled":
+            valid = isinstance(value, bool)
+        else:
+            valid = isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+        if name not in profiling.SETTINGS or not valid:
+            raise DataValidationError(f"Invalid setting: {name}")
+    app.logger.info("SQL profiling changed to %s", data)
+    return profiling.configure(app, **data), status.HTTP_200_OK
+
+
 ######################################################################
 # GET INDEX
 ######################################################################
@@ -104,6 +170,112 @@ product_model = api.inherit(
     },
 )
 
+# serializes a Product the way marshal(product_model) would, in a single pass
+serialize_product = ModelSerializer(product_model)
+
+
+bulk_error_model = api.model(
+    "BulkError",
+    {
+        "index": fields.Integer(description="The position of the row in the request"),
+        "message": fields.String(description="Why the row was rejected"),
+    },
+)
+
+bulk_result_model = api.model(
+    "BulkResult",
+    {
+        "created": fields.Integer(description="The number of Products created"),
+        "ids": fields.List(
+            fields.Integer,
+            description="The new ids in request order (null for rejected rows)",
+        ),
+        "errors": fields.List(fields.Nested(bulk_error_model)),
+    },
+)
+
+
+bulk_update_result_model = api.model(
+    "BulkUpdateResult",
+    {
+        "updated": fields.Integer(description="The number of Products updated"),
+        "missing": fields.List(
+            fields.Integer, description="The posted ids that did not match a Product"
+        ),
+        "errors": fields.List(fields.Nested(bulk_error_model)),
+    },
+)
+
+bulk_delete_result_model = api.model(
+    "BulkDeleteResult",
+    {
+        "deleted": fields.Integer(description="The number of Products deleted"),
+    },
+)
+
+availability_model = api.model(
+    "Availability",
+    {
+        "available": fields.Boolean(
+            description="The new availability (the current one is flipped when missing)"
+        ),
+    },
+)
+
+aggregate_model = api.model(
+    "Aggregate",
+    {
+        "category": fields.String(description="The category of the group (when grouped by category)"),
+        "available": fields.Boolean(description="The availability of the group (when grouped by available)"),
+        "count": fields.Integer(description="The number of Products"),
+        "available_count": fields.Integer(description="The number of available Products"),
+        "available_ratio": fields.Float(description="The share of available Products"),
+        "min_price": fields.Float(description="The lowest price"),
+        "max_price": fields.Float(description="The highest price"),
+        "avg_price": fields.Float(description="The average price"),
+    },
+)
+
+bulk_availability_result_model = api.model(
+    "BulkAvailabilityResult",
+    {
+        "updated": fields.Integer(description="The number of Products changed"),
+    },
+)
+
+batch_get_model = api.model(
+    "BatchGet",
+    {
+        "ids": fields.List(
+            fields.Integer, required=True, description="The ids of the Products to read"
+        ),
+    },
+)
+
+batch_get_result_model = api.model(
+    "BatchGetResult",
+    {
+        "products": fields.List(
+            fields.Nested(product_model),
+            description="The Products that were found, in request order",
+        ),
+        "missing": fields.List(
+            fields.Integer, description="The requested ids that were not found"
+        ),
+    },
+)
+
+
+def id_list(value: str) -> list:
+    """Parses a comma separated list of Product ids"""
+    return [int(product_id) for product_id in value.split(",") if product_id.strip()]
+
+
+def name_list(value: str) -> list:
+    """Parses a comma separated list of names"""
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
 # query string arguments
 product_args = reqparse.RequestParser()
 product_args.add_argument(
@@ -119,6 +291,130 @@ product_args.add_argument(
     required=False,
     help="List Products by availability",
 )
+product_args.add_argument(
+    "min_price",
+    type=float,
+    location="args",
+    required=False,
+    help="List Products costing at least this price",
+)
+product_args.add_argument(
+    "max_price",
+    type=float,
+    location="args",
+    required=False,
+    help="List Products costing at most this price",
+)
+product_args.add_argument(
+    "ids",
+    type=id_list,
+    location="args",
+    required=False,
+    help="List Products with one of these comma separated ids",
+)
+product_args.add_argument(
+    "limit",
+    type=inputs.positive,
+    location="args",
+    required=False,
+    help="Maximum number of Products per page (capped by the server)",
+)
+product_args.add_argument(
+    "cursor",
+    type=str,
+    location="args",
+    required=False,
+    help="Opaque cursor taken from the Link rel=\"next\" header of the previous page",
+)
+product_args.add_argument(
+    "fields",
+    type=name_list,
+    location="args",
+    required=False,
+    help="Comma separated Product fields to return (all of them by default)",
+)
+product_args.add_argument(
+    "sort",
+    type=str,
+    location="args",
+    required=False,
+    default="id",
+    choices=Product.SORT_FIELDS,
+    help="Column to sort the Products by: id (default), name, price or category",
+)
+product_args.add_argument(
+    "order",
+    type=str,
+    location="args",
+    required=False,
+    default="asc",
+    choices=("asc", "desc"),
+    help="Sort order: asc (default) or desc",
+)
+
+# query string arguments that filter the listing (all of them are ANDed)
+FILTER_ARGS = ("category", "name", "available", "min_price", "max_price", "ids")
+
+# query string arguments for the search: the listing filters plus the text
+search_args = product_args.copy()
+search_args.remove_argument("sort")
+search_args.remove_argument("order")
+search_args.add_argument(
+    "q",
+    type=str,
+    location="args",
+    required=True,
+    help="Words to search for in the name and description of the Products",
+)
+
+# query string arguments that choose the Products changed by a bulk update or delete
+bulk_args = product_args.copy()
+for argument in ("limit", "cursor", "sort", "order", "fields"):
+    bulk_args.remove_argument(argument)
+bulk_args.add_argument(
+    "all",
+    type=inputs.boolean,
+    location="args",
+    required=False,
+    default=False,
+    help="Must be true to change every Product when no filter is given",
+)
+
+# query string arguments for the aggregates: the listing filters plus the grouping
+aggregate_args = product_args.copy()
+for argument in ("limit", "cursor", "sort", "order", "fields"):
+    aggregate_args.remove_argument(argument)
+aggregate_args.add_argument(
+    "group_by",
+    type=name_list,
+    location="args",
+    required=False,
+    default=[],
+    help="Comma separated dimensions to group by: category, available (none for a single total)",
+)
+
+# query string arguments for reading a single Product
+read_args = reqparse.RequestParser()
+read_args.add_argument(
+    "fields",
+    type=name_list,
+    location="args",
+    required=False,
+    help="Comma separated Product fields to return (all of them by default)",
+)
+
+# query string arguments for the export
+export_args = read_args.copy()
+export_args.add_argument(
+    "format",
+    type=str,
+    location="args",
+    required=False,
+    default="ndjson",
+    choices=("ndjson", "csv"),
+    help="Export format: ndjson (default) or csv",
+)
+
 ######################################################################
 #  R E S T   A P I   E N D P O I N T S
 ######################################################################
@@ -136,6 +432,7 @@ class ProductResource(Resource):
     Allows the manipulation of a single Product
     GET /product{id} - Returns a Product with the id
     PUT /product{id} - Update a Product with the id
+    PATCH /product{id} - Update some fields of a Product with the id
     DELETE /product{id} -  Deletes a Product with the id
     """
 
@@ -143,19 +440,36 @@ class ProductResource(Resource):
     # RETRIEVE A PRODUCT
     # ------------------------------------------------------------------
     @api.doc("get_products")
+    @api.expect(read_args)
     @api.response(404, "Product not found")
-    @api.marshal_with(product_model)
+    @api.response(304, "Product not modified since the ETag in If-None-Match")
+    @api.header("ETag", "Strong entity tag of the Product")
+    @api.response(200, "Success", product_model)
     def get(self, product_id):
         """
         Retrieve a single Product
 
-        This endpoint will return a Product based on it's id
+        This endpoint will return a Product based on it's id. Products are
+        served from the read-through cache when they are in it. A request whose
+        If-None-Match matches the current ETag gets an empty 304 response. Use
+        ``fields`` to only return some fields, e.g. ``fields=id,name,price``;
+        the whole row is still read (and cached), only the output is trimmed.
         """
         app.logger.info("Request to Retrieve a product with id [%s]", product_id)
-        product = Product.find(product_id)
-        if not product:
+        names = requested_fields(read_args.parse_args()["fields"])
+        # the ETag of the whole Product is kept in the cache with it
+        data, etag = Product.find_cached_etag(product_id)
+        if not data:
             abort(status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found.")
-        return product.serialize(), status.HTTP_200_OK
+        body = None
+        if names:
+            with metrics.timed("serialization_seconds"):
+                body = dumps(serialize_product.only(names)(data))
+            etag = etag_of(body)
+        headers = {"ETag": quote_etag(etag)}
+        if etag_matches(request.if_none_match, etag):
+            return json_response(None, status.HTTP_304_NOT_MODIFIED, headers)
+        return json_response(body or serialize_product(data), status.HTTP_200_OK, headers)
 
     # ------------------------------------------------------------------
     # UPDATE AN EXISTING PRODUCT
@@ -163,16 +477,20 @@ class ProductResource(Resource):
     @api.doc("update_products")
     @api.response(404, "Product not found")
     @api.response(400, "The posted Product data was not valid")
+    @api.response(412, "The Product changed since the ETag in If-Match")
+    @api.header("ETag", "Strong entity tag of the updated Product")
     @api.expect(product_model)
-    @api.marshal_with(product_model)
+    @api.response(200, "Success", product_model)
     def put(self, product_id):
         """
         Update a Product
 
-        This endpoint will update a Product based the body that is posted
+        This endpoint will update a Product based the body that is posted.
+        Send the ETag of the Product in If-Match to only update it if nobody
+        else has changed it in the meantime.
         """
         app.logger.info("Request to Update a product with id [%s]", product_id)
-        product = Product.find(product_id)
+        product = find_for_write(product_id)
         if not product:
             abort(status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found.")
         app.logger.debug("Payload = %s", api.payload)
@@ -180,21 +498,57 @@ class ProductResource(Resource):
         product.deserialize(data)
         product.id = product_id
         product.update()
-        return product.serialize(), status.HTTP_200_OK
+        data = product.serialize()
+        return json_response(
+            serialize_product(data), status.HTTP_200_OK, {"ETag": quote_etag(Product.etag(data))}
+        )
+
+    # ------------------------------------------------------------------
+    # UPDATE SOME FIELDS OF AN EXISTING PRODUCT
+    # ------------------------------------------------------------------
+    @api.doc("patch_products")
+    @api.response(404, "Product not found")
+    @api.response(400, "The posted fields were not valid")
+    @api.response(412, "The Product changed since the ETag in If-Match")
+    @api.header("ETag", "Strong entity tag of the updated Product")
+    @api.expect(create_model)
+    @api.response(200, "Success", product_model)
+    def patch(self, product_id):
+        """
+        Update some fields of a Product
+
+        This endpoint only validates and writes the fields that are posted,
+        with a single ``UPDATE ... RETURNING`` and no read beforehand. Send the
+        ETag of the Product in If-Match to only update it if nobody else has
+        changed it in the meantime.
+        """
+        app.logger.info("Request to Patch a product with id [%s]", product_id)
+        app.logger.debug("Payload = %s", api.payload)
+        if request.if_match:
+            find_for_write(product_id)
+        data = Product.patch(product_id, api.payload)
+        if not data:
+            abort(status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found.")
+        return json_response(
+            serialize_product(data), status.HTTP_200_OK, {"ETag": quote_etag(Product.etag(data))}
+        )
 
     # ------------------------------------------------------------------
     # DELETE A PRODUCT
     # ------------------------------------------------------------------
     @api.doc("delete_products")
     @api.response(204, "Product deleted")
+    @api.response(412, "The Product changed since the ETag in If-Match")
     def delete(self, product_id):
         """
         Delete a Product
 
-        This endpoint will delete a Product based the id specified in the path
+        This endpoint will delete a Product based the id specified in the path.
+        Send the ETag of the Product in If-Match to only delete it if nobody
+        else has changed it in the meantime.
         """
         app.logger.info("Request to Delete a product with id [%s]", product_id)
-        product = Product.find(product_id)
+        product = find_for_write(product_id)
         if product:
             product.delete()
             app.logger.info("Product with id [%s] was deleted", product_id)
@@ -214,28 +568,61 @@ class ProductCollection(Resource):
     # ------------------------------------------------------------------
     @api.doc("list_products")
     @api.expect(product_args)
-    @api.marshal_list_with(product_model)
+    @api.header("Link", 'Link to the next page as <url>; rel="next" when more Products exist')
+    @api.header("ETag", "Strong entity tag of the page")
+    @api.response(304, "Page not modified since the ETag in If-None-Match")
+    @api.response(200, "Success", [product_model])
     def get(self):
-        """Returns all of the Products"""
+        """
+        Returns all of the Products
+
+        The ``category``, ``name``, ``available``, ``min_price``, ``max_price``
+        and ``ids`` filters can be combined and are applied together in a
+        single query.
+
+        Products are returned one page at a time ordered by id, or by ``sort``
+        (``id``, ``name``, ``price`` or ``category``) in ``order`` (``asc`` or
+        ``desc``) with the id breaking ties. Use ``limit`` to
+        size the page and follow the ``Link: <url>; rel="next"`` header (which
+        carries an opaque ``cursor``) to fetch the next one. There is no next
+        link on the last page. Each page carries an ETag and an unchanged page
+        requested with If-None-Match gets an empty 304 response. Use ``fields``
+        to only return (and read from the database) some fields, e.g.
+        ``fields=id,name,price``.
+        """
         app.logger.info("Request to list Products...")
-        products = []
         args = product_args.parse_args()
-        if args["category"]:
-            app.logger.info("Filtering by category: %s", args["category"])
-            products = Product.find_by_category(args["category"])
-        elif args["name"]:
-            app.logger.info("Filtering by name: %s", args["name"])
-            products = Product.find_by_name(args["name"])
-        elif args["available"] is not None:
-            app.logger.info("Filtering by availability: %s", args["available"])
-            products = Product.find_by_availability(args["available"])
-        else:
-            app.logger.info("Returning unfiltered list.")
-            products = Product.all()
+        filters = filters_of(args)
+        app.logger.info("Filtering by: %s", filters)
+
+        limit = page_size(args)
+        sort, descending = args["sort"], args["order"] == "desc"
+        # cursors of the default order (id ascending) only hold the id
+        sort_order = None if sort == "id" and not descending else f"{args['order']}:{sort}"
+        after_id, after_key = decode_sort_cursor(args["cursor"], sort_order)
+        # the id and the sort column are read even when not asked for, for the cursor
+        columns, serializer = projection(args["fields"], "id", sort)
+        # read one extra row to find out if there is another page
+        rows = Product.find_page(
+            Product.find_by_filters(**filters), after_id, limit + 1, rows=True,
+            sort=sort, descending=descending, after_key=after_key, fields=columns,
+        )
+        headers = {}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers["Link"] = next_page_link(
+                ProductCollection, cursor_after(rows[-1], sort, sort_order), limit
+            )
 
-        results = [product.serialize() for product in products]
-        app.logger.info("[%s] Products returned", len(results))
-        return results, status.HTTP_200_OK
+        # the page is encoded once, for its ETag and its body
+        with metrics.timed("serialization_seconds"):
+            body = dumps([serializer(Product.serialize_row(row, columns)) for row in rows])
+        etag = etag_of(body + headers.get("Link", "").encode("utf-8"))
+        headers["ETag"] = quote_etag(etag)
+        if etag_matches(request.if_none_match, etag):
+            return json_response(None, status.HTTP_304_NOT_MODIFIED, headers)
+        app.logger.info("[%s] Products returned", len(rows))
+        return json_response(body, status.HTTP_200_OK, headers)
 
     # ------------------------------------------------------------------
     # ADD A NEW PRODUCT
@@ -243,7 +630,7 @@ class ProductCollection(Resource):
     @api.doc("create_products")
     @api.response(400, "The posted data was not valid")
     @api.expect(create_model)
-    @api.marshal_with(product_model, code=201)
+    @api.response(201, "Product created", product_model)
     def post(self):
         """
         Creates a Product
@@ -256,7 +643,11 @@ class ProductCollection(Resource):
         product.create()
         app.logger.info("Product with new id [%s] created!", product.id)
         location_url = api.url_for(ProductResource, product_id=product.id, _external=True)
-        return product.serialize(), status.HTTP_201_CREATED, {"Location": location_url}
+        return json_response(
+            serialize_product(product.serialize()),
+            status.HTTP_201_CREATED,
+            {"Location": location_url},
+        )
 
 
 ######################################################################
@@ -269,28 +660,62 @@ class ChangeAvailResource(Resource):
 
     @api.doc("change_availability")
     @api.response(404, "Product not found")
+    @api.response(400, "The posted availability was not valid")
+    @api.expect(availability_model)
     def put(self, product_id):
         """
         Change Product Availability
 
         This endpoint will change the availability of a Product based on the id specified in the path.
+        It is flipped unless a body such as ``{"available": true}`` sets it explicitly, in a
+        single atomic ``UPDATE ... RETURNING``.
         """
         app.logger.info(
             "Request to change availability for product with id: %s", product_id
         )
-        product = Product.find(product_id)
-        if not product:
+        data = Product.set_availability(product_id, availability_of(request.get_json(silent=True)))
+        if not data:
             abort(
                 status.HTTP_404_NOT_FOUND,
                 f"Product with id '{product_id}' was not found.",
             )
-        product.change_availability()
-        message = {"message": f"Product availability changed to {product.available}"}
-        message = {**message, **product.serialize()}
+        message = {"message": f"Product availability changed to {data['available']}"}
+        message = {**message, **data}
 
         app.logger.info("Product availability changed for ID [%s].", product_id)
 
-        return message, status.HTTP_200_OK
+        return json_response(message, status.HTTP_200_OK)
+
+
+######################################################################
+#  PATH: /products/change_availability
+######################################################################
+@api.route("/products/change_availability")
+class BulkChangeAvailResource(Resource):
+    """Change availability actions on many Products"""
+
+    @api.doc("bulk_change_availability")
+    @api.expect(bulk_args, availability_model)
+    @api.response(400, "No filter was given or the availability was not valid")
+    @api.response(200, "Products updated", bulk_availability_result_model)
+    def put(self):
+        """
+        Change the availability of many Products
+
+        This endpoint flips the availability of every Product matching the
+        query string filters (``ids``, ``category``, ...), or of all of them with
+        ``all=true``, or sets it when a body such as ``{"available": false}`` is
+        posted. Products are changed a chunk at a time with set-based
+        ``UPDATE ... WHERE id IN (...)`` statements.
+        """
+        app.logger.info("Request to change availability for many products")
+        available = availability_of(request.get_json(silent=True))
+        value = db.not_(Product.available) if available is None else available
+        updated = Product.update_where(
+            bulk_query(), {"available": value}, app.config["BULK_CHUNK_SIZE"]
+        )
+        app.logger.info("Product availability changed for [%s] Products.", updated)
+        return json_response({"updated": updated}, status.HTTP_200_OK)
 
 
 ######################################################################
@@ -304,20 +729,286 @@ class CollectionResource(Resource):
     @api.doc("create_muiltiple_products")
     @api.response(400, "The posted data was not valid")
     # @api.expect(create_model)
-    @api.marshal_list_with(product_model, code=201)
+    @api.response(201, "Products created", [product_model])
     def post(self):
         """
         Creates multiple Products
-        This endpoint will create multiple Products based the data in the body that is posted
+        This endpoint will create multiple Products based the data in the body that is posted.
+        Every Product is validated first and none are created if one is not valid. They are
+        inserted in chunks like ``/products/bulk`` does, then read back to be returned whole;
+        use ``/products/bulk`` to only get the new ids and keep the valid rows of a bad batch.
         """
         app.logger.info("Request to create multiple products")
         app.logger.debug("Payload = %s", api.payload)
-        products = Product.create_multiple_products(api.payload)
+        if not isinstance(api.payload, list):
+            raise DataValidationError("Invalid request: body must be a list of Products")
+        products = Product.create_multiple_products(api.payload, app.config["BULK_CHUNK_SIZE"])
         message = []
         for product in products:
             app.logger.info("Product with ID [%s] created.", product.id)
-            message.append(product.serialize())
-        return message, status.HTTP_201_CREATED
+            message.append(serialize_product(product.serialize()))
+        return json_response(message, status.HTTP_201_CREATED)
+
+
+######################################################################
+#  PATH: /products/bulk
+######################################################################
+@api.route("/products/bulk")
+class BulkResource(Resource):
+    """
+    Bulk operations on many Products
+    """
+    @api.doc("bulk_create_products")
+    @api.response(400, "None of the posted Products were valid")
+    @api.expect([create_model])
+    @api.response(201, "Products created", bulk_result_model)
+    def post(self):
+        """
+        Bulk ingest Products
+
+        This endpoint validates every posted Product up front, inserts the valid
+        ones in chunks with executemany ``INSERT ... RETURNING id`` and returns
+        only their ids. Rows that fail are listed in ``errors`` by their index
+        instead of failing the whole request.
+        """
+        app.logger.info("Request to bulk create products")
+        data = api.payload
+        if not isinstance(data, list):
+            raise DataValidationError("Invalid request: body must be a list of Products")
+        ids, errors = Product.bulk_create(data, app.config["BULK_CHUNK_SIZE"])
+        created = len(data) - len(errors)
+        app.logger.info("[%s] Products created, [%s] rejected", created, len(errors))
+        result = {"created": created, "ids": ids, "errors": errors}
+        if errors and not created:
+            return json_response(result, status.HTTP_400_BAD_REQUEST)
+        return json_response(result, status.HTTP_201_CREATED)
+
+    @api.doc("bulk_replace_products")
+    @api.response(400, "None of the posted Products were valid")
+    @api.expect([product_model])
+    @api.response(200, "Products updated", bulk_update_result_model)
+    def put(self):
+        """
+        Bulk update Products
+
+        This endpoint replaces every posted Product (each one with its ``id``)
+        with one executemany ``UPDATE`` per chunk, each chunk in its own
+        transaction. Ids that do not exist are listed in ``missing`` and rows
+        that fail are listed in ``errors`` by their index.
+        """
+        app.logger.info("Request to bulk update products")
+        return bulk_update(api.payload, partial=False)
+
+    @api.doc("bulk_patch_products")
+    @api.expect(bulk_args)
+    @api.response(400, "The posted changes were not valid")
+    @api.response(200, "Products updated", bulk_update_result_model)
+    def patch(self):
+        """
+        Bulk update some fields of Products
+
+        Post a list of partial Products, each one with its ``id``, to give each
+        Product its own values. Post a single object to set the same values on
+        every Product matching the query string filters (``ids``, ``category``,
+        ``available``, ...), or on all of them with ``all=true``. Matching
+        Products are changed a chunk at a time with set-based
+        ``UPDATE ... WHERE id IN (...)`` statements.
+        """
+        app.logger.info("Request to bulk patch products")
+        data = api.payload
+        if isinstance(data, list):
+            return bulk_update(data, partial=True)
+        values = Product.validate(data, partial=True)
+        updated = Product.update_where(bulk_query(), values, app.config["BULK_CHUNK_SIZE"])
+        app.logger.info("[%s] Products updated", updated)
+        result = {"updated": updated, "missing": [], "errors": []}
+        return json_response(result, status.HTTP_200_OK)
+
+    @api.doc("bulk_delete_products")
+    @api.expect(bulk_args)
+    @api.response(400, "No filter was given")
+    @api.response(200, "Products deleted", bulk_delete_result_model)
+    def delete(self):
+        """
+        Bulk delete Products
+
+        This endpoint deletes every Product matching the query string filters
+        (``ids``, ``category``, ``available``, ...), or all of them with
+        ``all=true``, a chunk at a time with set-based
+        ``DELETE ... WHERE id IN (...)`` statements, and returns how many were
+        deleted.
+        """
+        app.logger.info("Request to bulk delete products")
+        deleted = Product.delete_where(bulk_query(), app.config["BULK_CHUNK_SIZE"])
+        app.logger.info("[%s] Products deleted", deleted)
+        return json_response({"deleted": deleted}, status.HTTP_200_OK)
+
+
+######################################################################
+#  PATH: /products/batch-get
+######################################################################
+@api.route("/products/batch-get")
+class BatchGetResource(Resource):
+    """
+    Reads many Products at once
+    """
+    @api.doc("batch_get_products")
+    @api.response(400, "The posted ids were not valid or too many")
+    @api.expect(batch_get_model)
+    @api.response(200, "Success", batch_get_result_model)
+    def post(self):
+        """
+        Read many Products by id
+
+        This endpoint returns the Products with the posted ids in the order
+        they were asked for, with the ids that do not exist listed in
+        ``missing``. Cached Products are served from the cache and the rest
+        are read with a single ``WHERE id IN (...)`` query.
+        """
+        app.logger.info("Request to batch read products")
+        data = api.payload
+        ids = data.get("ids") if isinstance(data, dict) else None
+        if not isinstance(ids, list) or not all(
+            isinstance(by_id, int) and not isinstance(by_id, bool) for by_id in ids
+        ):
+            raise DataValidationError("Invalid request: ids must be a list of Product ids")
+        ids = list(dict.fromkeys(ids))  # drop duplicates, keep the order
+        if len(ids) > app.config["BATCH_GET_MAX"]:
+            raise DataValidationError(
+                f"Invalid request: at most {app.config['BATCH_GET_MAX']} ids can be read at once"
+            )
+        found = Product.find_many_cached(ids)
+        with metrics.timed("serialization_seconds"):
+            products = [serialize_product(found[by_id]) for by_id in ids if by_id in found]
+        missing = [by_id for by_id in ids if by_id not in found]
+        app.logger.info("[%s] Products returned, [%s] missing", len(products), len(missing))
+        return json_response({"products": products, "missing": missing}, status.HTTP_200_OK)
+
+
+######################################################################
+#  PATH: /products/search
+######################################################################
+@api.route("/products/search")
+class SearchResource(Resource):
+    """
+    Full-text search over Products
+    """
+    @api.doc("search_products")
+    @api.expect(search_args)
+    @api.header("Link", 'Link to the next page as <url>; rel="next" when more Products match')
+    @api.response(400, "The search was not valid")
+    @api.response(200, "Success", [product_model])
+    def get(self):
+        """
+        Search the Products
+
+        This endpoint returns the Products whose name or description contain
+        every word of ``q`` (or words starting with them), most relevant
+        first. The listing filters can be combined with the search. Pages are
+        sized with ``limit`` and the next one is linked from the
+        ``Link: <url>; rel="next"`` header.
+        """
+        app.logger.info("Request to search Products...")
+        args = search_args.parse_args()
+        filters = filters_of(args)
+        query = Product.search(args["q"], Product.find_by_filters(**filters))
+
+        limit = page_size(args)
+        offset = decode_offset_cursor(args["cursor"])
+        columns, serializer = projection(args["fields"])
+        # read one extra row to find out if there is another page
+        rows = (
+            query.with_entities(*Product.serialized_columns(columns))
+            .offset(offset)
+            .limit(limit + 1)
+            .all()
+        )
+        headers = {}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers["Link"] = next_page_link(
+                SearchResource, encode_offset_cursor(offset + limit), limit
+            )
+
+        with metrics.timed("serialization_seconds"):
+            results = [serializer(Product.serialize_row(row, columns)) for row in rows]
+        app.logger.info("[%s] Products found", len(results))
+        return json_response(results, status.HTTP_200_OK, headers)
+
+
+######################################################################
+#  PATH: /products/aggregates
+######################################################################
+@api.route("/products/aggregates")
+class AggregateResource(Resource):
+    """
+    Statistics over the catalog of Products
+    """
+    @api.doc("aggregate_products")
+    @api.expect(aggregate_args)
+    @api.header("ETag", "Strong entity tag of the statistics")
+    @api.response(304, "Statistics not modified since the ETag in If-None-Match")
+    @api.response(400, "The filters or dimensions were not valid")
+    @api.response(200, "Success", [aggregate_model])
+    def get(self):
+        """
+        Aggregate the Products
+
+        This endpoint returns the number of Products, how many of them are
+        available and their lowest, highest and average price, for each
+        combination of the ``group_by`` dimensions (``category``,
+        ``available``) or as a single total. The listing filters can be used
+        to aggregate only some of the Products. Everything is computed by the
+        database with a single ``GROUP BY`` query.
+        """
+        app.logger.info("Request to aggregate Products...")
+        args = aggregate_args.parse_args()
+        filters = filters_of(args)
+        groups = Product.aggregate(Product.find_by_filters(**filters), args["group_by"])
+        with metrics.timed("serialization_seconds"):
+            body = dumps(groups)
+        etag = etag_of(body)
+        headers = {"ETag": quote_etag(etag)}
+        if etag_matches(request.if_none_match, etag):
+            return json_response(None, status.HTTP_304_NOT_MODIFIED, headers)
+        return json_response(body, status.HTTP_200_OK, headers)
+
+
+######################################################################
+#  PATH: /products/export
+######################################################################
+@api.route("/products/export")
+class ExportResource(Resource):
+    """
+    Streams the whole catalog of Products
+    """
+    @api.doc("export_products")
+    @api.expect(export_args)
+    @api.produces(["application/x-ndjson", "text/csv"])
+    @api.response(400, "The export format was not valid")
+    def get(self):
+        """
+        Export all of the Products
+
+        This endpoint streams every Product ordered by id as newline delimited
+        JSON (the default) or CSV. Rows are read from a server-side cursor and
+        written as they arrive, so memory stays flat regardless of catalog size.
+        Use ``fields`` to only export some of the columns.
+        """
+        app.logger.info("Request to export Products...")
+        args = export_args.parse_args()
+        columns, _ = projection(args["fields"])
+        rows = Product.stream_all(app.config["EXPORT_BATCH_SIZE"], rows=True, fields=columns)
+        if args["format"] == "csv":
+            return Response(
+                stream_with_context(csv_lines(rows, columns)),
+                mimetype="text/csv",
+                headers={"Content-Disposition": "attachment; filename=products.csv"},
+            )
+        return Response(
+            stream_with_context(ndjson_lines(rows, columns)),
+            mimetype="application/x-ndjson",
+        )
 
 
 ######################################################################
@@ -527,6 +1218,152 @@ def abort(error_code: int, message: str):
     app.logger.error(message)
     api.abort(error_code, message)
 
+
+def quote_etag(etag: str) -> str:
+    """Quotes an ETag for use in a response header"""
+    return f'"{etag}"'
+
+
+def etag_matches(condition, etag: str, strong: bool = False) -> bool:
+    """Tells if an If-None-Match (or, strong, If-Match) header names an ETag
+
+    The ETags of compressed responses name their coding, which is ignored:
+    the content is the same. If-Match only takes strong ETags.
+    """
+    if condition.star_tag:
+        return True
+    return etag in {compression.strip_coding(tag) for tag in condition.as_set(include_weak=not strong)}
+
+
+def find_for_write(product_id):
+    """Finds a Product that is about to be changed, honouring If-Match
+
+    When the request carries If-Match the row is locked (SELECT ... FOR UPDATE)
+    until the change is committed and the request is aborted with 412 if the
+    current ETag of the Product does not match.
+    """
+    if not request.if_match:
+        return Product.find(product_id)
+    product = Product.find_for_update(product_id)
+    if not product or not etag_matches(request.if_match, Product.etag(product.serialize()), strong=True):
+        db.session.rollback()
+        abort(
+            status.HTTP_412_PRECONDITION_FAILED,
+            f"Product with id '{product_id}' does not match If-Match.",
+        )
+    return product
+
+
+def bulk_update(data, partial: bool):
+    """Updates the Products of a bulk request, each one with its own values"""
+    if not isinstance(data, list):
+        raise DataValidationError("Invalid request: body must be a list of Products")
+    updated, missing, errors = Product.bulk_update(
+        data, app.config["BULK_CHUNK_SIZE"], partial=partial
+    )
+    app.logger.info(
+        "[%s] Products updated, [%s] missing, [%s] rejected", updated, len(missing), len(errors)
+    )
+    result = {"updated": updated, "missing": missing, "errors": errors}
+    if errors and len(errors) == len(data):
+        return json_response(result, status.HTTP_400_BAD_REQUEST)
+    return json_response(result, status.HTTP_200_OK)
+
+
+def requested_fields(names: list):
+    """Returns the Product fields asked for with fields=, or None for all of them"""
+    if not names:
+        return None
+    for name in names:
+        if name not in Product.SERIALIZED_FIELDS:
+            raise DataValidationError(f"Invalid field: {name}")
+    return names
+
+
+def projection(names: list, *needed: str) -> tuple:
+    """Returns what to read and write for the fields asked for with fields=
+
+    :param names: the fields asked for, None or empty for all of them
+    :param needed: fields that must be read even when not asked for
+
+    :return: the columns to select in SERIALIZED_FIELDS order and the
+             serializer of the response
+    """
+    names = requested_fields(names)
+    if not names:
+        return Product.SERIALIZED_FIELDS, serialize_product
+    wanted = set(names).union(needed)
+    columns = tuple(name for name in Product.SERIALIZED_FIELDS if name in wanted)
+    return columns, serialize_product.only(names)
+
+
+def availability_of(data):
+    """Returns the availability posted to change it, or None to flip it"""
+    if data is None:
+        return None
+    if not isinstance(data, dict):
+        raise DataValidationError("Invalid request: body must be an object")
+    if "available" not in data:
+        return None
+    if not isinstance(data["available"], bool):
+        raise DataValidationError(
+            "Invalid type for boolean [available]: " + str(type(data["available"]))
+        )
+    return data["available"]
+
+
+def filters_of(args) -> dict:
+    """Returns the listing filters given in the parsed query string"""
+    return {key: args[key] for key in FILTER_ARGS if args[key] not in (None, "", [])}
+
+
+def page_size(args) -> int:
+    """Returns the page size asked for, capped at PAGE_SIZE_MAX"""
+    return min(args["limit"] or app.config["PAGE_SIZE_DEFAULT"], app.config["PAGE_SIZE_MAX"])
+
+
+def bulk_query():
+    """Returns the query of the Products chosen by the query string of a bulk request"""
+    args = bulk_args.parse_args()
+    filters = filters_of(args)
+    if not filters and not args["all"]:
+        raise DataValidationError("Invalid request: give a filter, or all=true to change every Product")
+    app.logger.info("Filtering by: %s", filters)
+    return Product.find_by_filters(**filters)
+
+
+def cursor_after(row, sort: str, sort_order: str) -> str:
+    """Builds the cursor of the page that follows a row"""
+    key = getattr(row, sort)
+    return encode_cursor(row.id, sort_order, key.name if isinstance(key, Category) else key)
+
+
+def next_page_link(resource, cursor: str, limit: int) -> str:
+    """Builds the Link header value pointing at the next page of a listing"""
+    args = request.args.to_dict()
+    args.update(cursor=cursor, limit=limit)
+    url = api.url_for(resource, _external=True, **args)
+    return f'<{url}>; rel="next"'
+
+
+def ndjson_lines(rows, columns: tuple):
+    """Generates one line of JSON for each Product row"""
+    for row in rows:
+        yield dumps(Product.serialize_row(row, columns)) + b"\n"
+
+
+def csv_lines(rows, columns: tuple):
+    """Generates a CSV header followed by one line for each Product row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(Product.serialize_row(row, columns).values())
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    yield buffer.getvalue()
+
 # def check_content_type(content_type):
 #     """Checks that the media type is correct"""
 #     if "Content-Type" not in request.headers:
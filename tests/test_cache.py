@@ -0,0 +1,158 @@
+"""
+Test cases for the Product cache backends
+"""
+import fnmatch
+from unittest import TestCase
+from unittest.mock import patch
+from service import app
+from service.common import cache
+
+
+class FakeRedis:
+    """A local stand-in for the few Redis commands the cache uses"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        """Returns the value of the key"""
+        return self.data.get(key)
+
+    def mget(self, keys):
+        """Returns the values of the keys"""
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):  # pylint: disable=unused-argument
+        """Sets the value of the key"""
+        self.data[key] = value.encode("utf-8")
+
+    def pipeline(self):
+        """Returns a pipeline, which runs the commands straight away here"""
+        return self
+
+    def execute(self):
+        """Runs the commands of the pipeline"""
+        return []
+
+    def delete(self, *keys):
+        """Deletes the keys"""
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match="*"):
+        """Iterates over the keys matching the pattern"""
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+
+class TestLRUCache(TestCase):
+    """Test Cases for the in-process LRU cache"""
+
+    def test_get_and_set(self):
+        """It should count hits and misses"""
+        lru = cache.LRUCache(max_size=10, ttl=60)
+        self.assertIsNone(lru.get(1))
+        lru.set(1, {"id": 1})
+        self.assertEqual(lru.get(1), {"id": 1})
+        stats = lru.stats()
+        self.assertEqual(stats["backend"], "lru")
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hit_ratio"], 0.5)
+        self.assertEqual(stats["size"], 1)
+
+    def test_evicts_least_recently_used(self):
+        """It should evict the least recently used entry when full"""
+        lru = cache.LRUCache(max_size=2, ttl=60)
+        lru.set(1, "one")
+        lru.set(2, "two")
+        lru.get(1)
+        lru.set(3, "three")
+        self.assertEqual(lru.get(1), "one")
+        self.assertIsNone(lru.get(2))
+        self.assertEqual(lru.get(3), "three")
+
+    def test_entries_expire(self):
+        """It should expire entries after the ttl"""
+        lru = cache.LRUCache(max_size=2, ttl=60)
+        with patch("service.common.cache.time.monotonic", return_value=1000.0):
+            lru.set(1, "one")
+        with patch("service.common.cache.time.monotonic", return_value=1059.0):
+            self.assertEqual(lru.get(1), "one")
+        with patch("service.common.cache.time.monotonic", return_value=1061.0):
+            self.assertIsNone(lru.get(1))
+        self.assertEqual(lru.size(), 0)
+
+    def test_delete_and_clear(self):
+        """It should delete and clear entries"""
+        lru = cache.LRUCache()
+        lru.set(1, "one")
+        lru.set(2, "two")
+        lru.delete(1, 3)
+        self.assertIsNone(lru.get(1))
+        self.assertEqual(lru.size(), 1)
+        lru.clear()
+        self.assertEqual(lru.size(), 0)
+
+    def test_get_and_set_many(self):
+        """It should get and set many entries at once"""
+        lru = cache.LRUCache()
+        lru.set_many({1: "one", 2: "two"})
+        self.assertEqual(lru.get_many([1, 2, 3]), {1: "one", 2: "two"})
+        self.assertEqual(lru.hits, 2)
+        self.assertEqual(lru.misses, 1)
+        self.assertEqual(lru.get_many([]), {})
+
+
+class TestRedisCache(TestCase):
+    """Test Cases for the shared Redis cache"""
+
+    def test_redis_cache(self):
+        """It should store JSON values under a prefix"""
+        redis_cache = cache.RedisCache(FakeRedis(), ttl=30)
+        self.assertIsNone(redis_cache.get(1))
+        redis_cache.set(1, {"id": 1, "name": "Eco Tool"})
+        redis_cache.set(2, {"id": 2})
+        self.assertIn("products:1", redis_cache.client.data)
+        self.assertEqual(redis_cache.get(1), {"id": 1, "name": "Eco Tool"})
+        self.assertEqual(redis_cache.size(), 2)
+        redis_cache.delete(1)
+        self.assertIsNone(redis_cache.get(1))
+        redis_cache.clear()
+        self.assertEqual(redis_cache.size(), 0)
+        self.assertEqual(redis_cache.stats()["backend"], "redis")
+
+    def test_redis_cache_many(self):
+        """It should get and set many entries with one round trip"""
+        redis_cache = cache.RedisCache(FakeRedis(), ttl=30)
+        redis_cache.set_many({1: {"id": 1}, 2: {"id": 2}})
+        self.assertEqual(redis_cache.get_many([1, 2, 3]), {1: {"id": 1}, 2: {"id": 2}})
+        self.assertEqual(redis_cache.misses, 1)
+        self.assertEqual(redis_cache.get_many([]), {})
+
+
+class TestInitCache(TestCase):
+    """Test Cases for choosing the cache backend"""
+
+    def tearDown(self):
+        cache.init_cache(app)
+
+    def test_init_cache(self):
+        """It should create the configured backend"""
+        with patch.dict(app.config, {"CACHE_BACKEND": "none"}):
+            product_cache = cache.init_cache(app)
+        self.assertEqual(product_cache.backend, "none")
+        product_cache.set(1, "one")
+        self.assertIsNone(product_cache.get(1))
+        with patch.dict(app.config, {"CACHE_BACKEND": "lru", "CACHE_MAX_SIZE": 5}):
+            product_cache = cache.init_cache(app)
+        self.assertEqual(product_cache.max_size, 5)
+        self.assertIs(cache.product_cache, product_cache)
+
+    @patch("service.common.cache.RedisCache.from_url")
+    def test_init_redis_cache(self, from_url):
+        """It should connect to Redis when configured"""
+        from_url.return_value = cache.RedisCache(FakeRedis())
+        with patch.dict(app.config, {"CACHE_BACKEND": "redis"}):
+            product_cache = cache.init_cache(app)
+        from_url.assert_called_once_with(app.config["CACHE_REDIS_URL"], app.config["CACHE_TTL"])
+        self.assertEqual(product_cache.backend, "redis")
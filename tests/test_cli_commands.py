@@ -5,7 +5,7 @@ import os
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
 from click.testing import CliRunner
-from service.common.cli_commands import db_create
+from service.common.cli_commands import db_create, db_upgrade, db_downgrade, db_status
 
 
 class TestFlaskCLI(TestCase):
@@ -21,3 +21,47 @@ class TestFlaskCLI(TestCase):
         with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+
+    @patch('service.common.cli_commands.migrations')
+    @patch('service.common.cli_commands.db')
+    def test_db_create_stamps(self, db_mock, migrations_mock):
+        """It should record the migrations as applied after recreating the tables"""
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_create)
+            self.assertEqual(result.exit_code, 0)
+        db_mock.create_all.assert_called_once()
+        migrations_mock.stamp.assert_called_once_with(db_mock.engine)
+
+    @patch('service.common.cli_commands.migrations')
+    def test_db_upgrade(self, migrations_mock):
+        """It should apply the pending migrations"""
+        migration = MagicMock(version="0002", description="Add the indexes")
+        migrations_mock.upgrade.return_value = [migration]
+        result = self.runner.invoke(db_upgrade, ["--to", "0002"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("Applied 0002 Add the indexes", result.output)
+        self.assertEqual(migrations_mock.upgrade.call_args.args[1], "0002")
+        migrations_mock.upgrade.return_value = []
+        result = self.runner.invoke(db_upgrade)
+        self.assertIn("up to date", result.output)
+
+    @patch('service.common.cli_commands.migrations')
+    def test_db_downgrade(self, migrations_mock):
+        """It should revert the migrations newer than a version"""
+        migrations_mock.downgrade.return_value = [MagicMock(version="0002", description="Add the indexes")]
+        result = self.runner.invoke(db_downgrade, ["--to", "0001"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("Reverted 0002", result.output)
+        self.assertNotEqual(self.runner.invoke(db_downgrade).exit_code, 0)
+
+    @patch('service.common.cli_commands.migrations')
+    def test_db_status(self, migrations_mock):
+        """It should list the applied and pending migrations"""
+        migrations_mock.status.return_value = [
+            (MagicMock(version="0001", description="Create"), True),
+            (MagicMock(version="0002", description="Index"), False),
+        ]
+        result = self.runner.invoke(db_status)
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("0001 applied", result.output)
+        self.assertIn("0002 pending", result.output)
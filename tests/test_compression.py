@@ -0,0 +1,74 @@
+"""
+Test cases for response compression
+"""
+import gzip
+from unittest import TestCase, skipIf
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+from service.common import compression
+
+
+class TestCompression(TestCase):
+    """Test Cases for negotiating and compressing"""
+
+    def test_negotiate(self):
+        """It should pick the coding the client prefers"""
+        codings = ["br", "zstd", "gzip"]
+
+        def negotiate(header):
+            return compression.negotiate(parse_accept_header(header, Accept), codings)
+
+        self.assertEqual(negotiate("gzip, deflate, br"), "br")
+        self.assertEqual(negotiate("gzip;q=1.0, br;q=0.5"), "gzip")
+        self.assertEqual(negotiate("zstd, gzip"), "zstd")
+        self.assertEqual(negotiate("*"), "br")
+        self.assertEqual(negotiate("*, br;q=0"), "zstd")
+        self.assertIsNone(negotiate("gzip;q=0"))
+        self.assertIsNone(negotiate("identity"))
+        self.assertIsNone(negotiate(""))
+
+    def test_strip_coding(self):
+        """It should take the coding off the ETag of a compressed response"""
+        self.assertEqual(compression.strip_coding("abc123-gzip"), "abc123")
+        self.assertEqual(compression.strip_coding("abc123-br"), "abc123")
+        self.assertEqual(compression.strip_coding("abc123"), "abc123")
+        self.assertEqual(compression.strip_coding("abc-123"), "abc-123")
+        self.assertEqual(compression.strip_coding("-gzip"), "-gzip")
+
+    def test_compress_gzip(self):
+        """It should compress with gzip in one go"""
+        data = b'{"name":"hammer"}' * 100
+        compressed = compression.compress("gzip", data, 6)
+        self.assertLess(len(compressed), len(data))
+        self.assertEqual(gzip.decompress(compressed), data)
+
+    @skipIf(compression.brotli is None, "brotli is not installed")
+    def test_compress_brotli(self):
+        """It should compress with brotli in one go"""
+        data = b'{"name":"hammer"}' * 100
+        self.assertEqual(compression.brotli.decompress(compression.compress("br", data, 4)), data)
+
+    @skipIf(compression.zstandard is None, "zstandard is not installed")
+    def test_compress_zstd(self):
+        """It should compress with Zstandard in one go"""
+        data = b'{"name":"hammer"}' * 100
+        compressed = compression.compress("zstd", data, 3)
+        decompressor = compression.zstandard.ZstdDecompressor()
+        self.assertEqual(decompressor.decompressobj().decompress(compressed), data)
+
+    def test_compress_stream(self):
+        """It should compress chunks as they are generated and close the source"""
+        closed = []
+
+        def chunks():
+            try:
+                for number in range(1000):
+                    yield f'{{"id":{number}}}\n'
+            finally:
+                closed.append(True)
+
+        output = list(compression.compress_stream(chunks(), compression.GzipCompressor(6), 4096))
+        self.assertGreater(len(output), 2)
+        expected = "".join(f'{{"id":{number}}}\n' for number in range(1000)).encode()
+        self.assertEqual(gzip.decompress(b"".join(output)), expected)
+        self.assertEqual(closed, [True])
@@ -0,0 +1,56 @@
+"""
+Test cases for the Prometheus metrics
+"""
+import sqlite3
+from unittest import TestCase, skipIf
+from unittest.mock import patch
+import sqlalchemy as sa
+from flask import Flask, g
+from service.common import metrics
+
+
+@skipIf(metrics.prometheus_client is None, "prometheus_client is not installed")
+class TestMetrics(TestCase):
+    """Test Cases for recording metrics"""
+
+    def test_timed(self):
+        """It should add up the time of the timed blocks of a request"""
+        app = Flask(__name__)
+        with app.test_request_context():
+            with metrics.timed("serialization_seconds"):
+                pass
+            first = g.serialization_seconds
+            with metrics.timed("serialization_seconds"):
+                pass
+            self.assertGreater(g.serialization_seconds, first)
+        with metrics.timed("serialization_seconds"):
+            pass  # outside of a request it is ignored
+
+    def test_render(self):
+        """It should render the metrics in the Prometheus text format"""
+        body, content_type = metrics.render()
+        self.assertTrue(content_type.startswith("text/plain"))
+        self.assertIn(b"# TYPE http_requests_total counter", body)
+        self.assertIn(b"# TYPE http_request_duration_seconds histogram", body)
+
+    def test_observe_new_pool(self):
+        """It should keep counting when the pool is replaced"""
+        stats = {"checked_out": 0, "checked_in": 1, "overflow": 0, "wait_time_total": 0.5}
+        before = metrics.POOL_CHECKOUTS._value.get()  # pylint: disable=protected-access
+        with patch.dict(metrics._pool_seen, checkouts=0, wait_time_total=0.0):  # pylint: disable=protected-access
+            with patch.object(metrics, "pool_stats", return_value=dict(stats, checkouts=10**6)):
+                metrics.observe_pool(None)
+            with patch.object(metrics, "pool_stats", return_value=dict(stats, checkouts=3)):
+                metrics.observe_pool(None)
+        self.assertEqual(metrics.POOL_CHECKOUTS._value.get() - before, 10**6 + 3)  # pylint: disable=protected-access
+
+    def test_commit_error(self):
+        """It should let the error of a failed commit through"""
+        metrics.init_metrics(Flask(__name__), None)
+        engine = sa.create_engine("sqlite://")
+        with engine.connect() as connection:
+            connection.execute(sa.text("SELECT 1"))
+            error = sqlite3.OperationalError("disk I/O error")
+            with patch.object(engine.dialect, "do_commit", side_effect=error):
+                self.assertRaises(sa.exc.OperationalError, connection.commit)
+            self.assertEqual(connection.info["query_start_time"], [])
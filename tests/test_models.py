@@ -5,9 +5,11 @@ Test cases for YourResourceModel Model
 import os
 import logging
 import unittest
+from unittest.mock import patch
 from werkzeug.exceptions import NotFound
 from service.models import Category, Product, DataValidationError, db
 from service import app
+from service.common import cache
 from tests.factories import ProductFactory
 
 
@@ -42,6 +44,7 @@ class TestProductModel(unittest.TestCase):
         """This runs before each test"""
         db.session.query(Product).delete()  # clean up the last tests
         db.session.commit()
+        cache.product_cache.clear()
 
     def tearDown(self):
         """This runs after each test"""
@@ -155,6 +158,19 @@ class TestProductModel(unittest.TestCase):
         updated_product = Product.find(product.id)
         self.assertEqual(updated_product.available, not initial_availability)
 
+    def test_set_availability(self):
+        """It should set or flip the availability of a product in one statement"""
+        product = ProductFactory(available=True)
+        product.create()
+        Product.find_cached(product.id)
+        data = Product.set_availability(product.id)
+        self.assertFalse(data["available"])
+        self.assertEqual(data["name"], product.name)
+        self.assertFalse(Product.find_cached(product.id)["available"])
+        self.assertFalse(Product.set_availability(product.id, False)["available"])
+        self.assertTrue(Product.set_availability(str(product.id), True)["available"])
+        self.assertIsNone(Product.set_availability(0))
+
     def test_list_all_products(self):
         """It should List all products in the database"""
         products = Product.all()
@@ -229,35 +245,78 @@ class TestProductModel(unittest.TestCase):
         product = Product()
         self.assertRaises(DataValidationError, product.deserialize, data)
 
-    # def test_deserialize_update_a_product(self):
-    #     """It should de-serialize-update a product"""
-    #     data = ProductFactory().serialize()
-    #     product = Product()
-    #     product.deserialize_update(data)
-    #     self.assertNotEqual(product, None)
-    #     self.assertEqual(product.id, None)
-    #     self.assertEqual(product.name, data["name"])
-    #     self.assertEqual(product.description, data["description"])
-    #     self.assertEqual(product.price, data["price"])
-    #     self.assertEqual(product.available, data["available"])
-    #     self.assertEqual(product.image_url, data["image_url"])
-    #     self.assertEqual(product.category.name, data["category"])
-
-    # def test_deserialize_update_bad_available(self):
-    #     """It should not deserialize-update a bad available attribute"""
-    #     test_product = ProductFactory()
-    #     data = test_product.serialize()
-    #     data["available"] = "true"
-    #     product = Product()
-    #     self.assertRaises(DataValidationError, product.deserialize_update, data)
-
-    # def test_deserialize_update_bad_category(self):
-    #     """It should not deserialize-update a bad category attribute"""
-    #     test_product = ProductFactory()
-    #     data = test_product.serialize()
-    #     data["category"] = "xxx"  # wrong case
-    #     product = Product()
-    #     self.assertRaises(DataValidationError, product.deserialize_update, data)
+    def test_deserialize_bad_price(self):
+        """It should not deserialize a missing or non numeric price"""
+        data = ProductFactory().serialize()
+        for price in (None, True, "cheap", [1], float("nan")):
+            data["price"] = price
+            self.assertRaises(DataValidationError, Product().deserialize, data)
+        data["price"] = "12.50"
+        self.assertEqual(Product().deserialize(data).price, 12.5)
+
+    def test_deserialize_bad_name(self):
+        """It should not deserialize a name the database cannot hold"""
+        data = ProductFactory().serialize()
+        data["name"] = "x" * 64
+        self.assertRaises(DataValidationError, Product().deserialize, data)
+        data["name"] = 42
+        self.assertRaises(DataValidationError, Product().deserialize, data)
+        data["name"] = "x" * 63
+        self.assertEqual(Product().deserialize(data).name, data["name"])
+
+    def test_deserialize_update_a_product(self):
+        """It should de-serialize-update a product"""
+        data = ProductFactory().serialize()
+        product = Product()
+        product.deserialize_update(data)
+        self.assertNotEqual(product, None)
+        self.assertEqual(product.id, None)
+        self.assertEqual(product.name, data["name"])
+        self.assertEqual(product.description, data["description"])
+        self.assertEqual(product.price, data["price"])
+        self.assertEqual(product.available, data["available"])
+        self.assertEqual(product.image_url, data["image_url"])
+        self.assertEqual(product.category.name, data["category"])
+
+    def test_deserialize_update_some_fields(self):
+        """It should de-serialize-update only the given fields"""
+        product = ProductFactory()
+        name = product.name
+        product.deserialize_update({"price": 12.5, "category": "FOOD"})
+        self.assertEqual(product.name, name)
+        self.assertEqual(product.price, 12.5)
+        self.assertEqual(product.category, Category.FOOD)
+
+    def test_deserialize_update_bad_available(self):
+        """It should not deserialize-update a bad available attribute"""
+        test_product = ProductFactory()
+        data = test_product.serialize()
+        data["available"] = "true"
+        product = Product()
+        self.assertRaises(DataValidationError, product.deserialize_update, data)
+
+    def test_deserialize_update_bad_category(self):
+        """It should not deserialize-update a bad category attribute"""
+        test_product = ProductFactory()
+        data = test_product.serialize()
+        data["category"] = "xxx"  # wrong case
+        product = Product()
+        self.assertRaises(DataValidationError, product.deserialize_update, data)
+
+    def test_patch_a_product(self):
+        """It should Update some fields of a product in one statement"""
+        product = ProductFactory(available=True)
+        product.create()
+        Product.find_cached(product.id)
+        data = Product.patch(product.id, {"price": 3.5, "available": False})
+        self.assertEqual(data["id"], product.id)
+        self.assertEqual(data["name"], product.name)
+        self.assertEqual(data["price"], 3.5)
+        self.assertFalse(data["available"])
+        self.assertEqual(Product.find_cached(product.id), data)
+        self.assertIsNone(Product.patch(0, {"price": 1.0}))
+        self.assertIsNone(Product.patch("abc", {"price": 1.0}))
+        self.assertRaises(DataValidationError, Product.patch, product.id, {})
 
     def test_find_product(self):
         """It should Find a product by ID"""
@@ -274,6 +333,86 @@ class TestProductModel(unittest.TestCase):
         self.assertEqual(product.name, products[1].name)
         self.assertEqual(product.available, products[1].available)
 
+    def test_find_page(self):
+        """It should Find a page of products after an id"""
+        products = ProductFactory.create_batch(5)
+        for product in products:
+            product.create()
+        ids = [product.id for product in products]
+        page = Product.find_page(limit=2)
+        self.assertEqual([product.id for product in page], ids[:2])
+        page = Product.find_page(after_id=ids[1], limit=2)
+        self.assertEqual([product.id for product in page], ids[2:4])
+        page = Product.find_page(after_id=ids[4], limit=2)
+        self.assertEqual(page, [])
+        # pages of a filtered query
+        available = products[0].available
+        expected = [product.id for product in products if product.available == available]
+        page = Product.find_page(Product.find_by_availability(available), limit=5)
+        self.assertEqual([product.id for product in page], expected)
+
+    def test_find_page_some_fields(self):
+        """It should Find a page of rows with only some of the columns"""
+        products = ProductFactory.create_batch(3)
+        for product in products:
+            product.create()
+        page = Product.find_page(limit=2, rows=True, fields=("id", "price"))
+        self.assertEqual(
+            [tuple(row) for row in page], [(product.id, product.price) for product in products[:2]]
+        )
+        rows = list(Product.stream_all(rows=True, fields=("name",)))
+        self.assertEqual([tuple(row) for row in rows], [(product.name,) for product in products])
+
+    def _find_all_pages(self, sort, descending=False, limit=2):
+        """Pages through every product sorted by a column and returns their ids"""
+        ids, page = [], Product.find_page(limit=limit, sort=sort, descending=descending)
+        while page:
+            ids.extend(product.id for product in page)
+            last = page[-1]
+            key = getattr(last, sort)
+            page = Product.find_page(
+                after_id=last.id, limit=limit, sort=sort, descending=descending,
+                after_key=key.name if isinstance(key, Category) else key,
+            )
+        return ids
+
+    def test_find_page_sorted(self):
+        """It should Find pages of products sorted by a column"""
+        products = ProductFactory.create_batch(7)
+        for i, product in enumerate(products):
+            product.price = [30.0, 10.0, 20.0, 10.0, 40.0, 20.0, 10.0][i]
+            product.create()
+        by_price = sorted(products, key=lambda product: (product.price, product.id))
+        self.assertEqual(self._find_all_pages("price"), [product.id for product in by_price])
+        by_price = sorted(products, key=lambda product: (-product.price, -product.id))
+        self.assertEqual(self._find_all_pages("price", True), [product.id for product in by_price])
+        self.assertEqual(
+            sorted(self._find_all_pages("category", limit=3)), sorted(product.id for product in products)
+        )
+        self.assertRaises(DataValidationError, Product.find_page, sort="description")
+        self.assertRaises(DataValidationError, Product.find_page, after_id=1, sort="price", after_key="x")
+
+    def test_find_page_sorted_with_missing_values(self):
+        """It should Find pages sorted by a column with missing values at the end"""
+        products = ProductFactory.create_batch(5)
+        for i, product in enumerate(products):
+            product.name = None if i in (1, 3) else f"Product {5 - i}"
+            product.create()
+        named = [products[4].id, products[2].id, products[0].id]
+        unnamed = [products[1].id, products[3].id]
+        self.assertEqual(self._find_all_pages("name"), named + unnamed)
+        self.assertEqual(self._find_all_pages("name", True), unnamed[::-1] + named[::-1])
+
+    def test_stream_all(self):
+        """It should Stream all products in id order"""
+        products = ProductFactory.create_batch(5)
+        for product in products:
+            product.create()
+        streamed = Product.stream_all(batch_size=2)
+        self.assertEqual(
+            [product.id for product in streamed], [product.id for product in products]
+        )
+
     def test_find_by_name(self):
         """It should Find a product by Name"""
         products = ProductFactory.create_batch(10)
@@ -311,6 +450,158 @@ class TestProductModel(unittest.TestCase):
         for product in found:
             self.assertEqual(product.category, category)
 
+    def test_find_by_filters(self):
+        """It should Find products matching all of the filters"""
+        products = ProductFactory.create_batch(20)
+        for product in products:
+            product.create()
+        category = products[0].category
+        available = products[0].available
+        expected = [
+            product.id for product in products
+            if product.category == category and product.available == available
+        ]
+        found = Product.find_by_filters(category=category, available=available)
+        self.assertEqual(sorted(product.id for product in found), expected)
+        # the category can also be given by name
+        found = Product.find_by_filters(category=category.name, available=available)
+        self.assertEqual(found.count(), len(expected))
+
+    def test_find_by_filters_price_and_ids(self):
+        """It should Find products in a price range and an id set"""
+        products = ProductFactory.create_batch(10)
+        for i, product in enumerate(products):
+            product.price = 10.0 * (i + 1)
+            product.create()
+        found = Product.find_by_filters(min_price=30.0, max_price=60.0)
+        self.assertEqual(
+            sorted(product.price for product in found), [30.0, 40.0, 50.0, 60.0]
+        )
+        ids = [products[1].id, products[3].id, products[8].id]
+        found = Product.find_by_filters(ids=ids, max_price=50.0)
+        self.assertEqual(sorted(product.id for product in found), ids[:2])
+        # no filters returns everything
+        self.assertEqual(Product.find_by_filters().count(), 10)
+
+    def test_find_by_filters_bad_category(self):
+        """It should not Find products by an unknown category"""
+        self.assertRaises(DataValidationError, Product.find_by_filters, category="xxx")
+
+    def _create_search_products(self):
+        """Creates a few Products with known names and descriptions"""
+        for name, description in [
+            ("Red Kettle", "Boils water fast"),
+            ("Blue Kettle", "Stainless steel"),
+            ("Steel Pan", "A pan for frying"),
+            ("Teapot", "Pairs with any kettle"),
+        ]:
+            product = ProductFactory(name=name, description=description, available=True)
+            product.create()
+
+    def test_search(self):
+        """It should Search products by name and description"""
+        self._create_search_products()
+        found = Product.search("kettle")
+        self.assertEqual(
+            sorted(product.name for product in found), ["Blue Kettle", "Red Kettle", "Teapot"]
+        )
+        # words can be prefixes and every word has to match
+        self.assertEqual(Product.search("KETT").count(), 3)
+        self.assertEqual([product.name for product in Product.search("kettle steel")], ["Blue Kettle"])
+        self.assertEqual([product.name for product in Product.search("boil")], ["Red Kettle"])
+        self.assertEqual(Product.search("toaster").count(), 0)
+
+    def test_search_ranks_name_first(self):
+        """It should rank products whose name starts with the search first"""
+        self._create_search_products()
+        found = [product.name for product in Product.search("steel")]
+        self.assertEqual(found, ["Steel Pan", "Blue Kettle"])
+
+    def test_search_typos(self):
+        """It should Search names with a typo where the trigram index exists"""
+        if db.engine.dialect.name != "postgresql":
+            self.skipTest("Trigram search needs PostgreSQL")
+        with patch.object(Product, "has_trigrams", return_value=True):
+            statement = str(Product.search("ketle").statement.compile(db.engine))
+        self.assertIn("word_similarity", statement)
+        self.assertIn("lower(name) %%>", statement)
+        if not Product.has_trigrams():
+            self.skipTest("pg_trgm is not installed on this server")
+        self._create_search_products()
+        found = [product.name for product in Product.search("ketle")]
+        self.assertEqual(sorted(found), ["Blue Kettle", "Red Kettle"])
+
+    def test_search_with_filters(self):
+        """It should Search products within a filtered query"""
+        self._create_search_products()
+        product = Product.search("teapot").first()
+        product.available = False
+        product.update()
+        found = Product.search("kettle", Product.find_by_filters(available=False))
+        self.assertEqual([product.name for product in found], ["Teapot"])
+
+    def test_search_no_words(self):
+        """It should not Search products without any words"""
+        self.assertRaises(DataValidationError, Product.search, "  !? ")
+
+    def test_find_for_update(self):
+        """It should Find a product by ID for an update"""
+        product = ProductFactory()
+        product.create()
+        found = Product.find_for_update(product.id)
+        self.assertEqual(found.id, product.id)
+        db.session.commit()
+        self.assertIsNone(Product.find_for_update(0))
+
+    def test_find_cached(self):
+        """It should Find a serialized product through the cache"""
+        product = ProductFactory()
+        product.create()
+        misses = cache.product_cache.misses
+        data = Product.find_cached(product.id)
+        self.assertEqual(data, product.serialize())
+        self.assertEqual(cache.product_cache.misses, misses + 1)
+        self.assertEqual(Product.find_cached(str(product.id)), data)
+        self.assertEqual(cache.product_cache.misses, misses + 1)
+        # writes invalidate the cached copy
+        product.price = 1.99
+        product.update()
+        self.assertEqual(Product.find_cached(product.id)["price"], 1.99)
+        self.assertIsNone(Product.find_cached(0))
+        self.assertIsNone(Product.find_cached("abc"))
+
+    def test_find_cached_etag(self):
+        """It should keep the ETag of a cached product with it"""
+        product = ProductFactory()
+        product.create()
+        data, etag = Product.find_cached_etag(product.id)
+        self.assertEqual(etag, Product.etag(product.serialize()))
+        with patch("service.models.dumps") as encode:
+            self.assertEqual(Product.find_cached_etag(product.id), (data, etag))
+        encode.assert_not_called()
+        product.name = "Renamed"
+        product.update()
+        self.assertNotEqual(Product.find_cached_etag(product.id)[1], etag)
+        self.assertEqual(Product.find_cached_etag(0), (None, None))
+
+    def test_find_many_cached(self):
+        """It should Find many serialized products with one query"""
+        products = ProductFactory.create_batch(3)
+        for product in products:
+            product.create()
+        Product.find_cached(products[0].id)
+        hits = cache.product_cache.hits
+        ids = [products[2].id, products[0].id, products[1].id, 0]
+        found = Product.find_many_cached(ids)
+        self.assertEqual(sorted(found), sorted(ids[:3]))
+        for product in products:
+            self.assertEqual(found[product.id], product.serialize())
+        self.assertEqual(cache.product_cache.hits, hits + 1)
+        # the ones read from the database are now cached
+        Product.find_many_cached(ids)
+        self.assertEqual(cache.product_cache.hits, hits + 4)
+        self.assertEqual(Product.find_many_cached([]), {})
+
     def test_find_or_404_found(self):
         """It should Find or return 404 not found"""
         products = ProductFactory.create_batch(3)
@@ -327,6 +618,42 @@ class TestProductModel(unittest.TestCase):
         """It should return 404 not found"""
         self.assertRaises(NotFound, Product.find_or_404, 0)
 
+    def test_aggregate(self):
+        """It should compute counts and price statistics with GROUP BY"""
+        for category, price, available in [
+            (Category.FOOD, 10.0, True),
+            (Category.FOOD, 20.0, False),
+            (Category.FOOD, 30.0, True),
+            (Category.TOYS, 5.0, False),
+        ]:
+            ProductFactory(category=category, price=price, available=available).create()
+        groups = Product.aggregate()
+        self.assertEqual(len(groups), 1)
+        total = groups[0]
+        self.assertEqual(total["count"], 4)
+        self.assertEqual(total["available_count"], 2)
+        self.assertEqual(total["available_ratio"], 0.5)
+        self.assertEqual((total["min_price"], total["max_price"], total["avg_price"]), (5.0, 30.0, 16.25))
+        groups = {group["category"]: group for group in Product.aggregate(group_by=["category"])}
+        self.assertEqual(sorted(groups), ["FOOD", "TOYS"])
+        self.assertEqual(groups["FOOD"]["count"], 3)
+        self.assertEqual(groups["FOOD"]["available_ratio"], 0.6667)
+        self.assertEqual(groups["FOOD"]["avg_price"], 20.0)
+        self.assertEqual(groups["TOYS"]["available_count"], 0)
+        groups = Product.aggregate(Product.find_by_filters(min_price=10.0), ["category", "available"])
+        self.assertEqual(
+            [(group["category"], group["available"], group["count"]) for group in groups],
+            [("FOOD", False, 1), ("FOOD", True, 2)],
+        )
+
+    def test_aggregate_empty_and_bad_dimension(self):
+        """It should aggregate no products and reject unknown dimensions"""
+        total = Product.aggregate()[0]
+        self.assertEqual(total["count"], 0)
+        self.assertEqual(total["available_ratio"], 0.0)
+        self.assertIsNone(total["avg_price"])
+        self.assertRaises(DataValidationError, Product.aggregate, None, ["price"])
+
     def test_create_multiple_products(self):
         """It should Create multiple products and add them to the database"""
         products = Product.all()
@@ -350,3 +677,138 @@ class TestProductModel(unittest.TestCase):
             self.assertEqual(product.category.name, data["category"])
 
             self.assertEqual(created_products[i], product)
+
+    def test_create_multiple_products_with_bad_row(self):
+        """It should not Create any of multiple products when one of them is bad"""
+        products_data = [ProductFactory().to_dict() for _ in range(3)]
+        products_data[1]["price"] = "cheap"
+        self.assertRaises(DataValidationError, Product.create_multiple_products, products_data)
+        self.assertEqual(Product.all(), [])
+        products_data[1]["price"] = 1.5
+        created_products = Product.create_multiple_products(products_data, chunk_size=2)
+        self.assertEqual([product.name for product in created_products], [data["name"] for data in products_data])
+
+    def test_bulk_create(self):
+        """It should Bulk create products in chunks and report bad rows"""
+        products_data = [ProductFactory().to_dict() for _ in range(5)]
+        products_data[2]["category"] = "xxx"
+        ids, errors = Product.bulk_create(products_data, chunk_size=2)
+        self.assertEqual(len(ids), 5)
+        self.assertIsNone(ids[2])
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0]["index"], 2)
+        self.assertEqual(len(Product.all()), 4)
+        for new_id, data in zip(ids, products_data):
+            if new_id is not None:
+                self.assertEqual(Product.find(new_id).name, data["name"])
+
+    def test_bulk_create_database_error(self):
+        """It should only report the rows of a chunk the database rejects"""
+        products_data = [ProductFactory().to_dict() for _ in range(3)]
+        products_data[1]["price"] = None  # price is NOT NULL
+        # let the bad price through validation to reach the database
+        with patch.object(Product, "_validate_price", side_effect=lambda price: price):
+            ids, errors = Product.bulk_create(products_data, chunk_size=2)
+        self.assertIsNone(ids[1])
+        self.assertIsNotNone(ids[0])
+        self.assertIsNotNone(ids[2])
+        self.assertEqual([error["index"] for error in errors], [1])
+        self.assertIn("rejected by the database", errors[0]["message"])
+        self.assertEqual(len(Product.all()), 2)
+
+    def test_bulk_update_database_error(self):
+        """It should only report the rows of a chunk the database rejects"""
+        products = ProductFactory.create_batch(2)
+        for product in products:
+            product.create()
+        products_data = [{"id": product.id, "price": 5.0} for product in products]
+        products_data[0]["price"] = None
+        with patch.object(Product, "_validate_price", side_effect=lambda price: price):
+            updated, missing, errors = Product.bulk_update(products_data, partial=True)
+        self.assertEqual((updated, missing), (1, []))
+        self.assertEqual([error["index"] for error in errors], [0])
+        self.assertEqual(Product.find(products[1].id).price, 5.0)
+
+    def test_bulk_update(self):
+        """It should Bulk update products in chunks and report missing and bad rows"""
+        products = ProductFactory.create_batch(4)
+        for product in products:
+            product.create()
+        Product.find_cached(products[0].id)
+        products_data = [ProductFactory().to_dict() for _ in range(5)]
+        for product, data in zip(products, products_data):
+            data["id"] = product.id
+        products_data[1]["id"] = str(products[1].id)
+        products_data[2]["category"] = "xxx"
+        products_data[4]["id"] = 0
+        updated, missing, errors = Product.bulk_update(products_data, chunk_size=2)
+        self.assertEqual(updated, 3)
+        self.assertEqual(missing, [0])
+        self.assertEqual([error["index"] for error in errors], [2])
+        for index in (0, 1, 3):
+            self.assertEqual(Product.find(products[index].id).name, products_data[index]["name"])
+        # the cached copy was invalidated
+        self.assertEqual(Product.find_cached(products[0].id)["name"], products_data[0]["name"])
+
+    def test_bulk_update_partial(self):
+        """It should Bulk update only the given fields of products"""
+        products = ProductFactory.create_batch(2)
+        for product in products:
+            product.create()
+        names = [product.name for product in products]
+        updated, missing, errors = Product.bulk_update(
+            [{"id": products[0].id, "price": 1.5}, {"id": products[1].id, "available": True}, {"price": 2.5}],
+            partial=True,
+        )
+        self.assertEqual((updated, missing), (2, []))
+        self.assertEqual(errors, [{"index": 2, "message": "Invalid Product: bad or missing id"}])
+        self.assertEqual(Product.find(products[0].id).price, 1.5)
+        self.assertTrue(Product.find(products[1].id).available)
+        self.assertEqual([Product.find(product.id).name for product in products], names)
+
+    def test_update_where(self):
+        """It should set the same values on every product matching a filter"""
+        products = ProductFactory.create_batch(7)
+        for product in products:
+            product.create()
+        Product.find_cached(products[0].id)
+        category = products[0].category
+        expected = [product.id for product in products if product.category == category]
+        query = Product.find_by_filters(category=category)
+        updated = Product.update_where(query, {"price": 0.99}, chunk_size=2)
+        self.assertEqual(updated, len(expected))
+        prices = {product.id: product.price for product in Product.all()}
+        self.assertEqual(sorted(key for key, price in prices.items() if price == 0.99), sorted(expected))
+        self.assertEqual(Product.find_cached(products[0].id)["price"], 0.99)
+
+    def test_delete_where(self):
+        """It should delete every product matching a filter"""
+        products = ProductFactory.create_batch(7)
+        for product in products:
+            product.create()
+        ids = [products[0].id, products[3].id, products[5].id]
+        Product.find_cached(ids[0])
+        deleted = Product.delete_where(Product.find_by_filters(ids=ids), chunk_size=2)
+        self.assertEqual(deleted, 3)
+        self.assertEqual(len(Product.all()), 4)
+        self.assertIsNone(Product.find_cached(ids[0]))
+        self.assertEqual(Product.delete_where(Product.find_by_filters(), chunk_size=3), 4)
+        self.assertEqual(Product.all(), [])
+
+    def test_validate_partial(self):
+        """It should validate only the fields present in partial data"""
+        self.assertEqual(
+            Product.validate({"price": 9.5, "category": "FOOD"}, partial=True),
+            {"price": 9.5, "category": Category.FOOD},
+        )
+        self.assertRaises(DataValidationError, Product.validate, {"available": "no"}, True)
+        self.assertRaises(DataValidationError, Product.validate, {"id": 1}, True)
+        self.assertRaises(DataValidationError, Product.validate, [1, 2], True)
+
+    def test_init_db_without_schema(self):
+        """It should only create the tables when asked to"""
+        with patch.object(db, "create_all") as create_all:
+            Product.init_db(app, create_schema=False)
+            create_all.assert_not_called()
+            Product.init_db(app)
+            create_all.assert_called_once()
@@ -0,0 +1,60 @@
+"""
+Test cases for the SQL profiler
+"""
+from unittest import TestCase
+from flask import Flask
+from sqlalchemy import create_engine, text
+from service import config
+from service.common import profiling
+from service.common.profiling import QueryRecord
+
+
+class TestProfiling(TestCase):
+    """Test Cases for profiling the SQL of requests"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.from_object(config)
+        self.engine = create_engine("sqlite://")
+
+    def test_toggle(self):
+        """It should turn profiling on and off at runtime"""
+        self.assertFalse(profiling.is_enabled(self.app))
+        settings = profiling.configure(self.app, enabled=True, query_budget=3)
+        self.assertTrue(settings["enabled"])
+        self.assertEqual(settings["query_budget"], 3)
+        self.assertTrue(profiling.is_enabled(self.app))
+
+    def test_toggle_with_file(self):
+        """It should turn profiling on for every worker with a file"""
+        self.app.config["SQL_PROFILING_FILE"] = __file__
+        profiling._flag_file["checked"] = 0.0  # pylint: disable=protected-access
+        self.assertTrue(profiling.is_enabled(self.app))
+
+    def test_explain(self):
+        """It should explain a statement on its own connection"""
+        with self.engine.begin() as connection:
+            connection.execute(text("CREATE TABLE product (id INTEGER PRIMARY KEY, name TEXT)"))
+        plan = profiling.explain(self.engine, "SELECT * FROM product WHERE id = ?", (1,))
+        self.assertIn("product", plan)
+        self.assertEqual(profiling.explain(self.engine, "VACUUM", None), "(no plan)")
+        self.assertIn("EXPLAIN failed", profiling.explain(self.engine, "SELECT * FROM missing", None))
+
+    def test_report(self):
+        """It should report the slow queries, the budget and repeated statements"""
+        self.app.config.update(SQL_SLOW_QUERY_MS=50, SQL_QUERY_BUDGET=5, SQL_REPEAT_THRESHOLD=5)
+        queries = [QueryRecord(self.engine, "SELECT 1", None, 0.001) for _ in range(6)]
+        queries.append(QueryRecord(self.engine, "SELECT 2", None, 0.1))
+        with self.app.test_request_context("/api/products", method="GET"):
+            with self.assertLogs(self.app.logger, "WARNING") as logs:
+                result = profiling.report(self.app, queries)
+        self.assertEqual(result["request"], "GET /api/products")
+        self.assertEqual(result["queries"], 7)
+        self.assertAlmostEqual(result["db_ms"], 106, places=3)
+        self.assertTrue(result["over_budget"])
+        self.assertEqual(result["repeated"], [{"statement": "SELECT 1", "count": 6}])
+        self.assertEqual(len(result["statements"]), 7)
+        messages = "\n".join(logs.output)
+        self.assertIn("Slow query (100.0 ms) in GET /api/products: SELECT 2", messages)
+        self.assertIn("ran 7 queries, over the budget of 5", messages)
+        self.assertIn("Possible N+1 in GET /api/products, ran 6 times: SELECT 1", messages)
@@ -5,13 +5,20 @@ Test cases can be run with the following:
   nosetests -v --with-spec --spec-color
   coverage report -m
 """
+# pylint: disable=too-many-lines
 import os
+import csv
+import gzip
+import json
 import logging
-from unittest import TestCase
+import tempfile
+from unittest import TestCase, skipIf
+from unittest.mock import patch
 from urllib.parse import quote_plus
 from service import app
 from service.models import db, init_db, Product, Category
 from service.common import status  # HTTP Status Codes
+from service.common import cache, compression, metrics, profiling, replicas
 from tests.factories import ProductFactory
 
 
@@ -21,6 +28,12 @@ DATABASE_URI = os.getenv(
 
 BASE_URL = "/api/products"
 COLLECT_URL = "/api/products/collect"
+EXPORT_URL = "/api/products/export"
+BULK_URL = "/api/products/bulk"
+SEARCH_URL = "/api/products/search"
+BATCH_GET_URL = "/api/products/batch-get"
+AVAILABILITY_URL = "/api/products/change_availability"
+AGGREGATES_URL = "/api/products/aggregates"
 CONTENT_TYPE_JSON = "application/json"
 
 
@@ -51,6 +64,7 @@ class TestYourResourceServer(TestCase):
         self.client = app.test_client()
         db.session.query(Product).delete()  # clean up the last tests
         db.session.commit()
+        cache.product_cache.clear()
 
     def tearDown(self):
         """This runs after each test"""
@@ -88,6 +102,38 @@ class TestYourResourceServer(TestCase):
         resp = self.client.get("/")
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
 
+    def test_stats(self):
+        """It should return the cache and pool statistics"""
+        response = self.client.get("/stats")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertIn("hits", data["cache"])
+        self.assertIn("misses", data["cache"])
+        self.assertIn("class", data["pool"])
+        self.assertEqual(data["replicas"], [])
+
+    def test_read_replica(self):
+        """It should list from the replica and read the writes of a client from the primary"""
+        app.config["DATABASE_REPLICA_URIS"] = [
+            "sqlite:///" + os.path.join(tempfile.gettempdir(), "products-routes-replica.db")
+        ]
+        replica = replicas.configure(app)[0]
+        try:
+            db.metadata.drop_all(replica.engine)
+            db.metadata.create_all(replica.engine)
+            response = self.client.post(BASE_URL, json=ProductFactory().serialize())
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertIn(replicas.STICKY_COOKIE, response.headers["Set-Cookie"])
+            # the client that wrote reads the primary, the others the replica
+            self.assertEqual(len(self.client.get(BASE_URL).get_json()), 1)
+            self.assertEqual(app.test_client().get(BASE_URL).get_json(), [])
+            data = self.client.get("/stats").get_json()
+            self.assertEqual([stats["name"] for stats in data["replicas"]], ["replica-0"])
+        finally:
+            db.metadata.drop_all(replica.engine)
+            app.config["DATABASE_REPLICA_URIS"] = []
+            replicas.configure(app)
+
     def test_get_product_list(self):
         """It should Get a list of Products"""
         self._create_products(5)
@@ -145,6 +191,194 @@ class TestYourResourceServer(TestCase):
         for product in data:
             self.assertEqual(product["available"], test_availability)
 
+    def test_get_product_list_paginated(self):
+        """It should page through the Products with a cursor"""
+        products = self._create_products(5)
+        response = self.client.get(BASE_URL, query_string="limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual([product["id"] for product in data], [p.id for p in products[:2]])
+        seen = [product["id"] for product in data]
+        while "Link" in response.headers:
+            link = response.headers["Link"]
+            self.assertTrue(link.endswith('; rel="next"'))
+            next_url = link[link.index("<") + 1:link.index(">")]
+            self.assertIn("limit=2", next_url)
+            response = self.client.get(next_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.get_json()
+            self.assertLessEqual(len(data), 2)
+            seen.extend(product["id"] for product in data)
+        self.assertEqual(seen, [product.id for product in products])
+
+    def test_get_product_list_sorted(self):
+        """It should page through the Products sorted by price"""
+        products = self._create_products(7)
+        for order, reverse in (("asc", False), ("desc", True)):
+            response = self.client.get(BASE_URL, query_string=f"sort=price&order={order}&limit=3")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen = [product["id"] for product in response.get_json()]
+            while "Link" in response.headers:
+                link = response.headers["Link"]
+                response = self.client.get(link[link.index("<") + 1:link.index(">")])
+                seen.extend(product["id"] for product in response.get_json())
+            expected = sorted(products, key=lambda product: (product.price, int(product.id)), reverse=reverse)
+            self.assertEqual(seen, [product.id for product in expected])
+
+    def test_get_product_list_sorted_with_filter(self):
+        """It should List the cheapest available Products of a category"""
+        products = self._create_products(10)
+        category = products[0].category
+        response = self.client.get(
+            BASE_URL, query_string=f"category={category.name}&available=true&sort=price&limit=2"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = sorted(
+            (product for product in products if product.category == category and product.available),
+            key=lambda product: (product.price, int(product.id)),
+        )
+        self.assertEqual([product["id"] for product in response.get_json()], [p.id for p in expected[:2]])
+
+    def test_get_product_list_some_fields(self):
+        """It should List only the requested fields of the Products"""
+        products = self._create_products(5)
+        response = self.client.get(BASE_URL, query_string="fields=id,name,price")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(
+            data, [{"id": p.id, "name": p.name, "price": p.price} for p in products]
+        )
+        # the sort column and id are still used for the cursor
+        response = self.client.get(BASE_URL, query_string="fields=name&sort=price&limit=2")
+        seen = list(response.get_json())
+        while "Link" in response.headers:
+            link = response.headers["Link"]
+            response = self.client.get(link[link.index("<") + 1:link.index(">")])
+            seen.extend(response.get_json())
+        expected = sorted(products, key=lambda product: (product.price, int(product.id)))
+        self.assertEqual(seen, [{"name": product.name} for product in expected])
+
+    def test_get_product_list_paginated_with_filter(self):
+        """It should keep the filter when following the next page"""
+        products = self._create_products(10)
+        test_availability = products[0].available
+        expected = [p.id for p in products if p.available == test_availability]
+        response = self.client.get(
+            BASE_URL, query_string=f"available={test_availability}&limit=1"
+        )
+        seen = [product["id"] for product in response.get_json()]
+        while "Link" in response.headers:
+            link = response.headers["Link"]
+            response = self.client.get(link[link.index("<") + 1:link.index(">")])
+            seen.extend(product["id"] for product in response.get_json())
+        self.assertEqual(seen, expected)
+
+    def test_get_product_list_limit_is_capped(self):
+        """It should never return more than the maximum page size"""
+        self._create_products(3)
+        page_size_max = app.config["PAGE_SIZE_MAX"]
+        app.config["PAGE_SIZE_MAX"] = 2
+        try:
+            response = self.client.get(BASE_URL, query_string="limit=500")
+        finally:
+            app.config["PAGE_SIZE_MAX"] = page_size_max
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_json()), 2)
+        self.assertIn("limit=2", response.headers["Link"])
+
+    def test_get_product_list_last_page(self):
+        """It should not send a next Link on the last page"""
+        self._create_products(2)
+        response = self.client.get(BASE_URL, query_string="limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_json()), 2)
+        self.assertNotIn("Link", response.headers)
+
+    def test_query_product_list_by_multiple_filters(self):
+        """It should Query Products by Category and availability together"""
+        products = self._create_products(20)
+        test_category = products[0].category.name
+        test_availability = products[0].available
+        expected = [
+            product.id for product in products
+            if product.category.name == test_category
+            and product.available == test_availability
+        ]
+        response = self.client.get(
+            BASE_URL,
+            query_string=f"category={test_category}&available={test_availability}",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual([product["id"] for product in data], expected)
+
+    def test_query_product_list_by_price_range_and_ids(self):
+        """It should Query Products by price range and ids"""
+        products = self._create_products(10)
+        prices = sorted(product.price for product in products)
+        low, high = prices[2], prices[7]
+        ids = [product.id for product in products[:5]]
+        expected = [
+            product.id for product in products[:5] if low <= product.price <= high
+        ]
+        response = self.client.get(
+            BASE_URL,
+            query_string=f"min_price={low}&max_price={high}&ids={','.join(ids)}",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual([product["id"] for product in data], expected)
+
+    def test_batch_get_products(self):
+        """It should Read many Products in the requested order"""
+        products = self._create_products(3)
+        ids = [int(products[2].id), 0, int(products[0].id), int(products[1].id), int(products[2].id)]
+        response = self.client.post(BATCH_GET_URL, json={"ids": ids})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(
+            [product["id"] for product in data["products"]],
+            [products[2].id, products[0].id, products[1].id],
+        )
+        self.assertEqual(data["products"][0]["name"], products[2].name)
+        self.assertEqual(data["missing"], [0])
+
+    def test_search_products(self):
+        """It should Search Products one page at a time"""
+        for name in ["Eco Kettle", "Pro Kettle", "Kettle Descaler", "Tea Cup"]:
+            product = ProductFactory(name=name, description="Kitchen ware")
+            response = self.client.post(BASE_URL, json=product.serialize())
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(SEARCH_URL, query_string="q=kettle&limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        # the name starting with the search is the most relevant
+        self.assertEqual(data[0]["name"], "Kettle Descaler")
+        self.assertEqual(len(data), 2)
+        self.assertIn('rel="next"', response.headers["Link"])
+        next_url = response.headers["Link"].split(">")[0].lstrip("<")
+        response = self.client.get(next_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data += response.get_json()
+        self.assertNotIn("Link", response.headers)
+        self.assertEqual(
+            sorted(product["name"] for product in data),
+            ["Eco Kettle", "Kettle Descaler", "Pro Kettle"],
+        )
+        response = self.client.get(SEARCH_URL, query_string="q=kitch")
+        self.assertEqual(len(response.get_json()), 4)
+
+    def test_search_products_with_filters(self):
+        """It should Search Products together with the listing filters"""
+        products = self._create_products(10)
+        category = products[0].category
+        response = self.client.get(
+            SEARCH_URL, query_string=f"q=needs&category={category.name}"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = [product for product in products if product.category == category]
+        self.assertEqual(len(response.get_json()), len(expected))
+
     def test_create_product(self):
         """It should Create a new Product"""
         test_product = ProductFactory()
@@ -200,6 +434,192 @@ class TestYourResourceServer(TestCase):
             )
             self.assertEqual(new_products[i]["category"], test_product_data["category"])
 
+    def test_create_collect_products_bad_request(self):
+        """It should not Create any of multiple Products when one of them is bad"""
+        test_products_data = [ProductFactory().to_dict() for _ in range(2)]
+        test_products_data[1]["price"] = "cheap"
+        response = self.client.post(COLLECT_URL, json=test_products_data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("index 1", response.get_json()["message"])
+        self.assertEqual(self.client.get(BASE_URL).get_json(), [])
+        response = self.client.post(COLLECT_URL, json=test_products_data[0])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_aggregate_products(self):
+        """It should Aggregate the Products by category"""
+        products = self._create_products(8)
+        response = self.client.get(AGGREGATES_URL, query_string="group_by=category")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        groups = response.get_json()
+        self.assertEqual(sum(group["count"] for group in groups), 8)
+        for group in groups:
+            prices = [product.price for product in products if product.category.name == group["category"]]
+            self.assertEqual(group["count"], len(prices))
+            self.assertEqual(group["min_price"], min(prices))
+            self.assertEqual(group["max_price"], max(prices))
+        etag = response.headers["ETag"]
+        response = self.client.get(
+            AGGREGATES_URL, query_string="group_by=category", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(AGGREGATES_URL, query_string="available=true")
+        self.assertEqual(
+            response.get_json()[0]["count"], len([product for product in products if product.available])
+        )
+
+    def test_export_products_ndjson(self):
+        """It should Export all Products as NDJSON"""
+        products = self._create_products(5)
+        response = self.client.get(EXPORT_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 5)
+        for product, line in zip(products, lines):
+            data = json.loads(line)
+            self.assertEqual(data["id"], int(product.id))
+            self.assertEqual(data["name"], product.name)
+            self.assertEqual(data["category"], product.category.name)
+
+    def test_export_products_csv(self):
+        """It should Export all Products as CSV"""
+        products = self._create_products(3)
+        response = self.client.get(EXPORT_URL, query_string="format=csv")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "text/csv")
+        rows = list(csv.DictReader(response.get_data(as_text=True).splitlines()))
+        self.assertEqual(len(rows), 3)
+        for product, row in zip(products, rows):
+            self.assertEqual(row["id"], str(product.id))
+            self.assertEqual(row["name"], product.name)
+            self.assertEqual(float(row["price"]), product.price)
+            self.assertEqual(row["available"], str(product.available))
+
+    def test_export_products_some_fields(self):
+        """It should Export only the requested columns"""
+        products = self._create_products(2)
+        response = self.client.get(EXPORT_URL, query_string="format=csv&fields=name,id")
+        rows = list(csv.reader(response.get_data(as_text=True).splitlines()))
+        self.assertEqual(rows[0], ["id", "name"])
+        self.assertEqual(rows[1:], [[product.id, product.name] for product in products])
+        response = self.client.get(EXPORT_URL, query_string="fields=price")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{"price": p.price} for p in products])
+
+    def test_export_no_products(self):
+        """It should Export an empty catalog"""
+        response = self.client.get(EXPORT_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_data(as_text=True), "")
+        response = self.client.get(EXPORT_URL, query_string="format=csv")
+        self.assertEqual(response.get_data(as_text=True).splitlines()[0].split(",")[0], "id")
+
+    def test_bulk_create_products(self):
+        """It should Bulk create Products and return their ids"""
+        test_products_data = [ProductFactory().to_dict() for _ in range(7)]
+        chunk_size = app.config["BULK_CHUNK_SIZE"]
+        app.config["BULK_CHUNK_SIZE"] = 3
+        try:
+            response = self.client.post(BULK_URL, json=test_products_data)
+        finally:
+            app.config["BULK_CHUNK_SIZE"] = chunk_size
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.get_json()
+        self.assertEqual(data["created"], 7)
+        self.assertEqual(data["errors"], [])
+        self.assertEqual(len(data["ids"]), 7)
+        for new_id, test_product_data in zip(data["ids"], test_products_data):
+            product = Product.find(new_id)
+            self.assertEqual(product.name, test_product_data["name"])
+            self.assertEqual(product.price, test_product_data["price"])
+            self.assertEqual(product.category.name, test_product_data["category"])
+
+    def test_bulk_create_products_with_bad_rows(self):
+        """It should Bulk create the good Products and report the bad ones"""
+        test_products_data = [ProductFactory().to_dict() for _ in range(4)]
+        test_products_data[1]["available"] = "yes"
+        del test_products_data[3]["price"]
+        response = self.client.post(BULK_URL, json=test_products_data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.get_json()
+        self.assertEqual(data["created"], 2)
+        self.assertEqual([error["index"] for error in data["errors"]], [1, 3])
+        self.assertIsNone(data["ids"][1])
+        self.assertIsNone(data["ids"][3])
+        self.assertEqual(Product.find(data["ids"][2]).name, test_products_data[2]["name"])
+        self.assertEqual(len(Product.all()), 2)
+
+    def test_bulk_create_products_with_bad_price(self):
+        """It should Bulk create the good Products of a chunk with a bad price"""
+        test_products_data = [ProductFactory().to_dict() for _ in range(2)]
+        test_products_data[1]["price"] = None
+        response = self.client.post(BULK_URL, json=test_products_data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.get_json()
+        self.assertEqual(data["created"], 1)
+        self.assertEqual([error["index"] for error in data["errors"]], [1])
+        self.assertIn("price", data["errors"][0]["message"])
+
+    def test_bulk_update_products(self):
+        """It should Bulk update Products and report the missing ones"""
+        products = self._create_products(3)
+        products_data = []
+        for product in products:
+            data = ProductFactory().to_dict()
+            data["id"] = product.id
+            products_data.append(data)
+        products_data[2]["id"] = "0"
+        response = self.client.put(BULK_URL, json=products_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["updated"], 2)
+        self.assertEqual(data["missing"], [0])
+        self.assertEqual(data["errors"], [])
+        for product, product_data in zip(products[:2], products_data):
+            response = self.client.get(f"{BASE_URL}/{product.id}")
+            self.assertEqual(response.get_json()["name"], product_data["name"])
+
+    def test_bulk_patch_products(self):
+        """It should Bulk update some fields of each Product"""
+        products = self._create_products(2)
+        response = self.client.patch(
+            BULK_URL, json=[{"id": product.id, "price": 5.25} for product in products]
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["updated"], 2)
+        for product in products:
+            response = self.client.get(f"{BASE_URL}/{product.id}")
+            data = response.get_json()
+            self.assertEqual(data["price"], 5.25)
+            self.assertEqual(data["name"], product.name)
+
+    def test_bulk_patch_products_by_filter(self):
+        """It should Bulk update every Product matching the filters"""
+        products = self._create_products(6)
+        category = products[0].category
+        expected = [product for product in products if product.category == category]
+        response = self.client.patch(
+            BULK_URL, query_string=f"category={category.name}", json={"available": False}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["updated"], len(expected))
+        response = self.client.get(BASE_URL, query_string=f"category={category.name}&available=false")
+        self.assertEqual(len(response.get_json()), len(expected))
+
+    def test_bulk_delete_products(self):
+        """It should Bulk delete Products by ids, by filter and all of them"""
+        products = self._create_products(5)
+        ids = ",".join(product.id for product in products[:2])
+        response = self.client.delete(BULK_URL, query_string=f"ids={ids}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), {"deleted": 2})
+        response = self.client.get(f"{BASE_URL}/{products[0].id}")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.delete(BULK_URL, query_string="all=true")
+        self.assertEqual(response.get_json(), {"deleted": 3})
+        self.assertEqual(self.client.get(BASE_URL).get_json(), [])
+
     def test_update_product(self):
         """It should update a Product"""
 
@@ -228,6 +648,37 @@ class TestYourResourceServer(TestCase):
         self.assertEqual(new_product["image_url"], test_product_new.image_url)
         self.assertEqual(new_product["category"], test_product_new.category.name)
 
+    def test_patch_product(self):
+        """It should Update only the posted fields of a Product"""
+        test_product = self._create_products(1)[0]
+        self.client.get(f"{BASE_URL}/{test_product.id}")
+        response = self.client.patch(f"{BASE_URL}/{test_product.id}", json={"price": 7.25})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        etag = response.headers["ETag"]
+        self.assertEqual(data["id"], test_product.id)
+        self.assertEqual(data["price"], 7.25)
+        self.assertEqual(data["name"], test_product.name)
+        self.assertEqual(data["category"], test_product.category.name)
+        # the cached copy was replaced
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.assertEqual(response.get_json(), data)
+        self.assertEqual(response.headers["ETag"], etag)
+
+    def test_patch_product_if_match(self):
+        """It should only Patch a Product whose ETag matches If-Match"""
+        test_product = self._create_products(1)[0]
+        etag = self.client.get(f"{BASE_URL}/{test_product.id}").headers["ETag"]
+        response = self.client.patch(
+            f"{BASE_URL}/{test_product.id}", json={"name": "Renamed"}, headers={"If-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        response = self.client.patch(
+            f"{BASE_URL}/{test_product.id}", json={"name": "Again"}, headers={"If-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
     def test_delete_product(self):
         """It should Delete a Product"""
         test_product = self._create_products(1)[0]
@@ -244,6 +695,229 @@ class TestYourResourceServer(TestCase):
         data = response.get_json()
         self.assertEqual(data["name"], test_product.name)
 
+    def test_read_product_some_fields(self):
+        """It should Read only the requested fields of a Product"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}", query_string="fields=name,category")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.get_json(), {"name": test_product.name, "category": test_product.category.name}
+        )
+        etag = response.headers["ETag"]
+        self.assertNotEqual(self.client.get(f"{BASE_URL}/{test_product.id}").headers["ETag"], etag)
+        response = self.client.get(
+            f"{BASE_URL}/{test_product.id}", query_string="fields=name,category", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @skipIf(metrics.prometheus_client is None, "prometheus_client is not installed")
+    def test_metrics(self):
+        """It should count the requests and their queries in the metrics"""
+        self._create_products(3)
+        registry = metrics.prometheus_client.REGISTRY
+        labels = {"method": "GET", "route": "/api/products", "status": "200"}
+
+        def sample(name, **sample_labels):
+            return registry.get_sample_value(name, sample_labels) or 0
+
+        requests = sample("http_requests_total", **labels)
+        queries = sample("http_request_db_queries_sum", route="/api/products")
+        self.assertEqual(self.client.get(BASE_URL).status_code, status.HTTP_200_OK)
+        self.assertEqual(sample("http_requests_total", **labels), requests + 1)
+        self.assertEqual(sample("http_request_duration_seconds_count", **labels), requests + 1)
+        self.assertEqual(sample("http_request_db_queries_sum", route="/api/products"), queries + 1)
+        self.assertGreater(sample("http_request_serialization_seconds_sum", route="/api/products"), 0)
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        text = response.get_data(as_text=True)
+        self.assertIn('http_requests_total{method="GET",route="/api/products",status="200"}', text)
+        self.assertIn('route="/api/products/<product_id>"', text)
+
+    def test_sql_profiling(self):
+        """It should profile the SQL of requests once it is turned on"""
+        self._create_products(2)
+        self.assertNotIn("Server-Timing", self.client.get(BASE_URL).headers)
+        response = self.client.put("/profiling", json={"enabled": True, "query_budget": 0})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.get_json()["enabled"])
+        try:
+            response = self.client.get(BASE_URL)
+            self.assertTrue(response.headers["Server-Timing"].startswith('db;desc="1 queries";dur='))
+            profile = self.client.get("/profiling").get_json()["requests"][-1]
+        finally:
+            profiling.configure(app, enabled=False, query_budget=10)
+        self.assertEqual(profile["request"], "GET /api/products")
+        self.assertEqual(profile["queries"], 1)
+        self.assertTrue(profile["over_budget"])
+        self.assertIn("FROM product", profile["statements"][0]["statement"])
+
+    def test_sql_profiling_bad_settings(self):
+        """It should not change the SQL profiling with bad settings"""
+        for data in (None, [], {"enabled": "yes"}, {"query_budget": -1}, {"verbose": True}):
+            response = self.client.put("/profiling", json=data)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(self.client.get("/profiling").get_json()["settings"]["enabled"])
+
+    def test_compress_product_list(self):
+        """It should compress a large page of Products with gzip"""
+        Product.bulk_create([ProductFactory().to_dict() for _ in range(50)])
+        plain = self.client.get(BASE_URL)
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertIn("Accept-Encoding", plain.headers["Vary"])
+        response = self.client.get(BASE_URL, headers={"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertLess(len(response.data), len(plain.data))
+        self.assertEqual(int(response.headers["Content-Length"]), len(response.data))
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+        # the compressed page carries a strong ETag of its own naming the coding
+        etag = response.headers["ETag"]
+        self.assertEqual(etag, plain.headers["ETag"][:-1] + '-gzip"')
+        response = self.client.get(BASE_URL, headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.headers["ETag"], etag)
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.headers["ETag"], plain.headers["ETag"])
+        response = self.client.get(BASE_URL, headers={"Accept-Encoding": "identity, *;q=0"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    @skipIf(compression.brotli is None, "brotli is not installed")
+    def test_compress_product_list_brotli(self):
+        """It should prefer brotli when the client accepts it"""
+        Product.bulk_create([ProductFactory().to_dict() for _ in range(50)])
+        plain = self.client.get(BASE_URL)
+        response = self.client.get(BASE_URL, headers={"Accept-Encoding": "gzip, deflate, br"})
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+        self.assertEqual(compression.brotli.decompress(response.data), plain.data)
+
+    def test_compress_small_product(self):
+        """It should not compress a response below the size threshold"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        etag = response.headers["ETag"]
+        data = test_product.serialize()
+        data["name"] = "renamed"
+        # If-Match compares strongly: a weak ETag never matches
+        response = self.client.put(f"{BASE_URL}/{test_product.id}", json=data, headers={"If-Match": "W/" + etag})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        # the ETag of a compressed copy names the same content
+        response = self.client.put(
+            f"{BASE_URL}/{test_product.id}", json=data, headers={"If-Match": etag[:-1] + '-gzip"'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_compress_export(self):
+        """It should compress the streamed export"""
+        self._create_products(20)
+        plain = self.client.get(EXPORT_URL)
+        response = self.client.get(EXPORT_URL, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Length", response.headers)
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+        self.assertEqual(len(plain.data.splitlines()), 20)
+
+    def test_read_product_from_cache(self):
+        """It should serve a repeated Read from the cache"""
+        test_product = self._create_products(1)[0]
+        self.client.get(f"{BASE_URL}/{test_product.id}")
+        hits = cache.product_cache.hits
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["name"], test_product.name)
+        self.assertEqual(cache.product_cache.hits, hits + 1)
+
+    def test_read_product_after_update(self):
+        """It should not serve a stale Product after an update"""
+        test_product = self._create_products(1)[0]
+        self.client.get(f"{BASE_URL}/{test_product.id}")
+        new_data = ProductFactory().serialize()
+        response = self.client.put(f"{BASE_URL}/{test_product.id}", json=new_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.assertEqual(response.get_json()["name"], new_data["name"])
+        self.client.put(f"{BASE_URL}/{test_product.id}/change_availability")
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.assertEqual(response.get_json()["available"], not new_data["available"])
+        self.client.delete(f"{BASE_URL}/{test_product.id}")
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_read_product_not_modified(self):
+        """It should return 304 when the Product ETag still matches"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        etag = response.headers["ETag"]
+        self.assertTrue(etag.startswith('"'))
+        # the ETag is cached with the Product, nothing is encoded for a 304
+        with patch("service.routes.dumps") as encode, patch("service.models.dumps") as encode_product:
+            response = self.client.get(
+                f"{BASE_URL}/{test_product.id}", headers={"If-None-Match": etag}
+            )
+        encode.assert_not_called()
+        encode_product.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+        # a change gives the Product a new ETag
+        self.client.put(f"{BASE_URL}/{test_product.id}/change_availability")
+        response = self.client.get(
+            f"{BASE_URL}/{test_product.id}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_get_product_list_not_modified(self):
+        """It should return 304 when the page ETag still matches"""
+        self._create_products(3)
+        response = self.client.get(BASE_URL)
+        etag = response.headers["ETag"]
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.data, b"")
+        self._create_products(1)
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_json()), 4)
+
+    def test_update_product_if_match(self):
+        """It should only Update a Product whose ETag matches If-Match"""
+        test_product = self._create_products(1)[0]
+        etag = self.client.get(f"{BASE_URL}/{test_product.id}").headers["ETag"]
+        new_data = ProductFactory().serialize()
+        response = self.client.put(
+            f"{BASE_URL}/{test_product.id}", json=new_data, headers={"If-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        new_etag = response.headers["ETag"]
+        self.assertNotEqual(new_etag, etag)
+        # the old ETag is now stale
+        response = self.client.put(
+            f"{BASE_URL}/{test_product.id}", json=new_data, headers={"If-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.assertEqual(response.headers["ETag"], new_etag)
+
+    def test_delete_product_if_match(self):
+        """It should only Delete a Product whose ETag matches If-Match"""
+        test_product = self._create_products(1)[0]
+        etag = self.client.get(f"{BASE_URL}/{test_product.id}").headers["ETag"]
+        response = self.client.delete(
+            f"{BASE_URL}/{test_product.id}", headers={"If-Match": '"stale"'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.delete(
+            f"{BASE_URL}/{test_product.id}", headers={"If-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.delete(
+            f"{BASE_URL}/{test_product.id}", headers={"If-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
     def test_read_product_not_found(self):
         """It should not Read a Product that not be found"""
         response = self.client.get(f"{BASE_URL}/0")
@@ -273,6 +947,42 @@ class TestYourResourceServer(TestCase):
         updated_product = Product.query.get(test_product.id)
         self.assertFalse(updated_product.available)
 
+    def test_set_product_availability(self):
+        """It should Set the availability of a Product explicitly"""
+        test_product = self._create_products(1)[0]
+        for available in (True, True, False):
+            response = self.client.put(
+                f"{BASE_URL}/{test_product.id}/change_availability", json={"available": available}
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.get_json()
+            self.assertEqual(data["available"], available)
+            self.assertEqual(data["message"], f"Product availability changed to {available}")
+        response = self.client.put(
+            f"{BASE_URL}/{test_product.id}/change_availability", json={"available": "no"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_change_product_availability(self):
+        """It should Flip or Set the availability of many Products"""
+        products = self._create_products(4)
+        ids = ",".join(product.id for product in products[:3])
+        response = self.client.put(AVAILABILITY_URL, query_string=f"ids={ids}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), {"updated": 3})
+        for product in products:
+            data = self.client.get(f"{BASE_URL}/{product.id}").get_json()
+            flipped = product in products[:3]
+            self.assertEqual(data["available"], product.available != flipped)
+        response = self.client.put(AVAILABILITY_URL, query_string="all=true", json={"available": True})
+        self.assertEqual(response.get_json(), {"updated": 4})
+        response = self.client.get(BASE_URL, query_string="available=false")
+        self.assertEqual(response.get_json(), [])
+        response = self.client.put(AVAILABILITY_URL, json={"available": True})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(AVAILABILITY_URL, query_string="all=true", json=[True])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_change_product_availability_not_found(self):
         """It should not Change the availability of a Product that not be found"""
         response = self.client.put(f"{BASE_URL}/0/change_availability")
@@ -328,6 +1038,148 @@ class TestYourResourceServer(TestCase):
         response = self.client.post(BASE_URL, json=test_product)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_get_product_list_bad_cursor(self):
+        """It should not List Products with a bad cursor"""
+        response = self.client.get(BASE_URL, query_string="cursor=not-a-cursor")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(BASE_URL, query_string="cursor=eyJpZCI6ICJ4In0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_product_list_bad_sort(self):
+        """It should not List Products with a bad sort or a cursor of another sort"""
+        response = self.client.get(BASE_URL, query_string="sort=description")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(BASE_URL, query_string="sort=price&order=up")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self._create_products(2)
+        response = self.client.get(BASE_URL, query_string="sort=price&limit=1")
+        link = response.headers["Link"]
+        next_url = link[link.index("<") + 1:link.index(">")].replace("sort=price", "sort=name")
+        response = self.client.get(next_url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_product_bad_fields(self):
+        """It should not return unknown fields of Products"""
+        response = self.client.get(BASE_URL, query_string="fields=id,secret")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}/1", query_string="fields=secret")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(SEARCH_URL, query_string="q=tool&fields=secret")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_product_list_bad_limit(self):
+        """It should not List Products with a bad limit"""
+        response = self.client.get(BASE_URL, query_string="limit=0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_bad_format(self):
+        """It should not Export Products in an unknown format"""
+        response = self.client.get(EXPORT_URL, query_string="format=xml")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_product_list_bad_filters(self):
+        """It should not Query Products with bad filters"""
+        response = self.client.get(BASE_URL, query_string="category=xxx")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(BASE_URL, query_string="ids=1,two")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(BASE_URL, query_string="min_price=cheap")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_get_products_bad_request(self):
+        """It should not Read many Products with bad or too many ids"""
+        response = self.client.post(BATCH_GET_URL, json=[1, 2])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(BATCH_GET_URL, json={"ids": [1, "two"]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        too_many = list(range(1, app.config["BATCH_GET_MAX"] + 2))
+        response = self.client.post(BATCH_GET_URL, json={"ids": too_many})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_products_bad_request(self):
+        """It should not Search Products without words or with a bad cursor"""
+        response = self.client.get(SEARCH_URL)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(SEARCH_URL, query_string="q=%21%21")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(SEARCH_URL, query_string="q=tool&cursor=eyJpZCI6MX0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_no_valid_products(self):
+        """It should not Bulk create Products when every row is bad"""
+        response = self.client.post(BULK_URL, json=[{"name": "only a name"}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        data = response.get_json()
+        self.assertEqual(data["created"], 0)
+        self.assertEqual(data["ids"], [None])
+        self.assertEqual(data["errors"][0]["index"], 0)
+
+    def test_bulk_create_not_a_list(self):
+        """It should not Bulk create Products from a single object"""
+        response = self.client.post(BULK_URL, json=ProductFactory().to_dict())
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_change_products_bad_request(self):
+        """It should not Bulk update or delete Products without a filter or valid rows"""
+        response = self.client.delete(BULK_URL)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(BULK_URL, json={"price": 1.0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(BULK_URL, query_string="all=true", json={"available": "no"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(BULK_URL, json={"id": 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        data = ProductFactory().to_dict()
+        del data["id"]
+        response = self.client.put(BULK_URL, json=[data])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.get_json()["errors"][0]["index"], 0)
+
+    def test_patch_product_bad_request(self):
+        """It should not Patch a missing Product or with bad fields"""
+        response = self.client.patch(f"{BASE_URL}/0", json={"price": 1.0})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        test_product = self._create_products(1)[0]
+        response = self.client.patch(f"{BASE_URL}/{test_product.id}", json={"available": "yes"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(f"{BASE_URL}/{test_product.id}", json={})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(f"{BASE_URL}/{test_product.id}", json={"price": None})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bad_request_without_testing(self):
+        """It should return 400 for bad requests when exceptions do not propagate"""
+        test_product = self._create_products(1)[0]
+        app.config["TESTING"] = False
+        try:
+            requests = [
+                self.client.get(BASE_URL, query_string="cursor=zzz"),
+                self.client.get(BASE_URL, query_string="fields=secret"),
+                self.client.patch(f"{BASE_URL}/{test_product.id}", json={"price": None}),
+                self.client.post(BATCH_GET_URL, json=[1, 2]),
+                self.client.get(SEARCH_URL, query_string="q=%25%25"),
+                self.client.get(AGGREGATES_URL, query_string="group_by=price"),
+                self.client.delete(BULK_URL),
+            ]
+        finally:
+            app.config["TESTING"] = True
+        for response in requests:
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            data = response.get_json()
+            self.assertEqual(data["status"], status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(data["error"], "Bad Request")
+            self.assertIn("message", data)
+
+    def test_aggregate_products_bad_dimension(self):
+        """It should not Aggregate the Products by an unknown dimension"""
+        response = self.client.get(AGGREGATES_URL, query_string="group_by=category,price")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_read_product_bad_id(self):
+        """It should not Read a Product with an id that is not a number"""
+        response = self.client.get(f"{BASE_URL}/abc")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_update_missing_product(self):
         """It should not update a Product that doesn't exist"""
         resp = self.client.put(
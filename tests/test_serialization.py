@@ -0,0 +1,65 @@
+"""
+Test cases for the compiled Product serializer
+"""
+import json
+from unittest import TestCase
+from unittest.mock import patch
+from flask_restx import marshal
+from service.routes import product_model, serialize_product
+from service.models import Product
+from service.common import serialization
+from tests.factories import ProductFactory
+
+
+class TestModelSerializer(TestCase):
+    """Test Cases for the compiled serializer"""
+
+    def test_matches_marshal(self):
+        """It should serialize exactly like marshal() does"""
+        for product in ProductFactory.create_batch(10):
+            data = product.serialize()
+            self.assertEqual(serialize_product(data), marshal(data, product_model))
+
+    def test_missing_values(self):
+        """It should serialize missing values as None"""
+        data = {"name": "Eco Tool", "price": 10}
+        self.assertEqual(serialize_product(data), marshal(data, product_model))
+
+    def test_serialize_row(self):
+        """It should serialize a row like the Product itself"""
+        product = ProductFactory()
+        row = tuple(getattr(product, name) for name in Product.SERIALIZED_FIELDS)
+        self.assertEqual(Product.serialize_row(row), product.serialize())
+        row = (product.id, product.category)
+        self.assertEqual(
+            Product.serialize_row(row, ("id", "category")),
+            {"id": product.id, "category": product.category.name},
+        )
+
+    def test_only_some_fields(self):
+        """It should serialize only some of the fields"""
+        data = ProductFactory().serialize()
+        serializer = serialize_product.only(["price", "id"])
+        self.assertEqual(serializer(data), {"price": data["price"], "id": str(data["id"])})
+        self.assertIs(serialize_product.only(("id", "price")), serializer)
+
+
+class TestJsonResponse(TestCase):
+    """Test Cases for the JSON encoding"""
+
+    def test_dumps(self):
+        """It should encode JSON with or without orjson"""
+        data = {"id": 1, "price": 9.99, "available": True, "description": None}
+        self.assertEqual(json.loads(serialization.dumps(data)), data)
+        with patch.object(serialization, "orjson", None):
+            self.assertEqual(serialization.dumps(data), b'{"id":1,"price":9.99,"available":true,"description":null}')
+
+    def test_json_response(self):
+        """It should create a JSON response"""
+        response = serialization.json_response([1, 2], 201, {"X-Test": "yes"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertEqual(response.headers["X-Test"], "yes")
+        self.assertEqual(json.loads(response.data), [1, 2])
+        response = serialization.json_response(None, 304)
+        self.assertEqual(response.data, b"")